@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 from django.contrib import messages
@@ -46,10 +47,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'movies.querybudget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'movies.profiler.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +84,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLite chỉ cho một transaction ghi tại một thời điểm. Transaction đọc rồi mới ghi (đặt vé,
+        # thanh toán, quét đơn hết hạn...) mở bằng BEGIN IMMEDIATE qua movies.transactions.write_atomic
+        # và chờ khóa ghi tối đa `timeout` giây thay vì báo "database is locked". Không đặt
+        # transaction_mode ở đây: IMMEDIATE cho mọi transaction thì cả khối chỉ đọc (trang Admin...)
+        # cũng phải xếp hàng sau các lượt đặt vé.
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
@@ -119,7 +130,6 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-import os
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
@@ -153,4 +163,79 @@ MESSAGE_TAGS = {
 USE_THOUSAND_SEPARATOR = True
 THOUSAND_SEPARATOR = '.'
 DECIMAL_SEPARATOR = ','
-NUMBER_GROUPING = 3
\ No newline at end of file
+NUMBER_GROUPING = 3
+# Thời gian giữ ghế cho đơn chưa thanh toán (phút)
+SEAT_HOLD_MINUTES = 15
+
+# Cache phải là cache bộ nhớ dùng chung cho mọi tiến trình (các worker WSGI/ASGI, process_images,
+# send_emails...): thế hệ cache trang chủ và gợi ý tìm kiếm, bộ đếm trúng/trượt, bitmap ghế, bảng
+# giá đều nằm ở đây và được đọc/ghi ở mỗi request, cần incr nguyên tử và không chạm đĩa.
+# Chạy thật bắt buộc đặt REDIS_URL (cần gói redis) hoặc MEMCACHED_LOCATION (cần gói pymemcache);
+# `manage.py check --deploy` báo lỗi nếu thiếu. Không đặt thì dùng LocMemCache: riêng từng tiến
+# trình, chỉ hợp với máy dev chạy một tiến trình. Bộ test luôn dùng LocMemCache (TEST_RUNNER).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+elif os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+
+TEST_RUNNER = 'cinema_project.test_runner.TestRunner'
+
+# Ngân sách khởi động worker: thời gian nạp WSGI/ASGI + urls và bộ nhớ (lệnh check_startup)
+STARTUP_BUDGET = {
+    'IMPORT_SECONDS': 0.75,
+    'RSS_MB': 80,
+}
+
+# Đếm truy vấn theo request (movies.querybudget): cảnh báo khi một truy vấn lặp lại từ
+# DUPLICATE_THRESHOLD lần, trả header X-Query-* cho tài khoản staff
+QUERY_BUDGET = {
+    'DUPLICATE_THRESHOLD': 3,
+    'STAFF_HEADERS': True,
+}
+
+# Đo hiệu năng request cho staff (?_profile=1), giữ KEEP bản gần nhất.
+# Mặc định lưu ở thư mục tạm của hệ thống, đặt 'DIR' để lưu nơi khác.
+PROFILER = {
+    'KEEP': 20,
+}
+
+# Sơ đồ ghế trực tiếp qua SSE (movies.live, cần chạy ASGI). BROKER phải có publish/subscribe như
+# movies.live.InMemoryBroker; RESYNC_SECONDS: chu kỳ đối chiếu occupancy_version với DB.
+LIVE_SEATS = {
+    'BROKER': 'movies.live.InMemoryBroker',
+    'RESYNC_SECONDS': 5,
+    'HEARTBEAT_SECONDS': 15,
+}
+
+# Soát vé (movies.checkin): token của từng máy quét lấy từ biến môi trường
+# CHECKIN_SCANNERS="cong-1:token1,cong-2:token2". EARLY_MINUTES: cho vào trước giờ chiếu bao lâu.
+CHECKIN = {
+    'SCANNERS': dict(item.split(':', 1) for item in os.environ.get('CHECKIN_SCANNERS', '').split(',') if ':' in item),
+    'EARLY_MINUTES': 60,
+    'MAX_BATCH': 500,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'movies.queries': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -1,9 +1,14 @@
+from datetime import timedelta
+
+from django import forms
 from django.contrib import admin
 from django.contrib import messages
+from django.utils import timezone
+from . import scheduling, services
 from .models import (
     Genre, Movie, Cinema, Screen, Seat,
     Showtime, TicketPrice, Booking, Ticket,
-    SeatReservation, Review, Concession, BookingConcession
+    SeatReservation, Review, Concession, BookingConcession, ImageJob, OutboxEmail
 )
 
 
@@ -86,7 +91,55 @@ class SeatAdmin(admin.ModelAdmin):
     search_fields = ['row', 'number']
 
 
-admin.site.register(Showtime)
+class ShowtimeForm(forms.ModelForm):
+    class Meta:
+        model = Showtime
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['end_time'].required = False
+        self.fields['end_time'].help_text = "Để trống: tự tính theo thời lượng phim"
+
+    def clean(self):
+        cleaned = super().clean()
+        movie, screen, start = cleaned.get('movie'), cleaned.get('screen'), cleaned.get('start_time')
+        if not (movie and screen and start):
+            return cleaned
+        end = cleaned.get('end_time') or start + timedelta(minutes=movie.duration)
+        if end <= start:
+            self.add_error('end_time', "Giờ kết thúc phải sau giờ chiếu")
+            return cleaned
+        cleaned['end_time'] = end
+        # Không cho hai suất đang hoạt động chồng lấn trong cùng phòng (tính cả thời gian dọn phòng)
+        if cleaned.get('is_active', True):
+            other = scheduling.overlapping(screen.pk, start, end, exclude=self.instance.pk) \
+                .select_related('movie').first()
+            if other:
+                raise forms.ValidationError(
+                    f"Trùng lịch với suất {other.movie.title} "
+                    f"{timezone.localtime(other.start_time):%d/%m %H:%M}-{timezone.localtime(other.end_time):%H:%M} "
+                    f"(cần {scheduling.CLEANING_MINUTES} phút dọn phòng giữa hai suất)"
+                )
+        return cleaned
+
+
+class TicketPriceInline(admin.TabularInline):
+    model = TicketPrice
+    extra = 0
+
+
+# Xếp lịch cả tuần hàng loạt: manage.py schedule_showtimes <kế hoạch.json>
+@admin.register(Showtime)
+class ShowtimeAdmin(admin.ModelAdmin):
+    form = ShowtimeForm
+    list_display = ('movie', 'screen', 'start_time', 'end_time', 'base_price', 'is_active')
+    list_filter = ('is_active', 'screen__cinema')
+    list_select_related = ('movie', 'screen__cinema')
+    date_hierarchy = 'start_time'
+    inlines = [TicketPriceInline]
+
+
 admin.site.register(TicketPrice)
 admin.site.register(Ticket)
 admin.site.register(SeatReservation)
@@ -103,13 +156,64 @@ class BookingConcessionInline(admin.TabularInline):
     model = BookingConcession
     extra = 0
 
+# Đổi trạng thái đơn trong Admin đi qua services như lúc khách thanh toán/hủy (giữ/trả ghế,
+# bộ đếm ghế, doanh thu, bitmap). Đơn đã hủy/hết hạn không mở lại được: ghế có thể đã bán cho người khác.
+BOOKING_STATUS_CHANGES = {
+    ('PENDING', 'PAID'): services.pay_booking,
+    ('PENDING', 'CANCELLED'): services.cancel_booking,
+    ('PENDING', 'EXPIRED'): services.expire_booking,
+    ('PAID', 'CANCELLED'): services.cancel_booking,
+}
+
+
+class BookingForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        old_status = self.instance.status if self.instance.pk else None
+        if old_status is None or status == old_status:
+            return status
+        if (old_status, status) not in BOOKING_STATUS_CHANGES:
+            raise forms.ValidationError(
+                f"Không thể chuyển đơn từ {self.instance.get_status_display()} sang trạng thái này"
+            )
+        if status == 'PAID' and self.instance.expires_at <= timezone.now():
+            raise forms.ValidationError("Đơn đã hết thời gian giữ ghế, không thể xác nhận thanh toán")
+        return status
+
+
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
+    form = BookingForm
     list_display = ('booking_code', 'user', 'showtime', 'total_amount', 'status', 'created_at')
     list_filter = ('status', 'showtime__movie')
     search_fields = ('booking_code', 'user__username')
     inlines = [BookingConcessionInline] # Thêm dòng này để xem combo trong đơn hàng
 
+    def get_readonly_fields(self, request, obj=None):
+        # Suất chiếu và hạn giữ ghế gắn với các lượt giữ chỗ đã tạo, không sửa tay
+        if obj is not None:
+            return ('showtime', 'expires_at', 'paid_at')
+        return ()
+
+    def save_model(self, request, obj, form, change):
+        new_status = obj.status
+        if change and 'status' in form.changed_data:
+            # Lưu các trường khác với trạng thái cũ, rồi đổi trạng thái qua services
+            obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        if obj.status == new_status:
+            return
+        try:
+            booking = BOOKING_STATUS_CHANGES[(obj.status, new_status)](obj)
+        except forms.ValidationError as exc:
+            self.message_user(request, exc.messages[0], level=messages.ERROR)
+            booking = Booking.objects.get(pk=obj.pk)
+        obj.status, obj.paid_at = booking.status, booking.paid_at
+
 
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
@@ -118,4 +222,20 @@ class MovieAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'genres')
 
     # THÊM DÒNG NÀY ĐỂ TỰ ĐỘNG SLUG
-    prepopulated_fields = {'slug': ('title',)}
\ No newline at end of file
+    prepopulated_fields = {'slug': ('title',)}
+
+
+# Việc tạo ảnh thu nhỏ đang chờ/lỗi (worker: manage.py process_images)
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'attempts', 'run_after', 'last_error')
+    list_filter = ('model', 'field')
+
+
+# Email chờ gửi/gửi lỗi (worker: manage.py send_emails)
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('booking', 'kind', 'status', 'attempts', 'run_after', 'sent_at')
+    list_filter = ('status', 'kind')
+    list_select_related = ('booking__user',)
+    raw_id_fields = ('booking',)
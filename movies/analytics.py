@@ -0,0 +1,105 @@
+import calendar
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import RevenueRollup
+from . import forecast, rollups
+
+# Số liệu cho trang thống kê doanh thu (admin_statistics).
+# Module này kéo theo numpy (qua forecast) nên chỉ được import khi trang thống kê được mở.
+
+
+def _int_param(params, name, low, high):
+    # Tham số số nguyên trong [low, high]; thiếu hoặc không hợp lệ (vd ?day=31 của tháng 2) -> None
+    try:
+        value = int(params.get(name, ''))
+    except ValueError:
+        return None
+    return value if low <= value <= high else None
+
+
+def dashboard_context(params):
+    # 1. Lọc dữ liệu (Filter). Tham số sai thì bỏ qua, xem kỳ mặc định thay vì lỗi 500
+    current_date = timezone.now()
+    year = _int_param(params, 'year', 1900, 9998) or current_date.year
+    quarter = _int_param(params, 'quarter', 1, 4)
+    month = _int_param(params, 'month', 1, 12)
+    day = _int_param(params, 'day', 1, calendar.monthrange(year, month)[1]) if month else None
+
+    # Đọc từ bảng doanh thu tổng hợp sẵn (RevenueRollup) thay vì quét toàn bộ Booking
+    # Mặc định: cả năm, gom nhóm theo Tháng
+    start, end = rollups.period_range(year)
+    granularity = 'MONTH'
+    chart_title = f"Biểu đồ doanh thu năm {year}"
+    time_format = "%m/%Y"
+
+    if quarter:
+        first_month = (quarter - 1) * 3 + 1
+        start = rollups.period_range(year, first_month)[0]
+        end = rollups.period_range(year, first_month + 2)[1]
+        chart_title = f"Biểu đồ doanh thu Quý {quarter}/{year}"
+        # Quý thì vẫn xem theo tháng
+
+    if month:
+        start, end = rollups.period_range(year, month)
+        chart_title = f"Biểu đồ doanh thu Tháng {month}/{year}"
+        granularity = 'DAY'  # Nếu chọn tháng -> Xem theo Ngày
+        time_format = "%d/%m"
+
+        if day:
+            start, end = rollups.period_range(year, month, day)
+            chart_title = f"Biểu đồ doanh thu Ngày {day}/{month}/{year}"
+            granularity = 'HOUR'  # Nếu chọn ngày -> Xem theo Giờ
+            time_format = "%H:00"
+
+    rows = RevenueRollup.objects.filter(granularity=granularity, period__gte=start, period__lt=end)
+
+    # 2. Xử lý dữ liệu cho Biểu đồ Đường (Line Chart)
+    revenue_over_time = rows.values('period').annotate(total=Sum('revenue')).order_by('period')
+
+    chart_labels = []
+    chart_data = []
+
+    for item in revenue_over_time:
+        chart_labels.append(timezone.localtime(item['period']).strftime(time_format))
+        chart_data.append(float(item['total']))
+
+    # 3. Thống kê tổng quan (Top Cards)
+    totals = rows.aggregate(revenue=Sum('revenue'), tickets=Sum('tickets'))
+    total_revenue = totals['revenue'] or 0
+    total_tickets = totals['tickets'] or 0
+
+    # 4. Thống kê Top Phim (Để hiển thị bảng chi tiết bên dưới)
+    movie_stats = rows.values('movie__title').annotate(
+        revenue=Sum('revenue'),
+        ticket_count=Sum('tickets')
+    ).order_by('-revenue')
+
+    # 5. DỰ ĐOÁN DOANH THU THÁNG TỚI & TĂNG TRƯỞNG (AI)
+    # Mô hình chỉ được tính lại khi sang tháng mới (hoặc lệnh compute_forecast), ở đây đọc từ cache;
+    # doanh thu tháng hiện tại luôn là số mới nhất
+    revenue_forecast = forecast.get_forecast()
+
+    # Danh sách năm cho dropdown
+    available_years = RevenueRollup.objects.filter(granularity='MONTH').dates('period', 'year', order='DESC')
+    years_list = [y.year for y in available_years] if available_years else [current_date.year]
+
+    return {
+        'chart_labels': chart_labels,  # Nhãn thời gian (Trục X)
+        'chart_data': chart_data,  # Doanh thu (Trục Y)
+        'chart_title': chart_title,
+
+        'predicted_revenue': revenue_forecast.predicted_revenue,
+        'growth_percent': round(revenue_forecast.growth_percent, 1),
+        'current_month_revenue': revenue_forecast.current_revenue,
+
+        'movie_stats': movie_stats,
+        'total_revenue': total_revenue,
+        'total_tickets': total_tickets,
+        'years_list': years_list,
+        'selected_year': year,
+        'selected_month': month or '',
+        'selected_quarter': quarter or '',
+        'selected_day': day or '',
+    }
@@ -0,0 +1,133 @@
+import hashlib
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .models import Movie
+from . import search
+
+# Cache phần danh sách phim (2 tab Đang chiếu / Sắp chiếu) của trang chủ.
+#
+# Chỉ cache đoạn HTML danh sách phim, phần header (tên người dùng, menu staff, thông báo)
+# vẫn render theo từng request nên khách vãng lai và người đã đăng nhập dùng chung một bản.
+# Khóa cache gồm: thế hệ (tăng khi Movie/Genre/Showtime thay đổi), ngày địa phương
+# (qua nửa đêm phim "sắp chiếu" có thể thành "đang chiếu") và từ khóa tìm kiếm đã gập dấu.
+# Thế hệ và HTML nằm trong cache dùng chung (CACHES trong settings) để thay đổi từ worker ảnh
+# hay Admin ở tiến trình khác cũng làm mới trang chủ của mọi worker web.
+
+GENERATION_KEY = 'catalog_generation'
+HITS_KEY = 'catalog_hits'
+MISSES_KEY = 'catalog_misses'
+TEMPLATE = 'movies/movie_catalog.html'
+
+
+def _generation():
+    return cache.get(GENERATION_KEY, 0)
+
+
+def _seconds_until_midnight(now):
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+async def _acount(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 0, None)
+        await cache.aincr(key)
+
+
+def _key(generation, today, query):
+    digest = hashlib.md5(' '.join(search.tokenize(query)).encode()).hexdigest()
+    return f'catalog:{generation}:{today.isoformat()}:{digest}'
+
+
+def cache_key(today, query):
+    return _key(_generation(), today, query)
+
+
+def build_context(today, query):
+    base_movies = Movie.objects.filter(is_active=True)
+    if query:
+        # Nếu đang tìm kiếm thì tìm chung cả 2 loại (chỉ mục tìm kiếm không phân biệt dấu, xếp theo độ phù hợp)
+        found = search.search_movies(base_movies, query)
+        movies_now = [movie for movie in found if movie.release_date <= today]
+        movies_upcoming = [movie for movie in found if movie.release_date > today]
+    else:
+        # Phim đang chiếu: Ngày chiếu <= Hôm nay
+        movies_now = base_movies.filter(release_date__lte=today).order_by('-release_date')
+        # Phim sắp chiếu: Ngày chiếu > Hôm nay
+        movies_upcoming = base_movies.filter(release_date__gt=today).order_by('release_date')
+    return {'movies_now': movies_now, 'movies_upcoming': movies_upcoming, 'query': query}
+
+
+def _render(today, query):
+    return render_to_string(TEMPLATE, build_context(today, query))
+
+
+def render_catalog(query=''):
+    now = timezone.localtime()
+    today = now.date()
+    key = cache_key(today, query or '')
+    html = cache.get(key)
+    if html is not None:
+        _count(HITS_KEY)
+        return mark_safe(html)
+    _count(MISSES_KEY)
+    html = _render(today, query)
+    # Hết hạn lúc nửa đêm, ngày mới sẽ dùng khóa mới
+    cache.set(key, html, _seconds_until_midnight(now))
+    return html
+
+
+async def arender_catalog(query=''):
+    # Bản cho view async: trúng cache thì chỉ đọc cache; trượt thì truy vấn + render
+    # trong một lần sync_to_async (thay vì nhiều lần chuyển luồng cho từng truy vấn)
+    now = timezone.localtime()
+    today = now.date()
+    key = _key(await cache.aget(GENERATION_KEY, 0), today, query or '')
+    html = await cache.aget(key)
+    if html is not None:
+        await _acount(HITS_KEY)
+        return mark_safe(html)
+    await _acount(MISSES_KEY)
+    html = await sync_to_async(_render)(today, query)
+    await cache.aset(key, html, _seconds_until_midnight(now))
+    return html
+
+
+def invalidate():
+    # Đổi thế hệ, các bản cache cũ không còn được đọc và tự hết hạn
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'generation': _generation(),
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
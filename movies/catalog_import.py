@@ -0,0 +1,297 @@
+import csv
+import json
+import time
+from datetime import date
+
+from django.db import connection, transaction
+
+from .models import Genre, Movie
+from . import catalog, images, search, slugs, suggest
+from .transactions import write_atomic
+
+# Nhập danh mục phim hàng loạt (feed của nhà phát hành: CSV, JSON hoặc JSON Lines).
+#
+# - Đọc dạng luồng, xử lý theo lô BATCH_SIZE dòng, mỗi lô một transaction với số truy vấn
+#   cố định: tìm phim đã có, slug đã dùng (một truy vấn cho cả lô), thể loại, thêm/sửa phim
+#   bằng bulk_create/bulk_update, nối thể loại bằng bulk_create trên bảng trung gian.
+# - Chạy lại cùng một feed không tạo phim mới: phim được nhận ra theo cột slug nếu feed có,
+#   nếu không thì theo (tên phim, ngày khởi chiếu); phim không đổi thì không bị ghi lại.
+# - Slug của feed là khóa nhận diện nên luôn được ưu tiên: lô sau mang slug mà một lô trước của
+#   cùng lần nhập đã tự sinh cho phim khác (dòng không có slug) thì phim kia được cấp slug khác,
+#   dòng của feed tạo phim mới với đúng slug đó (auto_slugs theo dõi slug tự sinh cả lần nhập).
+# - bulk_* không phát tín hiệu post_save/m2m_changed nên chỉ mục tìm kiếm được ghi trực tiếp
+#   theo lô, việc tạo ảnh thu nhỏ cho poster được xếp hàng theo lô, còn gợi ý tìm kiếm và
+#   cache trang chủ được làm mới một lần ở cuối.
+
+BATCH_SIZE = 1000
+
+FIELDS = ['title', 'description', 'director', 'cast', 'duration', 'release_date', 'end_date',
+          'country', 'language', 'rating', 'poster', 'trailer_url', 'is_active']
+RATINGS = {code for code, _ in Movie.RATING_CHOICES}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x', 'có'}
+
+
+class RowError(ValueError):
+    pass
+
+
+# --- Đọc feed ---
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def read_json_lines(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json_array(stream, chunk_size=1 << 16):
+    # Đọc từng phần tử của mảng JSON mà không nạp cả file vào bộ nhớ
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer, started = buffer[1:], True
+                continue
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+        elif buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield item
+                continue
+        if eof:
+            if started:
+                raise ValueError('Mảng JSON không có dấu đóng "]"')
+            raise ValueError('File JSON phải là một mảng các phim')
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {'csv': read_csv, 'json': read_json_array, 'jsonl': read_json_lines}
+
+
+def detect_format(path):
+    extension = path.rsplit('.', 1)[-1].lower()
+    return {'ndjson': 'jsonl'}.get(extension, extension)
+
+
+# --- Chuẩn hóa một dòng ---
+
+def _names(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        separator = '|' if '|' in value else ','
+        value = value.split(separator)
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+def _date(value, field, required=False):
+    if value in (None, ''):
+        if required:
+            raise RowError(f'thiếu {field}')
+        return None
+    try:
+        return value if isinstance(value, date) else date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError(f'{field} không hợp lệ: {value!r}')
+
+
+def clean_row(raw):
+    # dict của feed -> (khóa nhận diện, giá trị các cột Movie, tên thể loại hoặc None nếu feed không có)
+    title = str(raw.get('title') or '').strip()
+    if not title:
+        raise RowError('thiếu title')
+    try:
+        duration = int(raw.get('duration') or 0)
+    except (TypeError, ValueError):
+        raise RowError(f"duration không hợp lệ: {raw.get('duration')!r}")
+    rating = str(raw.get('rating') or 'P').strip().upper()
+    if rating not in RATINGS:
+        raise RowError(f'rating không hợp lệ: {rating!r}')
+    is_active = raw.get('is_active', True)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() in TRUE_VALUES
+
+    values = {
+        'title': title,
+        'description': str(raw.get('description') or ''),
+        'director': str(raw.get('director') or ''),
+        'cast': ', '.join(_names(raw.get('cast')) or []),
+        'duration': duration,
+        'release_date': _date(raw.get('release_date'), 'release_date', required=True),
+        'end_date': _date(raw.get('end_date'), 'end_date'),
+        'country': str(raw.get('country') or ''),
+        'language': str(raw.get('language') or ''),
+        'rating': rating,
+        'poster': str(raw.get('poster') or ''),
+        'trailer_url': str(raw.get('trailer_url') or ''),
+        'is_active': bool(is_active),
+    }
+    slug = str(raw.get('slug') or '').strip()
+    key = ('slug', slug) if slug else ('title', title, values['release_date'])
+    return key, values, _names(raw.get('genres'))
+
+
+# --- Ghi một lô ---
+
+def _genre_ids(names):
+    names = set(names)
+    if not names:
+        return {}
+    existing = dict(Genre.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = names - existing.keys()
+    if missing:
+        Genre.objects.bulk_create([Genre(name=name) for name in missing], ignore_conflicts=True)
+        existing.update(Genre.objects.filter(name__in=missing).values_list('name', 'id'))
+    return existing
+
+
+def _existing_movies(keys):
+    slug_keys = [key[1] for key in keys if key[0] == 'slug']
+    title_keys = [key[1] for key in keys if key[0] == 'title']
+    found = {}
+    movies = Movie.objects.filter(slug__in=slug_keys) | Movie.objects.filter(title__in=title_keys)
+    for movie in movies.order_by('id'):
+        found.setdefault(('slug', movie.slug), movie)
+        found.setdefault(('title', movie.title, movie.release_date), movie)
+    return found
+
+
+def import_batch(rows, auto_slugs=None):
+    # rows: [(khóa, giá trị, thể loại)] đã chuẩn hóa. Trả về (số phim tạo mới, số phim cập nhật)
+    # auto_slugs: {slug: id phim} các slug tự sinh từ đầu lần nhập, được cập nhật sau lô này
+    auto_slugs = {} if auto_slugs is None else auto_slugs
+    rows = list({key: (key, values, genres) for key, values, genres in rows}.values())
+    Through = Movie.genres.through
+    with write_atomic():
+        existing = _existing_movies([key for key, _, _ in rows])
+        genre_ids = _genre_ids(name for _, _, genres in rows for name in genres or ())
+
+        new, changed, displaced = [], [], []
+        entries = []  # (phim, tập id thể loại theo feed hoặc None nếu feed không có cột thể loại, phim mới?)
+        for key, values, genres in rows:
+            movie = existing.get(key)
+            if movie is not None and key[0] == 'slug' and auto_slugs.get(key[1]) == movie.id:
+                # Slug này do lô trước tự sinh cho phim khác: nhường lại cho phim của feed
+                displaced.append(movie)
+                movie = None
+            is_new = movie is None
+            if is_new:
+                movie = Movie(**values)
+                if key[0] == 'slug':
+                    movie.slug = key[1]
+                new.append(movie)
+            elif any(getattr(movie, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(movie, field, value)
+                changed.append(movie)
+            wanted = None if genres is None else {genre_ids[name] for name in genres}
+            entries.append((movie, wanted, is_new))
+
+        # Slug cho phim mới và phim phải nhường slug: một truy vấn cho cả lô
+        for movie in displaced:
+            del auto_slugs[movie.slug]
+        needs_slug = [movie for movie in new if not movie.slug] + displaced
+        max_length = Movie._meta.get_field('slug').max_length
+        bases = [slugs.base_slug(movie.title, max_length) for movie in needs_slug]
+        taken = slugs.taken_suffixes(Movie.objects.all(), bases)
+        assigned = {movie.slug for movie in new if movie.slug}
+        for movie, base in zip(needs_slug, bases):
+            movie.slug = slugs.assign(base, taken[base], assigned)
+
+        if displaced:
+            Movie.objects.bulk_update(displaced, ['slug'], batch_size=BATCH_SIZE)
+        Movie.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        auto_slugs.update((movie.slug, movie.id) for movie in needs_slug)
+        if changed:
+            Movie.objects.bulk_update(changed, FIELDS, batch_size=BATCH_SIZE)
+
+        # Poster mới hoặc đổi: xếp việc tạo ảnh thu nhỏ cho worker
+        images.enqueue([(Movie, movie.id, 'poster') for movie in new + changed if images.is_stale(movie, 'poster')])
+
+        # Thể loại: chỉ ghi lại cho phim có danh sách thể loại khác với feed
+        current = {}
+        old_ids = [movie.id for movie, wanted, is_new in entries if not is_new]
+        for movie_id, genre_id in Through.objects.filter(movie_id__in=old_ids).values_list('movie_id', 'genre_id'):
+            current.setdefault(movie_id, set()).add(genre_id)
+        relink = [(movie, wanted, is_new) for movie, wanted, is_new in entries
+                  if wanted is not None and current.get(movie.id, set()) != wanted]
+        relinked_old = [movie.id for movie, _, is_new in relink if not is_new]
+        if relinked_old:
+            Through.objects.filter(movie_id__in=relinked_old).delete()
+        Through.objects.bulk_create([
+            Through(movie_id=movie.id, genre_id=genre_id)
+            for movie, wanted, _ in relink for genre_id in wanted
+        ], batch_size=BATCH_SIZE)
+
+        # Chỉ mục tìm kiếm của các phim vừa thêm/sửa, ghi thẳng từ dữ liệu trong tay
+        touched = {movie.id: movie for movie in new + changed + [movie for movie, _, _ in relink]}
+        if touched and search.is_enabled():
+            genre_names = {genre_id: name for name, genre_id in genre_ids.items()}
+            untouched_genres = [movie.id for movie, wanted, _ in entries if wanted is None and movie.id in touched]
+            names_of = {movie.id: [genre_names[g] for g in wanted] for movie, wanted, _ in entries
+                        if wanted is not None}
+            # Phim mà feed không ghi thể loại: giữ thể loại đang có trong DB
+            for movie_id, name in Through.objects.filter(movie_id__in=untouched_genres) \
+                    .values_list('movie_id', 'genre__name'):
+                names_of.setdefault(movie_id, []).append(name)
+            with connection.cursor() as cursor:
+                search.remove_movies(list(touched), cursor)
+                search.write_rows(cursor, [
+                    search.build_row(movie.id, movie.title, movie.director, movie.cast,
+                                     names_of.get(movie.id, []), movie.is_active)
+                    for movie in touched.values()
+                ])
+    return len(new), len(touched) - len(new)
+
+
+def import_catalog(records, batch_size=BATCH_SIZE, progress=None):
+    # records: các dict của feed (đọc dạng luồng). progress(stats) được gọi sau mỗi lô.
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'errors': [], 'seconds': 0.0}
+    started = time.perf_counter()
+    batch = []
+    auto_slugs = {}
+
+    def flush():
+        created, updated = import_batch(batch, auto_slugs)
+        stats['created'] += created
+        stats['updated'] += updated
+        stats['seconds'] = time.perf_counter() - started
+        batch.clear()
+        if progress:
+            progress(stats)
+
+    for line, raw in enumerate(records, start=1):
+        stats['rows'] += 1
+        try:
+            batch.append(clean_row(raw))
+        except RowError as exc:
+            stats['errors'].append((line, str(exc)))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    stats['seconds'] = time.perf_counter() - started
+
+    if stats['created'] or stats['updated']:
+        transaction.on_commit(suggest.invalidate)
+        transaction.on_commit(catalog.invalidate)
+    return stats
@@ -0,0 +1,188 @@
+import hmac
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Ticket
+
+# Soát vé ở cửa phòng chiếu (máy quét gửi mã đặt vé).
+#
+# - Một truy vấn đọc vé + ghế + đơn + suất chiếu cho mọi mã trong request (booking_code
+#   có chỉ mục unique), kiểm tra trong Python.
+# - Đánh dấu đã dùng bằng MỘT câu UPDATE có điều kiện "is_used = false" cho mọi vé hợp lệ.
+#   Nếu số dòng cập nhật ít hơn dự kiến (máy quét khác vừa cho vào cùng vé) thì hủy và làm
+#   lại từng mã trong savepoint riêng: mỗi mã hoặc vào đủ ghế hoặc không ghế nào.
+# - Máy quét mất mạng gửi lại cả lô sau; used_at lấy theo thời điểm quét (scanned_at) và
+#   khung giờ vào cửa cũng xét theo thời điểm đó.
+# - Máy quét xác thực bằng token (header Authorization: Bearer ...) trong CHECKIN['SCANNERS'],
+#   không đọc session nên không tốn truy vấn.
+
+OK = 'ok'
+ALREADY_USED = 'already_used'
+NOT_FOUND = 'not_found'
+NOT_PAID = 'not_paid'
+TOO_EARLY = 'too_early'
+ENDED = 'ended'
+INVALID = 'invalid'
+
+
+class InvalidScan(ValueError):
+    pass
+
+
+def _config():
+    config = {'SCANNERS': {}, 'EARLY_MINUTES': 60, 'MAX_BATCH': 500, 'CLOCK_SKEW_SECONDS': 300}
+    config.update(getattr(settings, 'CHECKIN', {}))
+    return config
+
+
+def scanner_for(request):
+    # Tên máy quét ứng với token trong request, None nếu không hợp lệ
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    found = None
+    for name, expected in _config()['SCANNERS'].items():
+        # So hết các token với thời gian không đổi
+        if hmac.compare_digest(token.encode(), expected.encode()):
+            found = name
+    return found
+
+
+def parse_scan(raw, now):
+    # {'code', 'seats'?: [id ghế], 'scanned_at'?: ISO 8601} -> {'code', 'seats': set|None, 'at'}
+    if not isinstance(raw, dict):
+        raise InvalidScan('Mỗi lượt quét phải là một object')
+    code = raw.get('code')
+    if not isinstance(code, str) or not code.strip():
+        raise InvalidScan('Thiếu mã đặt vé')
+    seats = raw.get('seats')
+    if seats is not None:
+        if not isinstance(seats, list) or not seats or not all(isinstance(s, int) for s in seats):
+            raise InvalidScan('seats phải là danh sách id ghế')
+        seats = set(seats)
+    at = now
+    if raw.get('scanned_at'):
+        at = parse_datetime(str(raw['scanned_at']))
+        if at is None or timezone.is_naive(at):
+            raise InvalidScan('scanned_at phải là thời điểm ISO 8601 có múi giờ')
+        if at > now + timedelta(seconds=_config()['CLOCK_SKEW_SECONDS']):
+            raise InvalidScan('scanned_at ở tương lai')
+    return {'code': code.strip().upper(), 'seats': seats, 'at': at}
+
+
+def _load(codes):
+    # {mã: {'status', 'start', 'end', 'movie', 'screen', 'tickets': [(id, id ghế, nhãn ghế, is_used, used_at)]}}
+    bookings = {}
+    rows = Ticket.objects.filter(booking__booking_code__in=codes).order_by('seat__row', 'seat__number').values_list(
+        'booking__booking_code', 'booking__status', 'booking__showtime__start_time', 'booking__showtime__end_time',
+        'booking__showtime__movie__title', 'booking__showtime__screen__name',
+        'id', 'seat_id', 'seat__row', 'seat__number', 'is_used', 'used_at',
+    )
+    for code, status, start, end, movie, screen, ticket_id, seat_id, row, number, is_used, used_at in rows:
+        booking = bookings.setdefault(code, {'status': status, 'start': start, 'end': end, 'movie': movie,
+                                             'screen': screen, 'tickets': []})
+        booking['tickets'].append((ticket_id, seat_id, f'{row}{number}', is_used, used_at))
+    return bookings
+
+
+def _plan(scan, booking, taken, early):
+    # -> (kết quả, [id vé sẽ đánh dấu])
+    result = {'code': scan['code'], 'status': OK, 'seats': []}
+    if booking is None:
+        result['status'] = NOT_FOUND
+        return result, []
+    result.update(movie=booking['movie'], screen=booking['screen'], start_time=booking['start'].isoformat())
+    if booking['status'] != 'PAID':
+        result['status'] = NOT_PAID
+        return result, []
+    if scan['at'] < booking['start'] - early:
+        result['status'] = TOO_EARLY
+        return result, []
+    if scan['at'] > booking['end']:
+        result['status'] = ENDED
+        return result, []
+
+    tickets = booking['tickets']
+    if scan['seats'] is not None:
+        if not scan['seats'] <= {seat_id for _, seat_id, _, _, _ in tickets}:
+            result['status'] = INVALID
+            result['error'] = 'Ghế không thuộc mã đặt vé này'
+            return result, []
+        tickets = [ticket for ticket in tickets if ticket[1] in scan['seats']]
+        used = [ticket for ticket in tickets if ticket[3] or ticket[0] in taken]
+    else:
+        # Không chọn ghế: cho vào mọi ghế chưa vào; hết ghế thì báo đã dùng
+        used = tickets if all(ticket[3] or ticket[0] in taken for ticket in tickets) else []
+        tickets = [ticket for ticket in tickets if not ticket[3] and ticket[0] not in taken]
+    if used:
+        result['status'] = ALREADY_USED
+        result['seats'] = [label for _, _, label, _, _ in used]
+        used_at = [used_at for _, _, _, is_used, used_at in used if is_used and used_at]
+        if used_at:
+            result['used_at'] = min(used_at).isoformat()
+        return result, []
+    result['seats'] = [label for _, _, label, _, _ in tickets]
+    return result, [ticket_id for ticket_id, _, _, _, _ in tickets]
+
+
+def _mark(plans):
+    # plans: [(kết quả, id vé, thời điểm quét)]. Một UPDATE; trả về False nếu có vé đã bị dùng
+    ids = [ticket_id for _, ticket_ids, _ in plans for ticket_id in ticket_ids]
+    times = {at for _, _, at in plans}
+    if len(times) == 1:
+        used_at = Value(times.pop())
+    else:
+        used_at = Case(*[When(id__in=ticket_ids, then=Value(at)) for _, ticket_ids, at in plans])
+    with transaction.atomic():
+        updated = Ticket.objects.filter(id__in=ids, is_used=False).update(is_used=True, used_at=used_at)
+        if updated != len(ids):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def check_in(scans):
+    # scans: kết quả của parse_scan. Trả về danh sách kết quả theo đúng thứ tự gửi lên
+    early = timedelta(minutes=_config()['EARLY_MINUTES'])
+    bookings = _load({scan['code'] for scan in scans})
+    results = []
+    plans = []
+    taken = set()  # Vé đã được cho vào bởi lượt quét trước trong cùng lô
+    for scan in scans:
+        result, ticket_ids = _plan(scan, bookings.get(scan['code']), taken, early)
+        results.append(result)
+        if ticket_ids:
+            taken.update(ticket_ids)
+            plans.append((result, ticket_ids, scan['at']))
+
+    if plans and not _mark(plans):
+        # Máy quét khác vừa cho vào một phần số vé: làm lại từng mã
+        for result, ticket_ids, at in plans:
+            if not _mark([(result, ticket_ids, at)]):
+                result['status'] = ALREADY_USED
+    return results
+
+
+def check_in_batch(raw_scans):
+    # Lô lượt quét thô từ máy quét; lượt sai định dạng được báo INVALID tại đúng vị trí của nó
+    limit = _config()['MAX_BATCH']
+    if not isinstance(raw_scans, list) or len(raw_scans) > limit:
+        raise InvalidScan(f'scans phải là danh sách tối đa {limit} lượt quét')
+    now = timezone.now()
+    results = [None] * len(raw_scans)
+    scans, positions = [], []
+    for i, raw in enumerate(raw_scans):
+        try:
+            scans.append(parse_scan(raw, now))
+            positions.append(i)
+        except InvalidScan as exc:
+            code = raw.get('code') if isinstance(raw, dict) else None
+            results[i] = {'code': code, 'status': INVALID, 'error': str(exc)}
+    for i, result in zip(positions, check_in(scans)):
+        results[i] = result
+    return results
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Thế hệ cache trang chủ/gợi ý, bộ đếm trúng/trượt, bitmap ghế và bảng giá cần cache bộ nhớ dùng
+# chung: LocMemCache/DummyCache riêng từng tiến trình (thay đổi ở worker ảnh, Admin... không tới
+# các worker web khác), FileBasedCache đọc/ghi đĩa ở mỗi request và incr không nguyên tử
+UNSUITABLE_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in UNSUITABLE_CACHES:
+        return [Error(
+            f'Cache mặc định ({backend}) không phải cache bộ nhớ dùng chung giữa các tiến trình.',
+            hint='Đặt REDIS_URL hoặc MEMCACHED_LOCATION (xem CACHES trong settings).',
+            id='movies.E001',
+        )]
+    return []
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Seat, SeatReservation, Showtime, Ticket
+
+# Bộ đếm ghế trên Showtime: capacity (số ghế của phòng), seats_held (ghế của đơn PENDING),
+# seats_sold (vé của đơn PAID). Dùng để hiện "Còn 12 ghế"/"Hết vé" mà không phải đếm vé.
+#
+# Đặt vé, thanh toán, hủy và hết hạn cộng/trừ bằng F expression trong cùng transaction
+# với thay đổi trạng thái đơn, chung một UPDATE với occupancy_version ở cuối transaction.
+# Ghế của lượt giữ đã quá hạn vẫn tính là "đang giữ" cho tới khi đơn được chuyển EXPIRED
+# (lệnh expire_holds). Lệnh reconcile_showtime_counters tính lại toàn bộ.
+
+
+# Trạng thái đơn -> bộ đếm mà ghế của đơn được tính vào
+COUNTER_FOR_STATUS = {'PENDING': 'seats_held', 'PAID': 'seats_sold'}
+
+
+def move(showtime_id, seats, old_status, new_status, **extra):
+    # Chuyển `seats` ghế của một đơn từ trạng thái cũ sang mới (old_status=None: đơn mới tạo)
+    old_field = COUNTER_FOR_STATUS.get(old_status)
+    new_field = COUNTER_FOR_STATUS.get(new_status)
+    changes = dict(extra)
+    if seats and old_field != new_field:
+        if old_field:
+            changes[old_field] = F(old_field) - seats
+        if new_field:
+            changes[new_field] = F(new_field) + seats
+    if changes:
+        Showtime.objects.filter(pk=showtime_id).update(**changes)
+
+
+def reconcile(batch_size=1000):
+    # Tính lại bộ đếm của mọi suất chiếu từ Seat/SeatReservation/Ticket, trả về số suất bị lệch
+    capacity = dict(Seat.objects.order_by().values('screen_id').annotate(n=Count('id')).values_list('screen_id', 'n'))
+    held = dict(SeatReservation.objects.filter(is_active=True, booking__status='PENDING').order_by()
+                .values('showtime_id').annotate(n=Count('id')).values_list('showtime_id', 'n'))
+    sold = dict(Ticket.objects.filter(booking__status='PAID').order_by()
+                .values('booking__showtime_id').annotate(n=Count('id')).values_list('booking__showtime_id', 'n'))
+
+    fixed = []
+    showtimes = Showtime.objects.only('id', 'screen_id', 'capacity', 'seats_held', 'seats_sold').order_by('id')
+    for showtime in showtimes.iterator(chunk_size=batch_size):
+        expected = (capacity.get(showtime.screen_id, 0), held.get(showtime.id, 0), sold.get(showtime.id, 0))
+        if (showtime.capacity, showtime.seats_held, showtime.seats_sold) != expected:
+            showtime.capacity, showtime.seats_held, showtime.seats_sold = expected
+            fixed.append(showtime)
+    with transaction.atomic():
+        Showtime.objects.bulk_update(fixed, ['capacity', 'seats_held', 'seats_sold'], batch_size=batch_size)
+    return len(fixed)
@@ -0,0 +1,106 @@
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import RevenueForecast, RevenueRollup
+from . import rollups
+
+# Dự báo doanh thu tháng tới bằng hồi quy tuyến tính trên doanh thu từng tháng.
+# Mô hình chỉ học trên các tháng đã kết thúc nên không đổi trong suốt tháng hiện tại: chỉ tính
+# lại khi sang kỳ dữ liệu mới (tháng mới) hoặc khi chạy lệnh compute_forecast, kết quả được lưu
+# vào RevenueForecast và cache lại cho trang thống kê. Doanh thu tháng hiện tại (và % tăng trưởng)
+# thì luôn đọc mới từ dòng MONTH của RevenueRollup, vì record_booking cập nhật nó liên tục.
+
+CACHE_KEY = 'revenue_forecast'
+CACHE_TIMEOUT = 60 * 60
+
+
+def current_period():
+    return rollups.bucket_starts(timezone.now())['MONTH']
+
+
+def month_index(dt):
+    local = timezone.localtime(dt)
+    return local.year * 12 + local.month - 1
+
+
+def fit_line(values, xs=None):
+    # Bình phương tối thiểu dạng đóng: y = intercept + slope * x với x = xs (mặc định 0..n-1)
+    y = np.asarray(values, dtype=float)
+    x = np.arange(len(y), dtype=float) if xs is None else np.asarray(xs, dtype=float)
+    if len(y) < 2:
+        return 0.0, float(y[0]) if len(y) else 0.0, None
+    dx = x - x.mean()
+    dy = y - y.mean()
+    slope = (dx @ dy) / (dx @ dx)
+    intercept = y.mean() - slope * x.mean()
+    ss_tot = dy @ dy
+    residuals = y - (intercept + slope * x)
+    r2 = 1 - (residuals @ residuals) / ss_tot if ss_tot else 1.0
+    return float(slope), float(intercept), float(r2)
+
+
+def current_revenue(period=None):
+    period = period or current_period()
+    return RevenueRollup.objects.filter(granularity='MONTH', period=period).aggregate(
+        revenue=Sum('revenue')
+    )['revenue'] or 0
+
+
+def growth_percent(predicted, current):
+    # % Tăng trưởng: (Dự đoán - Hiện tại) / Hiện tại * 100
+    if current > 0:
+        return float((predicted - current) / current * 100)
+    return 100 if predicted > 0 else 0
+
+
+def compute_forecast(period=None):
+    period = period or current_period()
+    # Chỉ các tháng đã kết thúc: tháng hiện tại còn dở dang sẽ kéo đường hồi quy xuống
+    history = list(RevenueRollup.objects.filter(granularity='MONTH', period__lt=period).values('period').annotate(
+        revenue=Sum('revenue')
+    ).values_list('period', 'revenue').order_by('period'))
+
+    values = {'points': len(history), 'window_start': None, 'window_end': None, 'slope': 0, 'intercept': 0,
+              'r2': None, 'predicted_revenue': 0}
+    if history:
+        months, revenues = zip(*history)
+        # x = số tháng tính từ tháng đầu tiên, tháng không có doanh thu vẫn giữ đúng khoảng cách
+        first = month_index(months[0])
+        slope, intercept, r2 = fit_line(revenues, [month_index(month) - first for month in months])
+        # Dự đoán tháng tiếp theo (sau tháng hiện tại)
+        prediction = intercept + slope * (month_index(period) + 1 - first)
+        values.update(window_start=months[0], window_end=months[-1], slope=slope, intercept=intercept, r2=r2,
+                      predicted_revenue=max(0, round(prediction)))  # Không lấy số âm
+
+    values['current_revenue'] = current_revenue(period)
+    values['growth_percent'] = growth_percent(values['predicted_revenue'], values['current_revenue'])
+    values['computed_at'] = timezone.now()
+    # Mỗi kỳ một dòng (period unique). Ghi bằng một câu upsert: hai request cùng tính lúc sang
+    # tháng mới thì ghi đè lên nhau thay vì thêm dòng thứ hai
+    forecast = RevenueForecast(period=period, **values)
+    RevenueForecast.objects.bulk_create([forecast], update_conflicts=True, unique_fields=['period'],
+                                        update_fields=list(values))
+    cache.set(CACHE_KEY, forecast, CACHE_TIMEOUT)
+    return forecast
+
+
+def _with_live_revenue(forecast):
+    # Mô hình lấy từ cache/DB, doanh thu tháng hiện tại thì đọc lại (một truy vấn)
+    forecast.current_revenue = current_revenue(forecast.period)
+    forecast.growth_percent = growth_percent(forecast.predicted_revenue, forecast.current_revenue)
+    return forecast
+
+
+def get_forecast(refresh=False):
+    period = current_period()
+    if not refresh:
+        forecast = cache.get(CACHE_KEY)
+        if forecast is not None and forecast.period == period:
+            return _with_live_revenue(forecast)
+        forecast = RevenueForecast.objects.filter(period=period).first()
+        if forecast is not None:
+            cache.set(CACHE_KEY, forecast, CACHE_TIMEOUT)
+            return _with_live_revenue(forecast)
+    return compute_forecast(period)
@@ -0,0 +1,117 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
+
+from .models import Booking, Ticket
+from . import images
+
+# Lịch sử vé của người dùng dạng "feed" phân trang theo khóa (keyset).
+#
+# Thứ tự: suất sắp chiếu trước (gần nhất trước), sau đó suất đã chiếu (mới nhất trước).
+# Con trỏ trang sau ghi lại mốc "bây giờ" của trang đầu + vị trí (start_time, id) của dòng cuối,
+# nên một suất vừa chiếu xong giữa 2 lần cuộn không bị lặp hay mất.
+# Mỗi trang tốn cố định: tối đa 2 truy vấn đơn (mỗi phần một truy vấn) + 1 truy vấn vé/ghế.
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+UPCOMING = 'u'
+PAST = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(split, segment, start_time, booking_id):
+    raw = f'{split.isoformat()}|{segment}|{start_time.isoformat()}|{booking_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        split, segment, start_time, booking_id = raw.split('|')
+        if segment not in (UPCOMING, PAST):
+            raise ValueError(segment)
+        split, start_time = datetime.fromisoformat(split), datetime.fromisoformat(start_time)
+        if timezone.is_naive(split) or timezone.is_naive(start_time):
+            raise ValueError(raw)
+        return split, segment, start_time, int(booking_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _bookings(user):
+    return Booking.objects.filter(user=user).select_related(
+        'showtime__movie', 'showtime__screen__cinema'
+    ).order_by()
+
+
+def _upcoming(user, split, after=None):
+    qs = _bookings(user).filter(showtime__start_time__gte=split)
+    if after:
+        start_time, booking_id = after
+        qs = qs.filter(Q(showtime__start_time__gt=start_time) |
+                       Q(showtime__start_time=start_time, id__gt=booking_id))
+    return qs.order_by('showtime__start_time', 'id')
+
+
+def _past(user, split, before=None):
+    qs = _bookings(user).filter(showtime__start_time__lt=split)
+    if before:
+        start_time, booking_id = before
+        qs = qs.filter(Q(showtime__start_time__lt=start_time) |
+                       Q(showtime__start_time=start_time, id__lt=booking_id))
+    return qs.order_by('-showtime__start_time', '-id')
+
+
+def ticket_page(user, cursor=None, limit=PAGE_SIZE):
+    # Trả về (danh sách đơn của trang, con trỏ trang sau hoặc None)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        split, segment, start_time, booking_id = decode_cursor(cursor)
+        position = (start_time, booking_id)
+    else:
+        split, segment, position = timezone.now(), UPCOMING, None
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    bookings = []
+    if segment == UPCOMING:
+        bookings = list(_upcoming(user, split, position)[:limit + 1])
+        if len(bookings) <= limit:
+            # Hết suất sắp chiếu trong trang này, nối tiếp bằng suất đã chiếu
+            segment, position = PAST, None
+    if segment == PAST:
+        bookings += list(_past(user, split, position)[:limit + 1 - len(bookings)])
+
+    has_more = len(bookings) > limit
+    bookings = bookings[:limit]
+    # Vé + ghế của cả trang trong một truy vấn
+    prefetch_related_objects(bookings, Prefetch('tickets', queryset=Ticket.objects.select_related('seat')))
+
+    next_cursor = None
+    if has_more:
+        last = bookings[-1]
+        last_segment = UPCOMING if last.showtime.start_time >= split else PAST
+        next_cursor = encode_cursor(split, last_segment, last.showtime.start_time, last.id)
+    return bookings, next_cursor
+
+
+def serialize(booking):
+    showtime = booking.showtime
+    movie = showtime.movie
+    return {
+        'id': booking.id,
+        'booking_code': booking.booking_code,
+        'status': booking.status,
+        'status_display': booking.get_status_display(),
+        'total_amount': str(booking.total_amount),
+        'movie': {'id': movie.id, 'title': movie.title, 'poster': images.variant_url(movie.poster, 'thumb')},
+        'cinema': showtime.screen.cinema.name,
+        'screen': showtime.screen.name,
+        'start_time': showtime.start_time.isoformat(),
+        'seats': [f'{ticket.seat.row}{ticket.seat.number}' for ticket in booking.tickets.all()],
+    }
@@ -0,0 +1,115 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Booking, SeatReservation, Showtime
+from . import counters, live, occupancy
+from .transactions import write_atomic
+
+# Giữ ghế có thời hạn (TTL) cho đơn PENDING.
+#
+# - Mỗi ghế của đơn PENDING có một SeatReservation với expires_at = hạn thanh toán.
+# - Đọc tình trạng ghế bỏ qua các lượt giữ đã quá hạn (giải phóng "lười").
+# - Khi có người giữ đúng ghế đang bị một lượt quá hạn chiếm, đơn cũ bị chuyển EXPIRED ngay.
+# - Lệnh expire_holds quét định kỳ theo chỉ mục (status, expires_at) và chuyển EXPIRED
+#   hàng loạt theo từng lô.
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def hold_ttl():
+    return timedelta(minutes=getattr(settings, 'SEAT_HOLD_MINUTES', 15))
+
+
+class SeatsUnavailable(Exception):
+    def __init__(self, seat_ids):
+        self.seat_ids = set(seat_ids)
+        super().__init__(seat_ids)
+
+
+def place_holds(booking, seats):
+    # Giữ chỗ từng ghế cho đơn PENDING. Báo SeatsUnavailable nếu ghế đang bị giữ.
+    release_expired_for_seats(booking.showtime_id, [seat.id for seat in seats])
+    reservations = [
+        SeatReservation(showtime_id=booking.showtime_id, seat=seat, booking=booking,
+                        user_id=booking.user_id, expires_at=booking.expires_at)
+        for seat in seats
+    ]
+    try:
+        with transaction.atomic():
+            SeatReservation.objects.bulk_create(reservations)
+    except IntegrityError:
+        taken = SeatReservation.objects.filter(
+            showtime_id=booking.showtime_id, seat__in=seats, is_active=True
+        ).values_list('seat_id', flat=True)
+        raise SeatsUnavailable(taken)
+
+
+def confirm_holds(booking):
+    # Đơn đã thanh toán: ghế được giữ vĩnh viễn
+    SeatReservation.objects.filter(booking=booking, is_active=True).update(expires_at=None)
+
+
+def release_holds(booking):
+    return SeatReservation.objects.filter(booking=booking, is_active=True).update(is_active=False)
+
+
+def release_expired_for_seats(showtime_id, seat_ids, now=None):
+    now = now or timezone.now()
+    booking_ids = list(SeatReservation.objects.filter(
+        showtime_id=showtime_id, seat_id__in=seat_ids, is_active=True, expires_at__lte=now
+    ).values_list('booking_id', flat=True).distinct())
+    if booking_ids:
+        expire_bookings(booking_ids, now)
+
+
+def expire_bookings(booking_ids, now=None):
+    # Chuyển các đơn PENDING đã quá hạn sang EXPIRED và trả ghế. Trả về số đơn đã chuyển.
+    now = now or timezone.now()
+    with write_atomic():
+        booking_ids = list(Booking.objects.select_for_update(skip_locked=True).filter(
+            id__in=booking_ids, status='PENDING', expires_at__lte=now
+        ).values_list('id', flat=True))
+        if not booking_ids:
+            return 0
+        return _expire_locked(booking_ids)
+
+
+def expire_stale_holds(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    # Quét một lô đơn PENDING quá hạn theo chỉ mục (status, expires_at)
+    now = now or timezone.now()
+    with write_atomic():
+        booking_ids = list(Booking.objects.select_for_update(skip_locked=True).filter(
+            status='PENDING', expires_at__lte=now
+        ).order_by('status', 'expires_at').values_list('id', flat=True)[:batch_size])
+        if not booking_ids:
+            return 0
+        return _expire_locked(booking_ids)
+
+
+def _expire_locked(booking_ids):
+    count = Booking.objects.filter(id__in=booking_ids).update(status='EXPIRED')
+
+    released = defaultdict(list)
+    holds = SeatReservation.objects.filter(booking_id__in=booking_ids, is_active=True)
+    for showtime_id, seat_id in holds.values_list('showtime_id', 'seat_id'):
+        released[showtime_id].append(seat_id)
+    holds.update(is_active=False)
+
+    if released:
+        for showtime_id, seat_ids in released.items():
+            counters.move(showtime_id, len(seat_ids), 'PENDING', 'EXPIRED',
+                          occupancy_version=F('occupancy_version') + 1)
+        transaction.on_commit(lambda: _apply_released(released))
+    return count
+
+
+def _apply_released(released):
+    showtimes = Showtime.objects.filter(id__in=released).values_list('id', 'screen_id', 'occupancy_version')
+    for showtime_id, screen_id, version in showtimes:
+        occupancy.apply_change(showtime_id, screen_id, released[showtime_id], False, version)
+        live.publish(showtime_id, version, live.RELEASED, released[showtime_id])
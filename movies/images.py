@@ -0,0 +1,249 @@
+import io
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import ImageJob, Movie
+from . import catalog, suggest
+from .transactions import write_atomic
+
+# Ảnh thu nhỏ cho poster phim và ảnh combo.
+#
+# - Lưu Movie/Concession có ảnh mới => thêm một ImageJob trong cùng transaction, request
+#   của Admin không phải chờ resize. Worker "manage.py process_images --loop" lấy từng lô việc
+#   (khóa lô bằng cách dời run_after thêm LEASE_SECONDS như outbox.claim, hai worker không
+#   làm trùng; worker chết giữa chừng thì việc chạy lại khi hết hạn khóa), tạo các cỡ trong VARIANTS ở mọi định dạng trình duyệt hỗ trợ (AVIF, WebP, JPEG dự phòng)
+#   và ghi danh sách file vào cột <trường>_variants của chính bản ghi.
+# - Danh sách đó có ghi tên ảnh gốc: đổi ảnh mà worker chưa chạy thì bản cũ tự bị bỏ qua
+#   và trang dùng ảnh gốc. Khi render chỉ đọc cột này (đã có sẵn trong bản ghi), không
+#   truy vấn thêm và không hỏi hệ thống file ảnh có tồn tại hay không.
+# - backfill_images --force không xóa manifest mà chỉ đánh dấu cũ (source None): worker tạo lại
+#   rồi xóa các file cũ không còn dùng như khi đổi ảnh.
+# - Lỗi (ảnh hỏng, thiếu file) được thử lại với thời gian chờ tăng dần, tối đa MAX_ATTEMPTS lần.
+
+# Cỡ ảnh (rộng, cao) theo "app_label.model.trường"; cao None = giữ tỉ lệ ảnh gốc.
+# Ảnh gốc nhỏ hơn thì không phóng to.
+VARIANTS = {
+    'movies.movie.poster': {'thumb': (160, 240), 'card': (400, 600), 'hero': (1280, None)},
+    'movies.concession.image': {'thumb': (120, 120)},
+}
+# (đuôi file, định dạng Pillow, MIME, tham số lưu), theo thứ tự ưu tiên trong <picture>.
+# JPEG luôn có để làm <img src> và ảnh nền CSS.
+FORMATS = [
+    ('avif', 'AVIF', 'image/avif', {'quality': 55}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+FALLBACK_FORMAT = 'jpg'
+MIME_TYPES = {ext: mime for ext, _, mime, _ in FORMATS}
+
+DEFAULT_BATCH_SIZE = 20
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 600
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt[0] == FALLBACK_FORMAT or features.check(fmt[0])]
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def manifest_field(field_name):
+    return f'{field_name}_variants'
+
+
+# --- Đọc (khi render) ---
+
+def variants_of(fieldfile):
+    # {tên cỡ: {'width', 'height', 'files': {đuôi: đường dẫn}}} của đúng ảnh đang gắn, {} nếu chưa có
+    if not fieldfile:
+        return {}
+    manifest = getattr(fieldfile.instance, manifest_field(fieldfile.field.name), None) or {}
+    if manifest.get('source') != fieldfile.name:
+        return {}
+    return manifest.get('variants', {})
+
+
+def variant_url(fieldfile, name, ext=FALLBACK_FORMAT):
+    # URL một cỡ ảnh, hoặc ảnh gốc nếu chưa tạo xong ('' nếu không có ảnh)
+    if not fieldfile:
+        return ''
+    path = variants_of(fieldfile).get(name, {}).get('files', {}).get(ext)
+    return fieldfile.storage.url(path) if path else fieldfile.url
+
+
+def url_from_values(model, field_name, name, source, manifest):
+    # Như variant_url nhưng từ giá trị cột (khi truy vấn bằng values_list)
+    if not source:
+        return ''
+    storage = model._meta.get_field(field_name).storage
+    if manifest and manifest.get('source') == source:
+        path = manifest.get('variants', {}).get(name, {}).get('files', {}).get(FALLBACK_FORMAT)
+        if path:
+            return storage.url(path)
+    return storage.url(source)
+
+
+# --- Xếp việc ---
+
+def is_stale(instance, field_name):
+    source = getattr(instance, field_name).name
+    manifest = getattr(instance, manifest_field(field_name)) or {}
+    return bool(source) and manifest.get('source') != source
+
+
+def enqueue(jobs):
+    # jobs: [(model, object_id, tên trường)]. Việc đã có (kể cả đang lỗi) được cho chạy lại ngay.
+    if not jobs:
+        return
+    now = timezone.now()
+    ImageJob.objects.bulk_create(
+        [ImageJob(model=_label(model), object_id=object_id, field=field_name, run_after=now)
+         for model, object_id, field_name in jobs],
+        update_conflicts=True,
+        unique_fields=['model', 'object_id', 'field'],
+        update_fields=['attempts', 'last_error', 'run_after'],
+    )
+
+
+def enqueue_if_stale(instance, field_name):
+    if is_stale(instance, field_name):
+        enqueue([(type(instance), instance.pk, field_name)])
+
+
+# --- Tạo ảnh ---
+
+def _resize(image, width, height):
+    if height is None:
+        if image.width <= width:
+            return image.copy()
+        return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    # Cắt giữa theo đúng tỉ lệ rồi thu nhỏ, không phóng to ảnh nhỏ
+    scale = min(1, image.width / width, image.height / height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def _encode(image, pil_format, options):
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG không có kênh trong suốt: lót nền trắng
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if image.mode == 'RGBA' else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(fieldfile, sizes):
+    # Đọc ảnh gốc một lần, trả về {tên cỡ: (rộng, cao, {đuôi: bytes})}
+    with fieldfile.storage.open(fieldfile.name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    rendered = {}
+    for name, (width, height) in sizes.items():
+        resized = _resize(image, width, height)
+        rendered[name] = (resized.width, resized.height, {
+            ext: _encode(resized, pil_format, options) for ext, pil_format, _, options in available_formats()
+        })
+    return rendered
+
+
+def _variant_path(source, name, ext):
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{name}.{ext}')
+
+
+def generate(instance, field_name):
+    # Tạo file các cỡ ảnh và trả về manifest (chưa ghi vào DB)
+    fieldfile = getattr(instance, field_name)
+    storage = fieldfile.storage
+    sizes = VARIANTS[f'{_label(type(instance))}.{field_name}']
+    variants = {}
+    for name, (width, height, files) in render_variants(fieldfile, sizes).items():
+        paths = {}
+        for ext, content in files.items():
+            path = _variant_path(fieldfile.name, name, ext)
+            if storage.exists(path):
+                storage.delete(path)
+            paths[ext] = storage.save(path, ContentFile(content))
+        variants[name] = {'width': width, 'height': height, 'files': paths}
+    return {'source': fieldfile.name, 'variants': variants}
+
+
+def _old_files(old_manifest, new_manifest):
+    keep = {path for variant in new_manifest['variants'].values() for path in variant['files'].values()}
+    return [path for variant in (old_manifest or {}).get('variants', {}).values()
+            for path in variant.get('files', {}).values() if path not in keep]
+
+
+def process_job(job):
+    # True nếu bản ghi có manifest mới
+    model = apps.get_model(job.model)
+    instance = model.objects.filter(pk=job.object_id).first()
+    if instance is None or not is_stale(instance, job.field):
+        return False
+    fieldfile = getattr(instance, job.field)
+    manifest = generate(instance, job.field)
+    old_manifest = getattr(instance, manifest_field(job.field))
+    # Chỉ ghi nếu ảnh chưa bị đổi tiếp trong lúc đang resize. update() để không kéo theo
+    # tín hiệu post_save (đánh lại chỉ mục tìm kiếm...).
+    updated = model.objects.filter(pk=instance.pk, **{job.field: fieldfile.name}) \
+        .update(**{manifest_field(job.field): manifest})
+    if updated:
+        for path in _old_files(old_manifest, manifest):
+            fieldfile.storage.delete(path)
+    return bool(updated)
+
+
+def claim(batch_size):
+    now = timezone.now()
+    lease = now + timedelta(seconds=LEASE_SECONDS)
+    with write_atomic():
+        jobs = list(ImageJob.objects.select_for_update(skip_locked=True)
+                    .filter(run_after__lte=now, attempts__lt=MAX_ATTEMPTS).order_by('run_after', 'id')[:batch_size])
+        if jobs:
+            ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(run_after=lease)
+    for job in jobs:
+        job.run_after = lease
+    return jobs
+
+
+def process_jobs(batch_size=DEFAULT_BATCH_SIZE):
+    # Xử lý một lô việc đến hạn. Trả về (số việc xong, số việc lỗi)
+    jobs = claim(batch_size)
+    done = failed = 0
+    changed_models = set()
+    for job in jobs:
+        try:
+            if process_job(job):
+                changed_models.add(job.model)
+        except Exception as exc:  # Ảnh hỏng/thiếu file/lỗi storage: thử lại sau
+            failed += 1
+            attempts = job.attempts + 1
+            ImageJob.objects.filter(pk=job.pk, run_after=job.run_after).update(
+                attempts=attempts,
+                last_error=f'{type(exc).__name__}: {exc}'[:1000],
+                run_after=timezone.now() + timedelta(minutes=2 ** attempts),
+            )
+            continue
+        done += 1
+        # run_after khác hạn khóa nghĩa là ảnh vừa được đổi lần nữa: giữ việc để chạy lại
+        ImageJob.objects.filter(pk=job.pk, run_after=job.run_after).delete()
+
+    if _label(Movie) in changed_models:
+        # Trang chủ (HTML đã cache) và gợi ý tìm kiếm có URL poster
+        transaction.on_commit(catalog.invalidate)
+        transaction.on_commit(suggest.invalidate)
+    return done, failed
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import SeatReservation, Showtime
+
+# Cập nhật sơ đồ ghế trực tiếp (Server-Sent Events) cho trang showtime_detail, chạy trên ASGI.
+#
+# - Đặt vé / thanh toán / hủy / hết hạn phát một sự kiện {version, state, seats} qua broker
+#   sau khi commit (state: held = đang giữ, sold = đã bán, released = trả ghế).
+# - Trong mỗi tiến trình, mỗi suất chiếu có đúng một SeatFeed: đăng ký broker một lần, giữ
+#   trạng thái ghế hiện tại và chia sự kiện cho mọi người đang xem (hàng đợi asyncio riêng),
+#   nên 5.000 người xem một suất công chiếu không ai phải truy vấn DB.
+# - SeatFeed kiểm tra occupancy_version mỗi RESYNC_SECONDS (một truy vấn cho cả suất chiếu):
+#   nếu DB đã đi trước (đặt vé ở tiến trình khác, sửa trong Admin, lỡ sự kiện) thì đọc lại
+#   trạng thái ghế và phát phần chênh lệch.
+# - Sự kiện held mang kèm expires_at (timestamp). Lượt giữ quá hạn không đổi occupancy_version
+#   cho tới khi expire_holds quét tới, nên SeatFeed tự hẹn giờ theo hạn sớm nhất và phát
+#   released cho ghế hết hạn (expire_holds quét sau đó chỉ phát lại released, không sao).
+# - Broker mặc định là InMemoryBroker (trong tiến trình, dùng cho test và chạy một tiến trình);
+#   có thể thay bằng broker khác có cùng giao diện publish/subscribe qua LIVE_SEATS['BROKER'].
+
+HELD, SOLD, RELEASED = 'held', 'sold', 'released'
+
+# Hàng đợi của một người xem đầy (mạng chậm) => bỏ các sự kiện cũ, gửi lại toàn bộ trạng thái
+WATCHER_QUEUE_SIZE = 256
+_RESET = object()
+
+
+def _config():
+    return {
+        'BROKER': 'movies.live.InMemoryBroker',
+        'RESYNC_SECONDS': 5,
+        'HEARTBEAT_SECONDS': 15,
+        **getattr(settings, 'LIVE_SEATS', {}),
+    }
+
+
+class InMemoryBroker:
+    # Pub/sub trong tiến trình. publish() gọi được từ code đồng bộ ở bất kỳ luồng nào.
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, showtime_id, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(showtime_id, ()))
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, showtime_id, callback):
+        # Trả về hàm hủy đăng ký
+        with self._lock:
+            self._subscribers[showtime_id].add(callback)
+
+        def unsubscribe():
+            with self._lock:
+                subscribers = self._subscribers.get(showtime_id)
+                if subscribers is not None:
+                    subscribers.discard(callback)
+                    if not subscribers:
+                        del self._subscribers[showtime_id]
+        return unsubscribe
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(_config()['BROKER'])()
+    return _broker
+
+
+def publish(showtime_id, version, state, seat_ids, expires_at=None):
+    # Gọi sau khi commit (on_commit), version là occupancy_version mới của suất chiếu
+    seat_ids = list(seat_ids)
+    if seat_ids:
+        message = {'version': version, 'state': state, 'seats': seat_ids}
+        if state == HELD and expires_at is not None:
+            message['expires_at'] = expires_at.timestamp()
+        get_broker().publish(showtime_id, message)
+
+
+def seat_states_from_db(showtime_id):
+    # (occupancy_version, {seat_id: held/sold}, {seat_id: hạn giữ ghế}) đọc cùng lúc từ DB
+    version = Showtime.objects.filter(pk=showtime_id).values_list('occupancy_version', flat=True).first()
+    now = timezone.now()
+    holds = SeatReservation.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        showtime_id=showtime_id, is_active=True,
+    ).values_list('seat_id', 'expires_at')
+    states, expiries = {}, {}
+    for seat_id, expires_at in holds:
+        if expires_at is None:
+            states[seat_id] = SOLD
+        else:
+            states[seat_id] = HELD
+            expiries[seat_id] = expires_at.timestamp()
+    return version or 0, states, expiries
+
+
+def current_version(showtime_id):
+    return Showtime.objects.filter(pk=showtime_id).values_list('occupancy_version', flat=True).first() or 0
+
+
+class SeatFeed:
+    # Nguồn phát duy nhất cho một suất chiếu trong tiến trình (sống trên event loop của ASGI)
+    def __init__(self, showtime_id):
+        self.showtime_id = showtime_id
+        self.version = 0
+        self.states = {}
+        self.expiries = {}  # {seat_id: timestamp hết hạn} của ghế đang giữ
+        self.watchers = set()
+        self._loop = None
+        self._unsubscribe = None
+        self._resync_task = None
+        self._expiry_timer = None
+        self._resync_lock = asyncio.Lock()
+        self.ready = None  # Task start(), người xem đến cùng lúc chờ chung
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        # Đăng ký trước khi đọc DB để không lỡ sự kiện xảy ra trong lúc đọc
+        self._unsubscribe = get_broker().subscribe(self.showtime_id, self._on_message)
+        self.version, self.states, self.expiries = await sync_to_async(seat_states_from_db)(self.showtime_id)
+        self._schedule_expiry()
+        self._resync_task = asyncio.create_task(self._resync_loop())
+
+    def stop(self):
+        if self._unsubscribe:
+            self._unsubscribe()
+        if self._resync_task:
+            self._resync_task.cancel()
+        if self._expiry_timer:
+            self._expiry_timer.cancel()
+
+    def snapshot(self):
+        grouped = {HELD: [], SOLD: []}
+        for seat_id, state in self.states.items():
+            grouped[state].append(seat_id)
+        return {'version': self.version, **grouped}
+
+    def _on_message(self, message):
+        # Có thể được gọi từ luồng khác (on_commit của request đồng bộ)
+        self._loop.call_soon_threadsafe(self._apply, message)
+
+    def _apply(self, message):
+        version = message['version']
+        if version <= self.version:
+            return  # Đã có trong trạng thái hiện tại (đọc từ DB sau sự kiện này)
+        if version > self.version + 1:
+            # Lỡ sự kiện ở giữa: vẫn áp dụng, rồi đối chiếu lại với DB
+            asyncio.ensure_future(self.resync())
+        self.version = version
+        state = message['state']
+        expires_at = message.get('expires_at')
+        for seat_id in message['seats']:
+            if state == RELEASED:
+                self.states.pop(seat_id, None)
+            else:
+                self.states[seat_id] = state
+            if state == HELD and expires_at is not None:
+                self.expiries[seat_id] = expires_at
+            else:
+                self.expiries.pop(seat_id, None)
+        self._fan_out(message)
+        self._schedule_expiry()
+
+    def _schedule_expiry(self):
+        # Hẹn giờ theo lượt giữ ghế hết hạn sớm nhất
+        if self._expiry_timer:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+        if self.expiries:
+            delay = min(self.expiries.values()) - timezone.now().timestamp()
+            self._expiry_timer = self._loop.call_later(max(delay, 0), self.expire_lapsed_holds)
+
+    def expire_lapsed_holds(self):
+        # Trả các ghế đã hết hạn giữ (chưa có sự kiện vì expire_holds chưa quét tới)
+        now = timezone.now().timestamp()
+        lapsed = [seat_id for seat_id, expires_at in self.expiries.items() if expires_at <= now]
+        for seat_id in lapsed:
+            del self.expiries[seat_id]
+            self.states.pop(seat_id, None)
+        if lapsed:
+            self._fan_out({'version': self.version, 'state': RELEASED, 'seats': lapsed})
+        self._schedule_expiry()
+
+    def _fan_out(self, message):
+        for queue in self.watchers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_RESET)
+
+    async def resync(self):
+        async with self._resync_lock:
+            version, states, expiries = await sync_to_async(seat_states_from_db)(self.showtime_id)
+            if version < self.version:
+                return
+            changes = defaultdict(list)
+            for seat_id in self.states.keys() - states.keys():
+                changes[RELEASED].append(seat_id)
+            for seat_id, state in states.items():
+                if self.states.get(seat_id) != state:
+                    changes[state].append(seat_id)
+            self.version, self.states, self.expiries = version, states, expiries
+            for state, seat_ids in changes.items():
+                self._fan_out({'version': version, 'state': state, 'seats': seat_ids})
+            self._schedule_expiry()
+
+    async def _resync_loop(self):
+        interval = _config()['RESYNC_SECONDS']
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await sync_to_async(current_version)(self.showtime_id) > self.version:
+                    await self.resync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Lỗi DB tạm thời: thử lại ở vòng sau
+                continue
+
+
+_feeds = {}
+
+
+async def _join(showtime_id):
+    feed = _feeds.get(showtime_id)
+    if feed is None:
+        feed = _feeds[showtime_id] = SeatFeed(showtime_id)
+        feed.ready = asyncio.ensure_future(feed.start())
+    try:
+        await asyncio.shield(feed.ready)
+    except Exception:
+        # Không đọc được trạng thái ban đầu: bỏ feed để người xem sau thử lại
+        if _feeds.get(showtime_id) is feed:
+            del _feeds[showtime_id]
+            feed.stop()
+        raise
+    queue = asyncio.Queue(WATCHER_QUEUE_SIZE)
+    feed.watchers.add(queue)
+    return feed, queue
+
+
+def _leave(feed, queue):
+    feed.watchers.discard(queue)
+    if not feed.watchers and _feeds.get(feed.showtime_id) is feed:
+        del _feeds[feed.showtime_id]
+        feed.stop()
+
+
+def _event(name, payload):
+    return f'event: {name}\ndata: {json.dumps(payload, separators=(",", ":"))}\n\n'
+
+
+async def event_stream(showtime_id):
+    # Luồng SSE cho một người xem: snapshot ban đầu, sau đó là các thay đổi
+    heartbeat = _config()['HEARTBEAT_SECONDS']
+    feed, queue = await _join(showtime_id)
+    try:
+        yield _event('snapshot', feed.snapshot())
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            if message is _RESET:
+                yield _event('snapshot', feed.snapshot())
+            else:
+                yield _event('delta', message)
+    finally:
+        _leave(feed, queue)
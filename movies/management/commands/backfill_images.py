@@ -0,0 +1,47 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from movies import images
+from movies.models import Concession, Movie
+
+TARGETS = {'movie': (Movie, 'poster'), 'concession': (Concession, 'image')}
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Xếp việc tạo ảnh thu nhỏ cho poster/ảnh combo đã có (worker process_images sẽ xử lý)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(TARGETS), action='append',
+                            help='Chỉ xử lý model này (mặc định tất cả)')
+        parser.add_argument('--force', action='store_true',
+                            help='Tạo lại cả ảnh đã có bản thu nhỏ (trang dùng ảnh gốc tới khi tạo xong)')
+        parser.add_argument('--now', action='store_true', help='Xử lý luôn trong lệnh này thay vì chờ worker')
+
+    def handle(self, *args, **options):
+        for name in options['model'] or sorted(TARGETS):
+            model, field_name = TARGETS[name]
+            variants_field = images.manifest_field(field_name)
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if options['force']:
+                # Giữ danh sách file cũ để worker xóa sau khi tạo lại, chỉ đánh dấu là cũ
+                stale = [model(pk=object_id, **{variants_field: {**manifest, 'source': None}})
+                         for object_id, manifest in rows.values_list('id', variants_field) if manifest]
+                model.objects.bulk_update(stale, [variants_field], batch_size=CHUNK_SIZE)
+
+            queued = 0
+            batch = []
+            for object_id, source, manifest in rows.values_list('id', field_name, variants_field) \
+                    .order_by('id').iterator(chunk_size=CHUNK_SIZE):
+                if (manifest or {}).get('source') != source:
+                    batch.append((model, object_id, field_name))
+                if len(batch) >= CHUNK_SIZE:
+                    images.enqueue(batch)
+                    queued += len(batch)
+                    batch = []
+            images.enqueue(batch)
+            queued += len(batch)
+            self.stdout.write(f'{name}: xếp {queued} ảnh cần tạo bản thu nhỏ')
+
+        if options['now']:
+            call_command('process_images', stdout=self.stdout, stderr=self.stderr)
@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from movies.models import Movie, Cinema, Screen, Seat, Showtime
+from movies.services import create_booking
+from movies.transactions import write_atomic
+
+
+def book_with_showtime_lock(user, showtime_id, seat_ids):
+    # Cách cũ: khóa cả dòng Showtime trong suốt quá trình đặt vé
+    with write_atomic():
+        Showtime.objects.select_for_update().get(pk=showtime_id)
+        return create_booking(user, showtime_id, seat_ids)
+
+
+STRATEGIES = {
+    'showtime-lock': book_with_showtime_lock,
+    'seat': create_booking,
+}
+
+
+class Command(BaseCommand):
+    help = 'Đo số đơn đặt vé/giây khi nhiều luồng đặt ghế cùng một suất chiếu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--bookings-per-thread', type=int, default=10)
+        parser.add_argument('--seats-per-booking', type=int, default=2)
+        parser.add_argument('--mode', choices=['disjoint', 'overlap', 'both'], default='both')
+        parser.add_argument('--strategy', choices=['showtime-lock', 'seat', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        per_thread = options['bookings_per_thread']
+        per_booking = options['seats_per_booking']
+        modes = ['disjoint', 'overlap'] if options['mode'] == 'both' else [options['mode']]
+        strategies = list(STRATEGIES) if options['strategy'] == 'both' else [options['strategy']]
+
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite chỉ cho một transaction ghi tại một thời điểm: cả hai cách đều đặt vé lần lượt, '
+                'số liệu ở đây chủ yếu là thời gian chờ khóa. Đặt vé song song theo ghế cần PostgreSQL/MySQL.'
+            ))
+
+        seats_needed = threads * per_thread * per_booking
+        cinema, users = self._setup(seats_needed, threads)
+        try:
+            for mode in modes:
+                for strategy in strategies:
+                    showtime = self._new_showtime(cinema)
+                    result = self._run(STRATEGIES[strategy], showtime, users, mode, per_thread, per_booking)
+                    self.stdout.write(
+                        f"{mode:<9} {strategy:<14} "
+                        f"ok={result['ok']:<5} taken={result['taken']:<5} errors={result['errors']:<4} "
+                        f"{result['elapsed']:.2f}s  {result['ok'] / result['elapsed']:.1f} bookings/s"
+                    )
+        finally:
+            cinema.delete()
+            Movie.objects.filter(title__startswith='__bench__').delete()
+            User.objects.filter(username__startswith='__bench__').delete()
+
+    def _setup(self, seats_needed, threads):
+        tag = uuid.uuid4().hex[:8]
+        cinema = Cinema.objects.create(name=f'__bench__{tag}', address='-', city='-', district='-',
+                                       phone='-', email='bench@example.com')
+        per_row = 20
+        rows = (seats_needed + per_row - 1) // per_row
+        screen = Screen.objects.create(cinema=cinema, name='BENCH', total_seats=rows * per_row,
+                                       rows=rows, seats_per_row=per_row)
+        Seat.objects.bulk_create([
+            Seat(screen=screen, row=f'{r:02d}'[-2:], number=n)
+            for r in range(rows) for n in range(1, per_row + 1)
+        ])
+        self.movie = Movie.objects.create(
+            title=f'__bench__{tag}', description='-', director='-', cast='-', duration=120,
+            release_date=timezone.now().date(), country='-', language='-', rating='P', poster='bench.jpg'
+        )
+        self.screen = screen
+        users = [User.objects.create_user(username=f'__bench__{tag}_{i}') for i in range(threads)]
+        return cinema, users
+
+    def _new_showtime(self, cinema):
+        start = timezone.now() + timedelta(days=1)
+        return Showtime.objects.create(movie=self.movie, screen=self.screen, start_time=start,
+                                       end_time=start + timedelta(hours=2), base_price=60000)
+
+    def _run(self, book, showtime, users, mode, per_thread, per_booking):
+        seat_ids = list(Seat.objects.filter(screen=self.screen).order_by('id').values_list('id', flat=True))
+        counters = {'ok': 0, 'taken': 0, 'errors': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(users))
+
+        def worker(index, user):
+            if mode == 'disjoint':
+                # Mỗi luồng một dải ghế riêng
+                start = index * per_thread * per_booking
+                mine = seat_ids[start:start + per_thread * per_booking]
+                batches = [mine[i:i + per_booking] for i in range(0, len(mine), per_booking)]
+            else:
+                # Mọi luồng tranh nhau một nhóm ghế nhỏ
+                hot = seat_ids[:max(per_booking * 4, len(users))]
+                batches = [random.sample(hot, per_booking) for _ in range(per_thread)]
+            barrier.wait()
+            try:
+                for batch in batches:
+                    try:
+                        book(user, showtime.id, batch)
+                        key = 'ok'
+                    except ValidationError:
+                        key = 'taken'
+                    except Exception:
+                        key = 'errors'
+                    with lock:
+                        counters[key] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i, u)) for i, u in enumerate(users)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        counters['elapsed'] = time.perf_counter() - started
+        return counters
@@ -0,0 +1,187 @@
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from movies.models import Booking, Cinema, Movie, Screen, Seat, Showtime, Ticket
+
+# Giả lập giờ cao điểm soát vé: --scanners máy quét song song, mỗi máy gửi lần lượt các mã của
+# mình (một phần mã được quét lại để thử chặn vào hai lần). Dữ liệu: --screens phòng, mỗi phòng
+# một suất sắp chiếu đầy khách. Mặc định gọi view ngay trong tiến trình (qua đủ middleware,
+# không qua mạng); --url để đo server đang chạy (cần --token có trong CHECKIN['SCANNERS'] của server).
+# --batch > 1: mỗi request gửi một lô lượt quét như máy quét vừa có mạng lại.
+
+SEATS_PER_ROW = 15
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class InProcessScanner:
+    def __init__(self, token):
+        self.client = Client(HTTP_HOST='localhost')
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def post(self, path, body):
+        response = self.client.post(path, body, content_type='application/json', headers=self.headers)
+        return response.status_code, json.loads(response.content)
+
+    def close(self):
+        connection.close()
+
+
+class HttpScanner:
+    def __init__(self, base_url, token):
+        parts = urlsplit(base_url)
+        self.prefix = parts.path.rstrip('/')
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+    def post(self, path, body):
+        self.conn.request('POST', self.prefix + path, json.dumps(body), self.headers)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read())
+
+    def close(self):
+        self.conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Đo số lượt soát vé/giây và độ trễ p50/p99 khi nhiều máy quét gửi cùng lúc'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--screens', type=int, default=20)
+        parser.add_argument('--rows', type=int, default=10, help=f'Số hàng ghế mỗi phòng ({SEATS_PER_ROW} ghế/hàng)')
+        parser.add_argument('--group-size', type=int, default=3, help='Số vé mỗi đơn')
+        parser.add_argument('--scanners', type=int, default=20)
+        parser.add_argument('--rescan', type=float, default=0.05, help='Tỉ lệ mã bị quét lại')
+        parser.add_argument('--batch', type=int, default=1, help='Số lượt quét mỗi request (>1: gửi bù offline)')
+        parser.add_argument('--url', help='Server đang chạy, vd http://127.0.0.1:8000')
+        parser.add_argument('--token', help='Token máy quét của server (khi dùng --url)')
+
+    def handle(self, *args, **options):
+        if options['url'] and not options['token']:
+            raise CommandError('Cần --token khi đo server qua --url')
+        if connection.vendor == 'sqlite' and options['scanners'] > 1:
+            self.stdout.write(self.style.WARNING(
+                'SQLite khóa cả file khi ghi, các máy quét phải chờ nhau; số liệu thật cần PostgreSQL/MySQL.'
+            ))
+
+        tag = uuid.uuid4().hex[:6]
+        token = options['token'] or uuid.uuid4().hex
+        cinema, codes = self._setup(tag, options)
+        try:
+            scans = codes + random.sample(codes, int(len(codes) * options['rescan']))
+            random.shuffle(scans)
+            if options['url']:
+                result = self._run(scans, options, lambda: HttpScanner(options['url'], token))
+            else:
+                # DEBUG=False để không ghi lại từng truy vấn như môi trường phát triển
+                with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'],
+                                       CHECKIN={'SCANNERS': {'bench': token}}):
+                    result = self._run(scans, options, lambda: InProcessScanner(token))
+        finally:
+            cinema.delete()
+            Movie.objects.filter(title=f'__bench__{tag}').delete()
+            User.objects.filter(username=f'__bench__{tag}').delete()
+        self._report(result, len(codes), options)
+
+    def _setup(self, tag, options):
+        cinema = Cinema.objects.create(name=f'__bench__{tag}', address='-', city='-', district='-',
+                                       phone='-', email='bench@example.com')
+        movie = Movie.objects.create(title=f'__bench__{tag}', description='-', director='-', cast='-', duration=120,
+                                     release_date=timezone.now().date(), country='-', language='-', rating='P')
+        user = User.objects.create_user(username=f'__bench__{tag}')
+        start = timezone.now() + timedelta(minutes=15)
+        rows = [chr(ord('A') + r) for r in range(options['rows'])]
+        group = options['group_size']
+        codes = []
+        for s in range(options['screens']):
+            screen = Screen.objects.create(cinema=cinema, name=f'P{s + 1}', total_seats=len(rows) * SEATS_PER_ROW,
+                                           rows=len(rows), seats_per_row=SEATS_PER_ROW)
+            seats = Seat.objects.bulk_create([Seat(screen=screen, row=row, number=n)
+                                              for row in rows for n in range(1, SEATS_PER_ROW + 1)])
+            showtime = Showtime.objects.create(movie=movie, screen=screen, start_time=start,
+                                               end_time=start + timedelta(hours=2), base_price=60000)
+            # Đơn đã thanh toán ghi thẳng bằng bulk_create: chỉ đo phần soát vé
+            groups = [seats[i:i + group] for i in range(0, len(seats), group)]
+            bookings = Booking.objects.bulk_create([
+                Booking(user=user, showtime=showtime, booking_code=f'B{tag}{s:02d}{i:04d}'.upper(),
+                        total_amount=60000 * len(members), status='PAID', paid_at=timezone.now(), expires_at=start)
+                for i, members in enumerate(groups)
+            ])
+            Ticket.objects.bulk_create([Ticket(booking=booking, seat=seat, price=60000)
+                                        for booking, members in zip(bookings, groups) for seat in members])
+            codes += [booking.booking_code for booking in bookings]
+        return cinema, codes
+
+    def _run(self, scans, options, make_scanner):
+        scanners = options['scanners']
+        batch = options['batch']
+        path = reverse('checkin_batch_api' if batch > 1 else 'checkin_api')
+        # Mỗi máy quét một phần mã, chia thành các request
+        shares = [scans[i::scanners] for i in range(scanners)]
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        barrier = threading.Barrier(scanners)
+
+        def worker(share):
+            scanner = make_scanner()
+            mine, counts = [], {}
+            bodies = ([{'scans': [{'code': code} for code in share[i:i + batch]]} for i in range(0, len(share), batch)]
+                      if batch > 1 else [{'code': code} for code in share])
+            barrier.wait()
+            try:
+                for body in bodies:
+                    started = time.perf_counter()
+                    try:
+                        _, payload = scanner.post(path, body)
+                    except Exception:
+                        counts['error'] = counts.get('error', 0) + 1
+                        continue
+                    mine.append(time.perf_counter() - started)
+                    for result in payload.get('results', [payload]):
+                        counts[result.get('status', 'error')] = counts.get(result.get('status', 'error'), 0) + 1
+            finally:
+                scanner.close()
+            with lock:
+                latencies.extend(mine)
+                for status, n in counts.items():
+                    statuses[status] = statuses.get(status, 0) + n
+
+        threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {'elapsed': time.perf_counter() - started, 'latencies': sorted(latencies), 'statuses': statuses}
+
+    def _report(self, result, bookings, options):
+        elapsed = result['elapsed']
+        latencies = result['latencies']
+        scans = sum(result['statuses'].values())
+        self.stdout.write(
+            f"{options['screens']} phòng, {bookings} đơn, {options['scanners']} máy quét, "
+            f"{options['batch']} lượt/request: {scans} lượt quét trong {elapsed:.2f}s"
+        )
+        self.stdout.write(', '.join(f'{status}={n}' for status, n in sorted(result['statuses'].items())))
+        self.stdout.write(self.style.SUCCESS(
+            f'{scans / elapsed:.0f} lượt quét/s, {len(latencies) / elapsed:.0f} request/s, '
+            f'p50 {_percentile(latencies, 0.5) * 1000:.2f}ms, p99 {_percentile(latencies, 0.99) * 1000:.2f}ms'
+        ))
@@ -0,0 +1,54 @@
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from movies import forecast
+from movies.models import RevenueForecast
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian tải trang thống kê khi dùng dự báo đã cache và khi tính lại dự báo mỗi request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        staff = User.objects.create_user(username='__bench__dashboard', is_staff=True)
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(staff)
+        try:
+            cache.delete(forecast.CACHE_KEY)
+            client.get(reverse('admin_stats'))  # làm nóng
+            cached = self._measure(client, n)
+
+            # Không cache: ép tính lại dự báo ở mỗi request
+            real = forecast.get_forecast
+            with mock.patch.object(forecast, 'get_forecast', lambda refresh=False: real(refresh=True)):
+                uncached = self._measure(client, n)
+        finally:
+            staff.delete()
+            # Mỗi kỳ chỉ có một dòng dự báo (được tính lại tại chỗ), không cần dọn
+            cache.delete(forecast.CACHE_KEY)
+
+        for label, samples in (('forecast đã cache', cached), ('tính lại mỗi request', uncached)):
+            samples.sort()
+            self.stdout.write(
+                f'{label:<22} median={statistics.median(samples):.2f}ms '
+                f'p95={samples[int(len(samples) * 0.95) - 1]:.2f}ms'
+            )
+
+    def _measure(self, client, n):
+        samples = []
+        for _ in range(n):
+            started = time.perf_counter()
+            response = client.get(reverse('admin_stats'))
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return samples
@@ -0,0 +1,217 @@
+import asyncio
+import importlib.util
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from movies.models import Movie, Showtime
+
+# So sánh các trang chỉ đọc (danh sách phim, gợi ý tìm kiếm, chi tiết phim, sơ đồ ghế) khi chạy
+# WSGI (view đồng bộ được bọc lại, mỗi request một luồng) và ASGI (view async) trên server thật.
+#
+# Không truyền --wsgi-url/--asgi-url thì lệnh tự bật server cục bộ:
+#   WSGI: gunicorn (gthread) nếu đã cài, nếu không thì runserver (chỉ để tham khảo)
+#   ASGI: uvicorn hoặc daphne nếu đã cài, nếu không thì bỏ qua
+# Tải được tạo bằng --concurrency kết nối keep-alive song song trong --duration giây,
+# in ra số request/giây và độ trễ p50/p99 cho từng trang.
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def wsgi_command(port, workers, threads):
+    if _installed('gunicorn'):
+        return [sys.executable, '-m', 'gunicorn', 'cinema_project.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                '--worker-class', 'gthread', '--threads', str(threads), '--log-level', 'warning']
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload', '--skip-checks']
+
+
+def asgi_command(port, workers):
+    if _installed('uvicorn'):
+        return [sys.executable, '-m', 'uvicorn', 'cinema_project.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+                '--no-access-log', '--log-level', 'warning']
+    if _installed('daphne'):
+        return [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port),
+                'cinema_project.asgi:application']
+    return None
+
+
+def wait_until_listening(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('server đóng kết nối')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        headers['connection'] = 'close'
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(host, port, paths, deadline, results):
+    # Một kết nối keep-alive, lần lượt gọi các trang cho tới hết giờ
+    reader = writer = None
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            results[path]['errors'] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        results[path]['latencies'].append(time.perf_counter() - started)
+        if status >= 400:
+            results[path]['errors'] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(base_url, paths, concurrency, duration):
+    parts = urlsplit(base_url)
+    prefix = parts.path.rstrip('/')
+    paths = [prefix + path for path in paths]
+    results = {path: {'latencies': [], 'errors': 0} for path in paths}
+    deadline = time.monotonic() + duration
+    # Lệch trang bắt đầu giữa các kết nối để mọi trang đều có tải đồng thời
+    await asyncio.gather(*[
+        _client(parts.hostname, parts.port or 80, paths[i % len(paths):] + paths[:i % len(paths)], deadline, results)
+        for i in range(concurrency)
+    ])
+    return results
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'So sánh req/s và độ trễ p99 của các trang chỉ đọc giữa WSGI (đồng bộ) và ASGI (async)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--warmup', type=float, default=2.0)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=8, help='Số luồng mỗi worker WSGI (gunicorn gthread)')
+        parser.add_argument('--wsgi-url', help='Server WSGI đang chạy sẵn, vd http://127.0.0.1:8001')
+        parser.add_argument('--asgi-url', help='Server ASGI đang chạy sẵn, vd http://127.0.0.1:8002')
+
+    def handle(self, *args, **options):
+        paths = self._paths()
+        targets = [
+            ('wsgi', options['wsgi_url'], lambda port: wsgi_command(port, options['workers'], options['threads'])),
+            ('asgi', options['asgi_url'], lambda port: asgi_command(port, options['workers'])),
+        ]
+        self.stdout.write(f"{'server':<6} {'trang':<42} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'lỗi':>5}")
+        for label, url, command in targets:
+            server = None
+            if url is None:
+                port = _free_port()
+                argv = command(port)
+                if argv is None:
+                    self.stdout.write(self.style.WARNING(
+                        f'{label}: chưa cài uvicorn/daphne, bỏ qua (hoặc truyền --asgi-url)'))
+                    continue
+                server = subprocess.Popen(argv, cwd=settings.BASE_DIR,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if not wait_until_listening(port):
+                    server.terminate()
+                    raise CommandError(f'{label}: server không khởi động được: {" ".join(argv)}')
+                url = f'http://127.0.0.1:{port}'
+                if 'runserver' in argv:
+                    self.stdout.write(self.style.WARNING('wsgi: chưa cài gunicorn, dùng runserver (chỉ để tham khảo)'))
+            try:
+                asyncio.run(run_load(url, paths, options['concurrency'], options['warmup']))
+                results = asyncio.run(run_load(url, paths, options['concurrency'], options['duration']))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait(10)
+            self._report(label, results, options['duration'])
+
+    def _paths(self):
+        showtime = Showtime.objects.filter(is_active=True, start_time__gte=timezone.now()) \
+            .select_related('movie').order_by('start_time').first()
+        if showtime is None:
+            raise CommandError('Chưa có suất chiếu sắp tới, hãy chạy "manage.py seed_data" trước')
+        movie = showtime.movie
+        term = movie.title.split()[0][:3]
+        return [
+            reverse('movie_list'),
+            f"{reverse('search_suggestions')}?term={quote(term)}",
+            reverse('movie_detail', args=[movie.id]),
+            reverse('showtime_seats_api', args=[showtime.id]),
+        ]
+
+    def _report(self, label, results, duration):
+        total_requests = 0
+        all_latencies = []
+        for path, result in results.items():
+            latencies = sorted(result['latencies'])
+            total_requests += len(latencies)
+            all_latencies += latencies
+            self.stdout.write(
+                f'{label:<6} {path[:42]:<42} {len(latencies) / duration:>8.1f} '
+                f'{_percentile(latencies, 0.5) * 1000:>8.1f} {_percentile(latencies, 0.99) * 1000:>8.1f} '
+                f"{result['errors']:>5}"
+            )
+        all_latencies.sort()
+        self.stdout.write(self.style.SUCCESS(
+            f"{label:<6} {'(tất cả)':<42} {total_requests / duration:>8.1f} "
+            f'{_percentile(all_latencies, 0.5) * 1000:>8.1f} {_percentile(all_latencies, 0.99) * 1000:>8.1f}'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from movies import catalog
+
+
+class Command(BaseCommand):
+    help = 'Xem số lần trúng/trượt cache danh sách phim trang chủ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Đặt lại bộ đếm về 0')
+        parser.add_argument('--invalidate', action='store_true', help='Bỏ toàn bộ cache danh sách phim')
+
+    def handle(self, *args, **options):
+        result = catalog.stats()
+        self.stdout.write(
+            f"Trúng: {result['hits']}  Trượt: {result['misses']}  "
+            f"Tỉ lệ trúng: {result['hit_rate']:.1%}  Thế hệ: {result['generation']}"
+        )
+        if options['reset']:
+            catalog.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Đã đặt lại bộ đếm.'))
+        if options['invalidate']:
+            catalog.invalidate()
+            self.stdout.write(self.style.SUCCESS('Đã bỏ cache danh sách phim.'))
@@ -0,0 +1,70 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Các thư viện nặng không được phép nạp khi worker khởi động
+HEAVY_MODULES = ['numpy', 'pandas', 'sklearn']
+
+# Chạy trong tiến trình con sạch: nạp application + urls (như request đầu tiên) rồi báo thời gian và RSS
+PROBE = '''
+import importlib, json, os, resource, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cinema_project.settings')
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - started
+try:
+    # VmHWM tính riêng cho tiến trình này (ru_maxrss trên Linux còn mang theo RSS của tiến trình cha trước exec)
+    with open('/proc/self/status') as status:
+        rss_mb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM')) / 1024
+except OSError:
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+heavy = [name for name in json.loads(sys.argv[2]) if name in sys.modules]
+print(json.dumps({'seconds': elapsed, 'rss_mb': rss_mb, 'heavy': heavy}))
+'''
+
+
+def probe(module, runs=3):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, module, json.dumps(HEAVY_MODULES)],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'seconds': statistics.median(r['seconds'] for r in results),
+        'rss_mb': statistics.median(r['rss_mb'] for r in results),
+        'heavy': sorted({name for r in results for name in r['heavy']}),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Đo thời gian import và bộ nhớ khi nạp ứng dụng WSGI/ASGI, báo lỗi nếu vượt ngân sách'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        budget = settings.STARTUP_BUDGET
+        errors = []
+        for module in ('cinema_project.wsgi', 'cinema_project.asgi'):
+            result = probe(module, options['runs'])
+            self.stdout.write(
+                f"{module:<20} {result['seconds'] * 1000:.0f}ms  RSS {result['rss_mb']:.1f}MB"
+                f"  (ngân sách {budget['IMPORT_SECONDS'] * 1000:.0f}ms / {budget['RSS_MB']}MB)"
+            )
+            if result['seconds'] > budget['IMPORT_SECONDS']:
+                errors.append(f"{module}: import mất {result['seconds']:.2f}s")
+            if result['rss_mb'] > budget['RSS_MB']:
+                errors.append(f"{module}: RSS {result['rss_mb']:.1f}MB")
+            if result['heavy']:
+                errors.append(f"{module}: đã nạp {', '.join(result['heavy'])} khi khởi động")
+        if errors:
+            raise CommandError('Vượt ngân sách khởi động: ' + '; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('Khởi động trong ngân sách.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from movies import forecast
+
+
+class Command(BaseCommand):
+    help = 'Tính lại dự báo doanh thu tháng tới và lưu vào cache'
+
+    def handle(self, *args, **options):
+        result = forecast.compute_forecast()
+        r2 = f'{result.r2:.3f}' if result.r2 is not None else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f'Dự báo: {result.predicted_revenue:,.0f}đ ({result.growth_percent:+.1f}%), '
+            f'{result.points} tháng dữ liệu, R²={r2}'
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from movies.holds import DEFAULT_BATCH_SIZE, expire_stale_holds
+
+
+class Command(BaseCommand):
+    help = 'Chuyển các đơn PENDING quá hạn giữ ghế sang EXPIRED và trả ghế (chạy một lần hoặc lặp liên tục)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Chạy liên tục như một worker')
+        parser.add_argument('--interval', type=float, default=30, help='Số giây nghỉ giữa các lượt quét (khi --loop)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.perf_counter()
+            total = self.sweep(batch_size)
+            elapsed = time.perf_counter() - started
+            if total or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Đã hủy giữ chỗ {total} đơn quá hạn trong {elapsed:.2f}s'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def sweep(self, batch_size):
+        total = 0
+        while True:
+            count = expire_stale_holds(batch_size)
+            total += count
+            if count < batch_size:
+                return total
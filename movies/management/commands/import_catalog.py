@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import catalog_import
+
+
+class Command(BaseCommand):
+    help = 'Nhập danh mục phim từ file CSV/JSON/JSON Lines theo lô (chạy lại không tạo trùng)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(catalog_import.READERS),
+                            help='Mặc định đoán theo đuôi file (.csv, .json, .jsonl/.ndjson)')
+        parser.add_argument('--batch-size', type=int, default=catalog_import.BATCH_SIZE)
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog_import.detect_format(path)
+        if fmt not in catalog_import.READERS:
+            raise CommandError(f'Không nhận ra định dạng "{fmt}", dùng --format')
+
+        def progress(stats):
+            rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+            self.stdout.write(
+                f"{stats['rows']} dòng: tạo {stats['created']}, cập nhật {stats['updated']}, "
+                f"lỗi {len(stats['errors'])} ({rate:.0f} dòng/s)"
+            )
+
+        try:
+            with open(path, newline='' if fmt == 'csv' else None, encoding=options['encoding']) as stream:
+                stats = catalog_import.import_catalog(
+                    catalog_import.READERS[fmt](stream), options['batch_size'], progress)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ValueError as exc:
+            raise CommandError(f'File {fmt} không hợp lệ: {exc}')
+
+        for line, message in stats['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f'Dòng {line}: {message}'))
+        if len(stats['errors']) > 20:
+            self.stdout.write(self.style.WARNING(f"... và {len(stats['errors']) - 20} dòng lỗi khác"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Xong {stats['rows']} dòng trong {stats['seconds']:.2f}s: "
+            f"tạo {stats['created']}, cập nhật {stats['updated']}, bỏ qua {len(stats['errors'])} dòng lỗi."
+        ))
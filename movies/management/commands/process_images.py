@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from movies.images import DEFAULT_BATCH_SIZE, process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Tạo ảnh thu nhỏ (AVIF/WebP/JPEG) cho poster và ảnh combo đang chờ (chạy một lần hoặc lặp liên tục)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Chạy liên tục như một worker')
+        parser.add_argument('--interval', type=float, default=5, help='Số giây nghỉ khi hết việc (khi --loop)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.perf_counter()
+            done, failed = self.drain(batch_size)
+            elapsed = time.perf_counter() - started
+            if done or failed or not options['loop']:
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(f'Đã xử lý {done} ảnh, lỗi {failed} ảnh trong {elapsed:.2f}s'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def drain(self, batch_size):
+        total_done = total_failed = 0
+        while True:
+            done, failed = process_jobs(batch_size)
+            total_done += done
+            total_failed += failed
+            # Việc lỗi được hẹn chạy lại sau nên lô không đầy nghĩa là đã hết việc đến hạn
+            if done + failed < batch_size:
+                return total_done, total_failed
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies import forecast, rollups
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại bảng doanh thu tổng hợp (giờ/ngày/tháng) từ các đơn đã thanh toán'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rollups.rebuild(batch_size=options['batch_size'])
+        # Dữ liệu huấn luyện đã thay đổi
+        forecast.compute_forecast()
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tạo {count} dòng doanh thu tổng hợp trong {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies import search
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại chỉ mục tìm kiếm phim (tên, đạo diễn, diễn viên, thể loại)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            self.stdout.write(self.style.WARNING('CSDL hiện tại không dùng chỉ mục FTS5, bỏ qua.'))
+            return
+        started = time.perf_counter()
+        count = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã đánh chỉ mục {count} phim trong {time.perf_counter() - started:.2f}s'
+        ))
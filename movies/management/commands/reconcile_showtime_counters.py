@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from movies import counters
+
+
+class Command(BaseCommand):
+    help = 'Tính lại số ghế, ghế đang giữ và ghế đã bán của các suất chiếu từ Seat/SeatReservation/Ticket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Đã sửa bộ đếm ghế của {fixed} suất chiếu.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from movies import ratings
+
+
+class Command(BaseCommand):
+    help = 'Tính lại số đánh giá, điểm trung bình và phân bố sao của phim từ bảng Review'
+
+    def add_arguments(self, parser):
+        parser.add_argument('movie_ids', nargs='*', type=int, help='Chỉ sửa các phim này (mặc định: tất cả)')
+
+    def handle(self, *args, **options):
+        fixed = ratings.repair(options['movie_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Đã sửa thống kê đánh giá của {fixed} phim.'))
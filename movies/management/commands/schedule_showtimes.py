@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from movies import scheduling
+from movies.models import Movie, Screen
+
+# Ví dụ kế hoạch (times + days tính từ week_start, hoặc starts là thời điểm cụ thể):
+# {"week_start": "2026-10-19", "cleaning_minutes": 15, "base_price": 75000, "prices": {"VIP": 90000},
+#  "entries": [{"movie": "dune-2", "screen": 3, "times": ["09:30", "13:00", "19:45"], "days": [4, 5, 6]},
+#              {"movie": 12, "screen": 4, "starts": ["2026-10-20T22:15"], "base_price": 60000}]}
+
+
+class Command(BaseCommand):
+    help = 'Xếp lịch chiếu cả tuần từ file kế hoạch JSON (có trùng lịch thì báo và không tạo suất nào)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ kiểm tra trùng lịch, không tạo suất chiếu')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig') as stream:
+                plan = json.load(stream)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ValueError as exc:
+            raise CommandError(f'File kế hoạch không hợp lệ: {exc}')
+
+        try:
+            report = scheduling.schedule(plan, dry_run=options['dry_run'])
+        except scheduling.PlanError as exc:
+            raise CommandError(str(exc))
+
+        conflicts = report['conflicts']
+        if conflicts:
+            self._report_conflicts(conflicts)
+            raise CommandError(f'{len(conflicts)} suất bị trùng lịch, chưa tạo suất chiếu nào')
+        done = 'Kế hoạch hợp lệ' if options['dry_run'] else f"Đã tạo {report['created']} suất chiếu"
+        self.stdout.write(self.style.SUCCESS(
+            f"{done}: {report['planned']} suất trong kế hoạch, bỏ qua {report['skipped']} suất đã có "
+            f"({report['seconds']:.2f}s)"
+        ))
+
+    def _report_conflicts(self, conflicts):
+        slots = [slot for pair in conflicts for slot in pair]
+        titles = dict(Movie.objects.filter(pk__in={slot.movie_id for slot in slots}).values_list('id', 'title'))
+        screens = {screen.pk: screen for screen in
+                   Screen.objects.select_related('cinema').filter(pk__in={slot.screen_id for slot in slots})}
+
+        def describe(slot):
+            where = f'mục {slot.entry + 1}' if slot.entry is not None else f'suất #{slot.showtime_id} đã có'
+            return (f'{titles[slot.movie_id]} {timezone.localtime(slot.start):%d/%m %H:%M}'
+                    f'-{timezone.localtime(slot.end):%H:%M} ({where})')
+
+        for slot, other in conflicts[:50]:
+            screen = screens[slot.screen_id]
+            self.stdout.write(self.style.WARNING(
+                f'{screen.cinema.name} - {screen.name}: {describe(slot)} trùng {describe(other)}'
+            ))
+        if len(conflicts) > 50:
+            self.stdout.write(self.style.WARNING(f'... và {len(conflicts) - 50} suất khác'))
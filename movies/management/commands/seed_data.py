@@ -1,9 +1,10 @@
 import random
 from datetime import timedelta
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.contrib.auth.models import User
-from movies.models import Movie, Cinema, Screen, Seat, Showtime, Booking, Ticket
+from movies.models import Movie, Cinema, Screen, Seat, Showtime, Booking, Ticket, SeatReservation
 from faker import Faker
 
 
@@ -92,9 +93,21 @@ class Command(BaseCommand):
 
                     booking.total_amount = booking_total
                     booking.save()
+
+                    # Đơn đã thanh toán thì ghế phải được giữ chỗ
+                    if status == 'PAID':
+                        SeatReservation.objects.bulk_create([
+                            SeatReservation(showtime=showtime, seat=seat, booking=booking,
+                                            user=user, expires_at=None)
+                            for seat in seats
+                        ], ignore_conflicts=True)
                     total_bookings += 1
 
             current_date += timedelta(days=1)
             self.stdout.write(f'-> Xong ngày {current_date.strftime("%d/%m/%Y")}')
 
+        # Dữ liệu giả được ghi thẳng vào Booking nên phải dựng lại doanh thu tổng hợp
+        call_command('rebuild_revenue_rollups', stdout=self.stdout)
+        call_command('reconcile_showtime_counters', stdout=self.stdout)
+
         self.stdout.write(self.style.SUCCESS(f'Xong! Đã tạo {total_bookings} đơn hàng trong 6 tháng.'))
\ No newline at end of file
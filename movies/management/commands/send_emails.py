@@ -0,0 +1,46 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from movies.outbox import DEFAULT_BATCH_SIZE, deliver
+
+
+class Command(BaseCommand):
+    help = 'Gửi email trong hộp thư đi theo lô qua một kết nối SMTP dùng lại (chạy một lần hoặc lặp liên tục)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Chạy liên tục như một worker')
+        parser.add_argument('--interval', type=float, default=5, help='Số giây nghỉ khi hết email (khi --loop)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            started = time.perf_counter()
+            sent, failed = self.drain(batch_size)
+            elapsed = time.perf_counter() - started
+            if sent or failed or not options['loop']:
+                rate = sent / elapsed if elapsed else 0
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(
+                    f'Đã gửi {sent} email, lỗi {failed} email trong {elapsed:.2f}s ({rate:.1f} email/s)'))
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def drain(self, batch_size):
+        # Cả lượt dùng chung một kết nối; đóng lại trước khi nghỉ để server không phải giữ kết nối rỗi
+        connection = get_connection()
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = deliver(batch_size, connection)
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < batch_size:
+                    return total_sent, total_failed
+        finally:
+            connection.close()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_alter_movie_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showtime',
+            name='occupancy_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_reservations(apps, schema_editor):
+    # Tạo lượt giữ chỗ cho các vé của đơn PAID/PENDING đã có trước đây
+    Ticket = apps.get_model('movies', 'Ticket')
+    SeatReservation = apps.get_model('movies', 'SeatReservation')
+
+    SeatReservation.objects.filter(is_active=True).update(is_active=False)
+
+    claimed = set()
+    batch = []
+    tickets = Ticket.objects.filter(booking__status__in=['PAID', 'PENDING']).values_list(
+        'seat_id', 'booking_id', 'booking__showtime_id', 'booking__user_id', 'booking__expires_at'
+    ).order_by('booking__created_at')
+    for seat_id, booking_id, showtime_id, user_id, expires_at in tickets.iterator():
+        if (showtime_id, seat_id) in claimed:
+            continue
+        claimed.add((showtime_id, seat_id))
+        batch.append(SeatReservation(
+            showtime_id=showtime_id, seat_id=seat_id, booking_id=booking_id,
+            user_id=user_id, expires_at=expires_at, is_active=True,
+        ))
+        if len(batch) >= 1000:
+            SeatReservation.objects.bulk_create(batch)
+            batch = []
+    SeatReservation.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_showtime_occupancy_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='seatreservation',
+            unique_together=set(),
+        ),
+        migrations.RunPython(backfill_reservations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='seatreservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('showtime', 'seat'), name='unique_active_seat_reservation'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_paid_hold_expiry(apps, schema_editor):
+    # Ghế của đơn đã thanh toán không bao giờ hết hạn giữ chỗ
+    SeatReservation = apps.get_model('movies', 'SeatReservation')
+    SeatReservation.objects.filter(booking__status='PAID').update(expires_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_seat_reservation_active_claim'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='seatreservation',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Hết hạn lúc'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'expires_at'], name='booking_status_expires_idx'),
+        ),
+        migrations.RunPython(clear_paid_hold_expiry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_seat_hold_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Giờ'), ('DAY', 'Ngày'), ('MONTH', 'Tháng')], max_length=5, verbose_name='Đơn vị thời gian')),
+                ('period', models.DateTimeField(verbose_name='Bắt đầu kỳ')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Doanh thu')),
+                ('tickets', models.IntegerField(default=0, verbose_name='Số vé')),
+                ('bookings', models.IntegerField(default=0, verbose_name='Số đơn')),
+                ('cinema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='movies.cinema', verbose_name='Rạp')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='movies.movie', verbose_name='Phim')),
+            ],
+            options={
+                'verbose_name': 'Doanh thu tổng hợp',
+                'verbose_name_plural': 'Doanh thu tổng hợp',
+                'unique_together': {('granularity', 'period', 'movie', 'cinema')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField(verbose_name='Kỳ dữ liệu')),
+                ('window_start', models.DateTimeField(null=True, verbose_name='Dữ liệu từ tháng')),
+                ('window_end', models.DateTimeField(null=True, verbose_name='Dữ liệu đến tháng')),
+                ('points', models.IntegerField(default=0, verbose_name='Số tháng dữ liệu')),
+                ('slope', models.FloatField(default=0, verbose_name='Hệ số góc')),
+                ('intercept', models.FloatField(default=0, verbose_name='Hệ số chặn')),
+                ('r2', models.FloatField(null=True, verbose_name='R²')),
+                ('current_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Doanh thu tháng hiện tại')),
+                ('predicted_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Doanh thu dự đoán')),
+                ('growth_percent', models.FloatField(default=0, verbose_name='Tăng trưởng (%)')),
+                ('computed_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tính')),
+            ],
+            options={
+                'verbose_name': 'Dự báo doanh thu',
+                'verbose_name_plural': 'Dự báo doanh thu',
+                'ordering': ['-computed_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:49
+
+import unicodedata
+
+from django.db import migrations
+
+# SQL và hàm gập dấu được chép cố định ở đây (không import movies.search): migration phải
+# chạy được đúng như lúc viết dù module tìm kiếm thay đổi sau này.
+
+INDEX_TABLE = 'movies_movie_search'
+
+
+def fold(text):
+    text = (text or '').lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def create_search_index(apps, schema_editor):
+    # Bảng ảo FTS5 chỉ có trên SQLite, CSDL khác dùng tìm kiếm icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Movie = apps.get_model('movies', 'Movie')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            "title, director, actors, genres, is_active UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        rows = [
+            (m.id, fold(m.title), fold(m.director), fold(m.cast), fold(' '.join(g.name for g in m.genres.all())),
+             int(m.is_active))
+            for m in Movie.objects.prefetch_related('genres')
+        ]
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (rowid, title, director, actors, genres, is_active) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_revenue_forecast'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_review_stats(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Review = apps.get_model('movies', 'Review')
+    rows = Review.objects.order_by().values('movie_id').annotate(
+        count=Count('id'), rating_sum=Sum('rating'),
+        **{f'star_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)}
+    )
+    for row in rows:
+        Movie.objects.filter(pk=row['movie_id']).update(
+            review_count=row['count'], review_rating_sum=row['rating_sum'],
+            **{f'review_star_{star}': row[f'star_{star}'] for star in range(1, 6)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_movie_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Số đánh giá'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Tổng điểm đánh giá'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_star_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_star_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_star_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_star_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_star_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', '-id'], name='review_movie_recent_idx'),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_seat_counters(apps, schema_editor):
+    Seat = apps.get_model('movies', 'Seat')
+    SeatReservation = apps.get_model('movies', 'SeatReservation')
+    Showtime = apps.get_model('movies', 'Showtime')
+    Ticket = apps.get_model('movies', 'Ticket')
+    capacity = dict(Seat.objects.order_by().values('screen_id').annotate(n=Count('id')).values_list('screen_id', 'n'))
+    held = dict(SeatReservation.objects.filter(is_active=True, booking__status='PENDING').order_by()
+                .values('showtime_id').annotate(n=Count('id')).values_list('showtime_id', 'n'))
+    sold = dict(Ticket.objects.filter(booking__status='PAID').order_by()
+                .values('booking__showtime_id').annotate(n=Count('id')).values_list('booking__showtime_id', 'n'))
+    showtimes = list(Showtime.objects.only('id', 'screen_id'))
+    for showtime in showtimes:
+        showtime.capacity = capacity.get(showtime.screen_id, 0)
+        showtime.seats_held = held.get(showtime.id, 0)
+        showtime.seats_sold = sold.get(showtime.id, 0)
+    Showtime.objects.bulk_update(showtimes, ['capacity', 'seats_held', 'seats_sold'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showtime',
+            name='capacity',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Số ghế'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='seats_held',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Ghế đang giữ'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='seats_sold',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Ghế đã bán'),
+        ),
+        migrations.RunPython(fill_seat_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_showtime_seat_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['showtime', 'status'], name='booking_showtime_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['release_date'], name='movie_active_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='revenueforecast',
+            index=models.Index(fields=['period', '-computed_at'], name='forecast_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='showtime',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['movie', 'start_time'], name='showtime_movie_start_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='concession',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='poster_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50, verbose_name='Model')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID đối tượng')),
+                ('field', models.CharField(max_length=50, verbose_name='Trường ảnh')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Số lần thử')),
+                ('last_error', models.TextField(blank=True, verbose_name='Lỗi gần nhất')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Chạy sau')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')),
+            ],
+            options={
+                'verbose_name': 'Việc tạo ảnh',
+                'verbose_name_plural': 'Việc tạo ảnh',
+                'indexes': [models.Index(fields=['run_after'], name='imagejob_run_after_idx')],
+                'constraints': [models.UniqueConstraint(fields=('model', 'object_id', 'field'), name='unique_image_job')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('BOOKING_PAID', 'Xác nhận thanh toán')], max_length=20, verbose_name='Loại email')),
+                ('status', models.CharField(choices=[('PENDING', 'Chờ gửi'), ('SENT', 'Đã gửi'), ('FAILED', 'Gửi lỗi')], default='PENDING', max_length=10, verbose_name='Trạng thái')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Số lần thử')),
+                ('last_error', models.TextField(blank=True, verbose_name='Lỗi gần nhất')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Gửi sau')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Thời gian tạo')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Thời gian gửi')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='movies.booking', verbose_name='Đơn đặt vé')),
+            ],
+            options={
+                'verbose_name': 'Email chờ gửi',
+                'verbose_name_plural': 'Email chờ gửi',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'booking'), name='unique_outbox_email')],
+            },
+        ),
+    ]
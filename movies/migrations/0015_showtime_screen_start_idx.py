@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='showtime',
+            index=models.Index(fields=['screen', 'start_time'], name='showtime_screen_start_idx'),
+        ),
+    ]
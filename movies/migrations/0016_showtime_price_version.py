@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_showtime_screen_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showtime',
+            name='price_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
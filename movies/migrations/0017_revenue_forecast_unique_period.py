@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+def drop_duplicate_forecasts(apps, schema_editor):
+    # Trước đây mỗi lần tính lại thêm một dòng mới: chỉ giữ dòng tính sau cùng của mỗi kỳ
+    RevenueForecast = apps.get_model('movies', 'RevenueForecast')
+    keep = {}
+    for forecast_id, period in RevenueForecast.objects.order_by('computed_at', 'id').values_list('id', 'period'):
+        keep[period] = forecast_id
+    RevenueForecast.objects.exclude(id__in=keep.values()).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_showtime_price_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_forecasts, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='revenueforecast',
+            name='forecast_period_idx',
+        ),
+        migrations.AlterField(
+            model_name='revenueforecast',
+            name='period',
+            field=models.DateTimeField(unique=True, verbose_name='Kỳ dữ liệu'),
+        ),
+    ]
@@ -5,7 +5,18 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.utils import timezone
-from django.utils.text import slugify
+
+from . import slugs
+
+
+def _without_derived(instance, derived, kwargs):
+    # Lưu lại toàn bộ một bản ghi đã có (form Admin, code nạp bản ghi từ trước) thì bỏ qua các cột
+    # tính sẵn: chúng chỉ được đổi bằng UPDATE ... F() ở nơi khác, bản trong bộ nhớ có thể đã cũ
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+    kwargs['update_fields'] = [field.name for field in instance._meta.concrete_fields
+                               if not field.primary_key and field.name not in derived]
+    return kwargs
 
 
 # Model Thể loại phim
@@ -67,12 +78,30 @@ class Movie(models.Model):
 
     poster = models.ImageField(upload_to='movies/posters/', verbose_name="Poster")
 
+    # Các bản thu nhỏ của poster do worker process_images tạo (xem movies/images.py)
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
+
     trailer_url = models.URLField(blank=True, verbose_name="Link trailer")
 
     genres = models.ManyToManyField(Genre, related_name='movies', verbose_name="Thể loại")
 
     is_active = models.BooleanField(default=True, verbose_name="Đang chiếu")
 
+    # Thống kê đánh giá tính sẵn (cập nhật theo từng Review, xem movies/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Số đánh giá")
+
+    review_rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Tổng điểm đánh giá")
+
+    review_star_1 = models.PositiveIntegerField(default=0, editable=False)
+
+    review_star_2 = models.PositiveIntegerField(default=0, editable=False)
+
+    review_star_3 = models.PositiveIntegerField(default=0, editable=False)
+
+    review_star_4 = models.PositiveIntegerField(default=0, editable=False)
+
+    review_star_5 = models.PositiveIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True)
@@ -84,16 +113,36 @@ class Movie(models.Model):
 
         ordering = ['-release_date']
 
+        indexes = [
+            # Trang chủ: phim đang chiếu / sắp chiếu theo ngày khởi chiếu.
+            # Chỉ mục một phần (is_active=True): SQLite không dùng được cột boolean đứng đầu chỉ mục
+            # với điều kiện `WHERE "is_active"` mà Django sinh ra.
+            models.Index(fields=['release_date'], condition=models.Q(is_active=True), name='movie_active_release_idx'),
+        ]
+
+    # Thống kê đánh giá (movies/ratings.py) và danh sách ảnh thu nhỏ (worker movies/images.py)
+    DERIVED_FIELDS = {'review_count', 'review_rating_sum', 'review_star_1', 'review_star_2', 'review_star_3',
+                      'review_star_4', 'review_star_5', 'poster_variants'}
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            i = 1
-            while Movie.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{i}"
-                i += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+            # Mọi slug đã dùng của tiêu đề này lấy trong một truy vấn (movies/slugs.py)
+            base = slugs.base_slug(self.title, self._meta.get_field('slug').max_length)
+            self.slug = slugs.assign(base, slugs.taken_suffixes(Movie.objects.all(), [base])[base])
+        super().save(*args, **_without_derived(self, self.DERIVED_FIELDS, kwargs))
+
+    @property
+    def average_review_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.review_rating_sum / self.review_count, 1)
+
+    @property
+    def review_histogram(self):
+        # [(số sao, số đánh giá, % trên tổng)] từ 5 sao xuống 1 sao
+        total = self.review_count or 1
+        counts = [(star, getattr(self, f'review_star_{star}')) for star in range(5, 0, -1)]
+        return [(star, count, round(count * 100 / total)) for star, count in counts]
 
 
 # Model Rạp chiếu phim
@@ -215,6 +264,19 @@ class Showtime(models.Model):
 
     is_active = models.BooleanField(default=True, verbose_name="Đang hoạt động")
 
+    # Tăng lên mỗi khi tình trạng ghế thay đổi (đặt/hủy/hết hạn), dùng để kiểm tra bitmap cache
+    occupancy_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bộ đếm ghế tính sẵn (cập nhật theo từng đơn, xem movies/counters.py)
+    capacity = models.IntegerField(default=0, editable=False, verbose_name="Số ghế")
+
+    seats_held = models.IntegerField(default=0, editable=False, verbose_name="Ghế đang giữ")
+
+    seats_sold = models.IntegerField(default=0, editable=False, verbose_name="Ghế đã bán")
+
+    # Tăng lên (trong cùng transaction) mỗi khi giá vé của suất đổi, là một phần khóa cache bảng giá
+    price_version = models.PositiveIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -224,12 +286,35 @@ class Showtime(models.Model):
 
         ordering = ['start_time']
 
+        indexes = [
+            # Lịch chiếu sắp tới của một phim (chỉ suất đang hoạt động)
+            models.Index(fields=['movie', 'start_time'], condition=models.Q(is_active=True), name='showtime_movie_start_idx'),
+            # Kiểm tra trùng lịch theo phòng khi xếp lịch (movies/scheduling.py)
+            models.Index(fields=['screen', 'start_time'], name='showtime_screen_start_idx'),
+        ]
+
     def __str__(self):
         return f"{self.movie.title} - {self.screen.cinema.name} - {self.start_time.strftime('%d/%m/%Y %H:%M')}"
 
+    # Version bitmap ghế, bộ đếm ghế và version bảng giá (movies/occupancy.py, counters.py, pricing.py)
+    DERIVED_FIELDS = {'occupancy_version', 'capacity', 'seats_held', 'seats_sold', 'price_version'}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.capacity:
+            self.capacity = Seat.objects.filter(screen_id=self.screen_id).count()
+        super().save(*args, **_without_derived(self, self.DERIVED_FIELDS, kwargs))
+
     def is_available(self):
         return self.start_time > timezone.now() and self.is_active
 
+    @property
+    def seats_available(self):
+        return max(0, self.capacity - self.seats_held - self.seats_sold)
+
+    @property
+    def is_sold_out(self):
+        return self.seats_available == 0
+
 
 # Model Giá vé theo loại ghế
 
@@ -292,6 +377,17 @@ class Booking(models.Model):
 
         ordering = ['-created_at']
 
+        indexes = [
+            # Quét đơn PENDING đã quá hạn giữ ghế
+            models.Index(fields=['status', 'expires_at'], name='booking_status_expires_idx'),
+            # Đơn theo suất chiếu + trạng thái (tình trạng ghế, đối soát bộ đếm)
+            models.Index(fields=['showtime', 'status'], name='booking_showtime_status_idx'),
+            # Thống kê / dựng lại doanh thu theo thời gian đặt
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+            # Lịch sử đơn của người dùng
+            models.Index(fields=['user', 'created_at'], name='booking_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.booking_code} - {self.user.username}"
 
@@ -333,7 +429,8 @@ class SeatReservation(models.Model):
 
     reserved_at = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian đặt")
 
-    expires_at = models.DateTimeField(verbose_name="Hết hạn lúc")
+    # NULL = giữ chỗ vĩnh viễn (đơn đã thanh toán)
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Hết hạn lúc")
 
     is_active = models.BooleanField(default=True, verbose_name="Đang giữ chỗ")
 
@@ -342,7 +439,15 @@ class SeatReservation(models.Model):
 
         verbose_name_plural = "Ghế đã đặt"
 
-        unique_together = ['showtime', 'seat']
+        # Mỗi ghế của một suất chiếu chỉ có tối đa 1 lượt giữ chỗ đang hiệu lực.
+        # Đây là chỗ chặn trùng ghế duy nhất khi đặt vé (không khóa cả suất chiếu).
+        constraints = [
+            models.UniqueConstraint(
+                fields=['showtime', 'seat'],
+                condition=models.Q(is_active=True),
+                name='unique_active_seat_reservation',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.showtime} - {self.seat} - {self.user.username}"
@@ -372,6 +477,11 @@ class Review(models.Model):
 
         ordering = ['-created_at']
 
+        indexes = [
+            # Trang đánh giá của một phim, mới nhất trước
+            models.Index(fields=['movie', '-id'], name='review_movie_recent_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.movie.title} - {self.rating}★"
 
@@ -381,6 +491,7 @@ class Concession(models.Model):
     description = models.TextField(verbose_name="Mô tả")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Giá")
     image = models.ImageField(upload_to='concessions/', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.price:,.0f}đ"
@@ -388,4 +499,161 @@ class Concession(models.Model):
 class BookingConcession(models.Model):
     booking = models.ForeignKey(Booking, related_name='concessions', on_delete=models.CASCADE)
     concession = models.ForeignKey(Concession, on_delete=models.CASCADE)
-    quantity = models.IntegerField(default=1)
\ No newline at end of file
+    quantity = models.IntegerField(default=1)
+
+# Model Doanh thu tổng hợp sẵn (theo giờ/ngày/tháng, theo phim và rạp) cho trang thống kê
+class RevenueRollup(models.Model):
+    GRANULARITY_CHOICES = [
+
+        ('HOUR', 'Giờ'),
+
+        ('DAY', 'Ngày'),
+
+        ('MONTH', 'Tháng'),
+
+    ]
+
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES, verbose_name="Đơn vị thời gian")
+
+    period = models.DateTimeField(verbose_name="Bắt đầu kỳ")
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='revenue_rollups', verbose_name="Phim")
+
+    cinema = models.ForeignKey(Cinema, on_delete=models.CASCADE, related_name='revenue_rollups', verbose_name="Rạp")
+
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Doanh thu")
+
+    tickets = models.IntegerField(default=0, verbose_name="Số vé")
+
+    bookings = models.IntegerField(default=0, verbose_name="Số đơn")
+
+    class Meta:
+        verbose_name = "Doanh thu tổng hợp"
+
+        verbose_name_plural = "Doanh thu tổng hợp"
+
+        unique_together = ['granularity', 'period', 'movie', 'cinema']
+
+    def __str__(self):
+        return f"{self.get_granularity_display()} {self.period:%d/%m/%Y %H:%M} - {self.movie_id}/{self.cinema_id}: {self.revenue:,.0f}đ"
+
+
+# Model Kết quả dự báo doanh thu (tính một lần cho mỗi kỳ dữ liệu mới)
+class RevenueForecast(models.Model):
+    period = models.DateTimeField(unique=True, verbose_name="Kỳ dữ liệu")
+
+    window_start = models.DateTimeField(null=True, verbose_name="Dữ liệu từ tháng")
+
+    window_end = models.DateTimeField(null=True, verbose_name="Dữ liệu đến tháng")
+
+    points = models.IntegerField(default=0, verbose_name="Số tháng dữ liệu")
+
+    slope = models.FloatField(default=0, verbose_name="Hệ số góc")
+
+    intercept = models.FloatField(default=0, verbose_name="Hệ số chặn")
+
+    r2 = models.FloatField(null=True, verbose_name="R²")
+
+    current_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Doanh thu tháng hiện tại")
+
+    predicted_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Doanh thu dự đoán")
+
+    growth_percent = models.FloatField(default=0, verbose_name="Tăng trưởng (%)")
+
+    computed_at = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian tính")
+
+    class Meta:
+        verbose_name = "Dự báo doanh thu"
+
+        verbose_name_plural = "Dự báo doanh thu"
+
+        ordering = ['-computed_at']
+
+    def __str__(self):
+        return f"{self.period:%m/%Y}: {self.predicted_revenue:,.0f}đ"
+
+
+# Model Hàng đợi tạo ảnh thu nhỏ (worker: manage.py process_images)
+class ImageJob(models.Model):
+    model = models.CharField(max_length=50, verbose_name="Model")  # app_label.model_name
+
+    object_id = models.PositiveBigIntegerField(verbose_name="ID đối tượng")
+
+    field = models.CharField(max_length=50, verbose_name="Trường ảnh")
+
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Số lần thử")
+
+    last_error = models.TextField(blank=True, verbose_name="Lỗi gần nhất")
+
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Chạy sau")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian tạo")
+
+    class Meta:
+        verbose_name = "Việc tạo ảnh"
+
+        verbose_name_plural = "Việc tạo ảnh"
+
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id', 'field'], name='unique_image_job'),
+        ]
+
+        indexes = [
+            models.Index(fields=['run_after'], name='imagejob_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id}.{self.field}"
+
+
+# Model Hộp thư đi: email chờ gửi (worker: manage.py send_emails)
+class OutboxEmail(models.Model):
+    KIND_CHOICES = [
+
+        ('BOOKING_PAID', 'Xác nhận thanh toán'),
+
+    ]
+
+    STATUS_CHOICES = [
+
+        ('PENDING', 'Chờ gửi'),
+
+        ('SENT', 'Đã gửi'),
+
+        ('FAILED', 'Gửi lỗi'),
+
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Loại email")
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='emails', verbose_name="Đơn đặt vé")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name="Trạng thái")
+
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Số lần thử")
+
+    last_error = models.TextField(blank=True, verbose_name="Lỗi gần nhất")
+
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Gửi sau")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian tạo")
+
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Thời gian gửi")
+
+    class Meta:
+        verbose_name = "Email chờ gửi"
+
+        verbose_name_plural = "Email chờ gửi"
+
+        constraints = [
+            # Mỗi đơn chỉ gửi một email mỗi loại, kể cả khi thanh toán bị gọi lại
+            models.UniqueConstraint(fields=['kind', 'booking'], name='unique_outbox_email'),
+        ]
+
+        indexes = [
+            # Worker lấy email đến hạn gửi
+            models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.booking_id} ({self.status})"
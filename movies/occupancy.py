@@ -0,0 +1,157 @@
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Seat, SeatReservation
+
+# Bitmap ghế đã có người đặt cho từng suất chiếu.
+#
+# - Layout (danh sách id ghế của phòng, sắp theo hàng/số) được cache theo phòng chiếu,
+#   vị trí của ghế trong layout chính là vị trí bit trong bitmap.
+# - Bitmap được cache theo suất chiếu, kèm theo version. Version gốc nằm ở cột
+#   Showtime.occupancy_version trong DB, mỗi lần đặt/hủy/hết hạn đều tăng lên 1.
+#   Bản cache có version khác với DB => đã cũ, phải dựng lại từ DB.
+# - Bitmap chỉ dùng để hiển thị và báo lỗi sớm; chặn trùng ghế thực sự là ràng buộc
+#   unique trên SeatReservation.
+
+LAYOUT_KEY = 'screen_layout:%s'
+OCCUPANCY_KEY = 'occupancy:%s'
+CACHE_TIMEOUT = 60 * 60 * 6
+
+ACTIVE_BOOKING_STATUSES = ['PAID', 'PENDING']
+
+
+class Occupancy:
+    def __init__(self, showtime_id, version, layout, bits, valid_until=None):
+        self.showtime_id = showtime_id
+        self.version = version
+        self.layout = layout
+        self.bits = bytearray(bits)
+        # Thời điểm lượt giữ ghế sớm nhất trong bitmap hết hạn
+        self.valid_until = valid_until
+        self._index = None
+
+    @property
+    def index(self):
+        # seat_id -> vị trí bit
+        if self._index is None:
+            self._index = {seat_id: pos for pos, seat_id in enumerate(self.layout)}
+        return self._index
+
+    def is_occupied(self, seat_id):
+        pos = self.index.get(seat_id)
+        if pos is None:
+            return False
+        return bool(self.bits[pos >> 3] & (1 << (pos & 7)))
+
+    def set(self, seat_ids, occupied=True):
+        for seat_id in seat_ids:
+            pos = self.index.get(seat_id)
+            if pos is None:
+                continue
+            if occupied:
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+            else:
+                self.bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+
+    def occupied_seat_ids(self):
+        return {seat_id for pos, seat_id in enumerate(self.layout)
+                if self.bits[pos >> 3] & (1 << (pos & 7))}
+
+    def count(self):
+        return sum(bin(b).count('1') for b in self.bits)
+
+    def to_cache(self):
+        return {'version': self.version, 'bits': bytes(self.bits), 'valid_until': self.valid_until}
+
+
+def empty_bits(size):
+    return bytearray((size + 7) // 8)
+
+
+def get_layout(screen_id):
+    key = LAYOUT_KEY % screen_id
+    layout = cache.get(key)
+    if layout is None:
+        layout = list(
+            Seat.objects.filter(screen_id=screen_id).order_by('row', 'number').values_list('id', flat=True)
+        )
+        cache.set(key, layout, CACHE_TIMEOUT)
+    return layout
+
+
+def invalidate_layout(screen_id):
+    cache.delete(LAYOUT_KEY % screen_id)
+
+
+def occupied_seats_from_db(showtime_id, now):
+    # Lượt giữ chỗ đang hiệu lực là nguồn dữ liệu gốc của tình trạng ghế.
+    # Lượt giữ đã quá hạn coi như đã trả ghế (dù lệnh expire_holds chưa chạy tới).
+    # Trả về (tập ghế, thời điểm lượt giữ gần nhất hết hạn)
+    holds = SeatReservation.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+        showtime_id=showtime_id, is_active=True,
+    ).values_list('seat_id', 'expires_at')
+    seat_ids = set()
+    valid_until = None
+    for seat_id, expires_at in holds:
+        seat_ids.add(seat_id)
+        if expires_at is not None and (valid_until is None or expires_at < valid_until):
+            valid_until = expires_at
+    return seat_ids, valid_until
+
+
+def build_occupancy(showtime_id, screen_id, version):
+    layout = get_layout(screen_id)
+    occupancy = Occupancy(showtime_id, version, layout, empty_bits(len(layout)))
+    seat_ids, occupancy.valid_until = occupied_seats_from_db(showtime_id, timezone.now())
+    occupancy.set(seat_ids)
+    cache.set(OCCUPANCY_KEY % showtime_id, occupancy.to_cache(), CACHE_TIMEOUT)
+    return occupancy
+
+
+def _is_fresh(cached, version, layout):
+    if cached is None or cached['version'] != version:
+        return False
+    if len(cached['bits']) != len(empty_bits(len(layout))):
+        return False
+    # Có lượt giữ ghế đã hết hạn kể từ lúc dựng bitmap
+    valid_until = cached.get('valid_until')
+    return valid_until is None or timezone.now() < valid_until
+
+
+def get_occupancy(showtime):
+    # showtime: đối tượng Showtime (đã có occupancy_version mới nhất từ DB)
+    layout = get_layout(showtime.screen_id)
+    cached = cache.get(OCCUPANCY_KEY % showtime.id)
+    if _is_fresh(cached, showtime.occupancy_version, layout):
+        return Occupancy(showtime.id, cached['version'], layout, cached['bits'], cached.get('valid_until'))
+    return build_occupancy(showtime.id, showtime.screen_id, showtime.occupancy_version)
+
+
+def apply_change(showtime_id, screen_id, seat_ids, occupied, new_version, expires_at=None):
+    # Cập nhật bitmap trong cache sau khi transaction đã commit.
+    # Chỉ áp dụng khi bản cache đúng là version ngay trước đó, nếu không thì xóa
+    # để lần đọc sau tự dựng lại từ DB.
+    key = OCCUPANCY_KEY % showtime_id
+    cached = cache.get(key)
+    if cached is None:
+        return
+    if cached['version'] != new_version - 1:
+        cache.delete(key)
+        return
+    occupancy = Occupancy(showtime_id, new_version, get_layout(screen_id), cached['bits'],
+                          cached.get('valid_until'))
+    occupancy.set(seat_ids, occupied)
+    if occupied and expires_at is not None:
+        if occupancy.valid_until is None or expires_at < occupancy.valid_until:
+            occupancy.valid_until = expires_at
+    cache.set(key, occupancy.to_cache(), CACHE_TIMEOUT)
+
+
+def invalidate(showtime_id):
+    cache.delete(OCCUPANCY_KEY % showtime_id)
+
+
+def invalidate_many(showtime_ids):
+    cache.delete_many([OCCUPANCY_KEY % showtime_id for showtime_id in showtime_ids])
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import Booking, OutboxEmail, Ticket
+from .transactions import write_atomic
+
+# Hộp thư đi cho email xác nhận.
+#
+# - pay_booking chỉ thêm một dòng OutboxEmail trong cùng transaction với việc thanh toán:
+#   không chờ SMTP trong request, và thanh toán rollback thì email cũng không có.
+# - Worker "manage.py send_emails --loop" lấy từng lô email đến hạn (khóa lô bằng cách dời
+#   run_after thêm LEASE_SECONDS để hai worker không gửi trùng), nạp đơn + suất chiếu + rạp +
+#   ghế cho cả lô bằng số truy vấn cố định, render rồi gửi qua MỘT kết nối SMTP dùng lại.
+# - Gửi lỗi thì thử lại sau 1, 2, 4... phút; quá MAX_ATTEMPTS lần thì đánh dấu FAILED.
+#   Worker chết giữa chừng thì email được gửi lại khi hết hạn khóa (ít nhất một lần).
+
+DEFAULT_BATCH_SIZE = 100
+MAX_ATTEMPTS = 6
+LEASE_SECONDS = 300
+
+# Loại email -> (tiêu đề, template HTML)
+TEMPLATES = {
+    'BOOKING_PAID': ('Cinema Pro - Xác nhận vé {booking.booking_code}', 'movies/email_template.html'),
+}
+
+
+def enqueue(kind, booking_ids):
+    # Email đã có (thanh toán bị gọi lại) thì bỏ qua
+    OutboxEmail.objects.bulk_create(
+        [OutboxEmail(kind=kind, booking_id=booking_id) for booking_id in booking_ids],
+        ignore_conflicts=True,
+    )
+
+
+def claim(batch_size):
+    now = timezone.now()
+    with write_atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status='PENDING', run_after__lte=now).order_by('run_after', 'id')[:batch_size])
+        if emails:
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]) \
+                .update(run_after=now + timedelta(seconds=LEASE_SECONDS))
+    return emails
+
+
+def load_bookings(booking_ids):
+    # Một truy vấn cho đơn + người đặt + phim + phòng + rạp, một truy vấn cho vé + ghế
+    tickets = Prefetch('tickets', queryset=Ticket.objects.select_related('seat').order_by('seat__row', 'seat__number'))
+    return Booking.objects.select_related('user', 'showtime__movie', 'showtime__screen__cinema') \
+        .prefetch_related(tickets).in_bulk(booking_ids)
+
+
+def _plain_text(html):
+    return '\n'.join(line.strip() for line in strip_tags(html).splitlines() if line.strip())
+
+
+def render(email, booking):
+    subject, template = TEMPLATES[email.kind]
+    html = render_to_string(template, {'booking': booking})
+    message = EmailMultiAlternatives(subject.format(booking=booking), _plain_text(html), to=[booking.user.email])
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _retry(email, exc, now):
+    email.attempts += 1
+    email.last_error = f'{type(exc).__name__}: {exc}'[:1000]
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = 'FAILED'
+    else:
+        email.run_after = now + timedelta(minutes=2 ** (email.attempts - 1))
+
+
+def deliver(batch_size=DEFAULT_BATCH_SIZE, connection=None):
+    # Gửi một lô email đến hạn. Trả về (số email đã gửi, số email lỗi)
+    emails = claim(batch_size)
+    if not emails:
+        return 0, 0
+    bookings = load_bookings({email.booking_id for email in emails})
+    own_connection = connection is None
+    connection = connection or get_connection()
+    now = timezone.now()
+    sent, failed = [], []
+    is_open = False
+    try:
+        for email in emails:
+            booking = bookings.get(email.booking_id)
+            if booking is None or not booking.user.email:
+                # Không thể gửi được: không thử lại
+                email.status = 'FAILED'
+                email.last_error = 'Người đặt không có địa chỉ email'
+                failed.append(email)
+                continue
+            try:
+                if not is_open:
+                    connection.open()
+                    is_open = True
+                connection.send_messages([render(email, booking)])
+            except Exception as exc:  # Lỗi SMTP/mạng/template: thử lại sau
+                _retry(email, exc, now)
+                failed.append(email)
+                # Kết nối có thể đã hỏng: email sau mở kết nối mới
+                connection.close()
+                is_open = False
+            else:
+                sent.append(email)
+    finally:
+        if own_connection:
+            connection.close()
+
+    if sent:
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in sent]) \
+            .update(status='SENT', sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='')
+    if failed:
+        OutboxEmail.objects.bulk_update(failed, ['status', 'attempts', 'last_error', 'run_after'])
+    return len(sent), len(failed)
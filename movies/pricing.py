@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Seat, TicketPrice
+
+# Bảng giá vé của từng suất chiếu, dùng chung cho trang chọn ghế và lúc đặt vé.
+#
+# - Bảng giá = {loại ghế: giá} cho mọi loại ghế, dựng một lần cho mỗi suất: giá nhập tay trong
+#   TicketPrice được ưu tiên, loại ghế chưa có giá thì tính theo quy tắc: giá cơ bản + phụ thu
+#   theo loại ghế, loại phòng và ngày cuối tuần (cấu hình ở PRICING trong settings).
+# - Bảng giá được cache theo suất chiếu kèm Showtime.price_version. Sửa TicketPrice/Showtime/Screen
+#   thì tăng price_version bằng UPDATE trong cùng transaction với thay đổi giá (signals.py): mọi
+#   tiến trình đọc suất chiếu sau khi commit đều thấy version mới, dùng khóa mới và dựng lại bảng.
+#   Bảng cũ (kể cả bị một request chạy chồng ghi lại vào cache) nằm ở khóa cũ, tự hết hạn.
+# - Cache còn thì tính tiền không cần truy vấn DB. Đổi PRICING thì bảng cũ hết hạn sau CACHE_TIMEOUT.
+
+PRICE_TABLE_KEY = 'price_table:%s:%s'
+CACHE_TIMEOUT = 60 * 60 * 6
+
+SEAT_TYPES = [code for code, _ in Seat.SEAT_TYPE_CHOICES]
+
+
+def _config():
+    config = {
+        # Phụ thu so với giá cơ bản
+        'SEAT_SURCHARGES': {'STANDARD': 0, 'VIP': 10000, 'COUPLE': 20000},
+        'SCREEN_SURCHARGES': {},  # vd {'IMAX': 30000, '4DX': 50000}
+        'WEEKEND_SURCHARGE': 0,
+        'WEEKEND_DAYS': (5, 6),  # Thứ bảy, chủ nhật (theo giờ địa phương của suất chiếu)
+    }
+    config.update(getattr(settings, 'PRICING', {}))
+    return config
+
+
+def rule_price(base_price, seat_type, screen_type=None, start_time=None):
+    # Giá theo quy tắc, dùng khi suất chiếu không có giá nhập tay cho loại ghế này
+    config = _config()
+    price = Decimal(base_price) + config['SEAT_SURCHARGES'].get(seat_type, 0)
+    price += config['SCREEN_SURCHARGES'].get(screen_type, 0)
+    if start_time is not None and timezone.localtime(start_time).weekday() in config['WEEKEND_DAYS']:
+        price += config['WEEKEND_SURCHARGE']
+    return price
+
+
+def compile_table(showtime):
+    # showtime cần base_price, start_time và screen (nên select_related('screen')). Một truy vấn
+    overrides = dict(TicketPrice.objects.filter(showtime_id=showtime.pk).values_list('seat_type', 'price'))
+    screen_type = showtime.screen.screen_type
+    prices = {seat_type: rule_price(showtime.base_price, seat_type, screen_type, showtime.start_time)
+              for seat_type in SEAT_TYPES}
+    prices.update(overrides)
+    return prices
+
+
+def _key(showtime):
+    # showtime cần price_version đọc từ DB cùng lúc với các cột giá
+    return PRICE_TABLE_KEY % (showtime.pk, showtime.price_version)
+
+
+def price_table(showtime):
+    key = _key(showtime)
+    prices = cache.get(key)
+    if prices is None:
+        prices = compile_table(showtime)
+        cache.set(key, prices, CACHE_TIMEOUT)
+    return prices
+
+
+async def aprice_table(showtime):
+    key = _key(showtime)
+    prices = await cache.aget(key)
+    if prices is None:
+        prices = await sync_to_async(compile_table)(showtime)
+        await cache.aset(key, prices, CACHE_TIMEOUT)
+    return prices
+
+
+def bump(showtimes):
+    # Gọi trong transaction đổi giá. showtimes: QuerySet Showtime cần đổi khóa bảng giá
+    showtimes.update(price_version=F('price_version') + 1)
@@ -0,0 +1,248 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.base import Template
+
+from .querybudget import record_queries
+
+# Đo hiệu năng một request theo yêu cầu, chỉ dành cho staff.
+#
+# Thêm ?_profile=1 vào URL (hoặc header X-Profile: 1) khi đang đăng nhập bằng tài khoản staff:
+# request đó chạy dưới cProfile, thời gian được tách thành DB / render template / Python,
+# trả về trong header Server-Timing + X-Profile-Id và lưu lại PROFILER['KEEP'] bản gần nhất
+# để tải về dạng .prof (cProfile/pstats) hoặc .folded (lấy mẫu ngăn xếp, cho flamegraph).
+# Khi không bật, middleware chỉ kiểm tra tham số query/header nên gần như không tốn gì.
+# Với view async (ASGI), cProfile và bộ lấy mẫu theo dõi luồng event loop: số liệu gồm cả
+# các request khác chạy xen kẽ trên cùng event loop, nên đo lúc ít tải.
+
+TRIGGER_PARAM = '_profile'
+TRIGGER_HEADER = 'HTTP_X_PROFILE'
+
+_ID_RE = re.compile(r'^[0-9]+-[0-9a-f]{6}$')
+
+_TEMPLATE_RENDER = Template.render.__code__
+
+# .prof: pstats (snakeviz, speedscope); .folded: flamegraph.pl / speedscope; .json: tóm tắt
+EXTENSIONS = ('prof', 'folded', 'json')
+
+
+def _config():
+    return {
+        'DIR': os.path.join(tempfile.gettempdir(), 'cinema_profiles'),
+        'KEEP': 20,
+        'SAMPLE_INTERVAL': 0.001,
+        **getattr(settings, 'PROFILER', {}),
+    }
+
+
+def _in_template(frame):
+    while frame is not None:
+        if frame.f_code is _TEMPLATE_RENDER:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class _DBTimer:
+    # Bộ ghi truy vấn (dạng execute_wrapper): tổng thời gian DB, tách riêng phần truy vấn
+    # phát sinh lúc render template
+    def __init__(self):
+        self.total = 0.0
+        self.in_template = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total += elapsed
+            self.queries += 1
+            if _in_template(sys._getframe()):
+                self.in_template += elapsed
+
+
+def _cumulative(stats, code):
+    key = (code.co_filename, code.co_firstlineno, code.co_name)
+    entry = stats.stats.get(key)
+    return entry[3] if entry else 0.0
+
+
+def _label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    # Lấy mẫu ngăn xếp của luồng đang xử lý request mỗi `interval` giây để vẽ flamegraph
+    # (cProfile chỉ lưu cặp hàm gọi -> hàm được gọi, không dựng lại được ngăn xếp thật)
+    def __init__(self, thread_id, stop_codes, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stop_codes = stop_codes
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code not in self.stop_codes:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        # Định dạng "folded" của flamegraph.pl / speedscope: "a;b;c <số mẫu>"
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+def _path(profile_id, extension):
+    return os.path.join(_config()['DIR'], f'{profile_id}.{extension}')
+
+
+def save_profile(profiler, sampler, request, summary):
+    config = _config()
+    os.makedirs(config['DIR'], exist_ok=True)
+    profile_id = f'{int(time.time() * 1000)}-{secrets.token_hex(3)}'
+    profiler.dump_stats(_path(profile_id, 'prof'))
+    with open(_path(profile_id, 'folded'), 'w') as folded:
+        folded.write(sampler.folded())
+    with open(_path(profile_id, 'json'), 'w') as meta:
+        json.dump({'id': profile_id, 'method': request.method, 'path': request.get_full_path(), **summary}, meta)
+
+    # Chỉ giữ KEEP bản mới nhất
+    for old in list_profiles()[config['KEEP']:]:
+        for extension in EXTENSIONS:
+            try:
+                os.remove(_path(old['id'], extension))
+            except FileNotFoundError:
+                pass
+    return profile_id
+
+
+def list_profiles():
+    directory = _config()['DIR']
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as meta:
+                    profiles.append(json.load(meta))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+
+def profile_file(profile_id, extension):
+    # Đường dẫn file của bản đo, None nếu id/định dạng không hợp lệ hoặc bản đo đã bị xóa
+    if not _ID_RE.match(profile_id) or extension not in EXTENSIONS:
+        return None
+    path = _path(profile_id, extension)
+    return path if os.path.exists(path) else None
+
+
+def is_requested(request):
+    # Đúng tham số _profile (không phải chuỗi con: ?q=_profile hay ?my_profile=1 không bật đo)
+    return TRIGGER_PARAM in request.GET or TRIGGER_HEADER in request.META
+
+
+class _ProfiledRun:
+    def __init__(self):
+        config = _config()
+        self.db = _DBTimer()
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), _STOP_CODES, config['SAMPLE_INTERVAL'])
+        self._recording = record_queries(self.db)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        self._recording.__enter__()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.sampler.stop()
+        self._recording.__exit__(*exc_info)
+        self.total = time.perf_counter() - self.started
+
+    def finish(self, request, response):
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        template = max(0.0, _cumulative(stats, _TEMPLATE_RENDER) - self.db.in_template)
+        summary = {
+            'total_ms': round(self.total * 1000, 2),
+            'db_ms': round(self.db.total * 1000, 2),
+            'template_ms': round(template * 1000, 2),
+            'python_ms': round(max(0.0, self.total - self.db.total - template) * 1000, 2),
+            'queries': self.db.queries,
+            'status': response.status_code,
+        }
+        profile_id = save_profile(self.profiler, self.sampler, request, summary)
+        response['X-Profile-Id'] = profile_id
+        response['Server-Timing'] = ', '.join([
+            f"db;dur={summary['db_ms']}",
+            f"template;dur={summary['template_ms']}",
+            f"python;dur={summary['python_ms']}",
+            f"total;dur={summary['total_ms']}",
+        ])
+        return response
+
+
+def _render(response):
+    # Response dạng template được render ở đây, phải đo cả phần này
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    return response
+
+
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not is_requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+        with _ProfiledRun() as run:
+            response = _render(self.get_response(request))
+        return run.finish(request, response)
+
+    async def __acall__(self, request):
+        if not is_requested(request) or not (await request.auser()).is_staff:
+            return await self.get_response(request)
+        with _ProfiledRun() as run:
+            response = _render(await self.get_response(request))
+        return run.finish(request, response)
+
+
+# Ngăn xếp lấy mẫu được cắt tại middleware (bỏ phần server/handler phía trên)
+_STOP_CODES = {ProfilerMiddleware.__call__.__code__, ProfilerMiddleware.__acall__.__code__}
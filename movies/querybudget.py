@@ -0,0 +1,169 @@
+import contextvars
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import LazyObject, empty
+
+# Đếm truy vấn theo từng request để bắt lỗi N+1 sớm.
+#
+# - QueryBudgetMiddleware ghi lại số truy vấn, tổng thời gian DB và các truy vấn lặp lại
+#   (cùng "dấu vân tay" SQL, chỉ khác tham số) của mỗi request, gắn vào request.query_stats,
+#   ghi log và trả về header X-Query-* / Server-Timing cho tài khoản staff.
+# - Mỗi view khai báo ngân sách bằng @query_budget(n); vượt ngân sách thì ghi log cảnh báo,
+#   còn bộ test (QueryBudgetTest) gọi từng view trong movies.urls và báo lỗi.
+# - Kết nối DB là riêng của từng luồng, còn view async chạy truy vấn ở luồng khác với middleware.
+#   Vì vậy mỗi kết nối được gắn sẵn một execute_wrapper chung (install, qua tín hiệu
+#   connection_created), ghi vào các bộ đếm đang bật trong contextvar của request;
+#   contextvar đi theo request sang cả luồng của sync_to_async.
+# - Header cho staff chỉ xét người dùng đã được nạp sẵn trong request (view/template đã đọc):
+#   middleware không tự nạp session + auth_user, nên request không cần tới user vẫn 0 truy vấn.
+
+logger = logging.getLogger('movies.queries')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)')
+
+
+def fingerprint(sql):
+    # Bỏ tham số để nhận ra cùng một câu truy vấn chạy lặp lại: "... WHERE id = 5" ~ "... WHERE id = 7"
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('(...)', sql)
+
+
+class QueryStats:
+    def __init__(self):
+        self.queries = []  # [(fingerprint, giây)]
+
+    def __call__(self, execute, sql, params, many, context):
+        # Dùng làm execute_wrapper của connection
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((fingerprint(sql), time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def duplicates(self, minimum=2):
+        # {dấu vân tay: số lần} của các câu SELECT chạy từ `minimum` lần trở lên (dấu hiệu N+1)
+        counts = Counter(sql for sql, _ in self.queries if sql.lstrip().upper().startswith('SELECT'))
+        return {sql: n for sql, n in counts.most_common() if n >= minimum}
+
+
+_recorders = contextvars.ContextVar('movies_query_recorders', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    for recorder in reversed(_recorders.get()):
+        execute = functools.partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+def install(db_connection):
+    if _dispatch not in db_connection.execute_wrappers:
+        db_connection.execute_wrappers.append(_dispatch)
+
+
+@contextmanager
+def record_queries(recorder=None):
+    # recorder: đối tượng có dạng execute_wrapper, mặc định là QueryStats mới
+    stats = recorder if recorder is not None else QueryStats()
+    install(connection)  # Kết nối của luồng hiện tại có thể đã mở trước khi có tín hiệu
+    token = _recorders.set(_recorders.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _recorders.reset(token)
+
+
+def query_budget(max_queries):
+    # Khai báo số truy vấn tối đa cho một view
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def get_budget(view_func):
+    return getattr(view_func, 'query_budget', None)
+
+
+def _config():
+    return {'DUPLICATE_THRESHOLD': 3, 'STAFF_HEADERS': True, **getattr(settings, 'QUERY_BUDGET', {})}
+
+
+def _loaded_user(request):
+    # Người dùng của request nếu đã được nạp, None nếu request.user vẫn còn lười (chưa truy vấn)
+    user = getattr(request, 'user', None)
+    if isinstance(user, LazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None:
+        user = getattr(request, '_cached_user', None) or getattr(request, '_acached_user', None)
+    return user
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with record_queries() as stats:
+            response = self.get_response(request)
+        self.report(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        with record_queries() as stats:
+            response = await self.get_response(request)
+        self.report(request, response, stats)
+        return response
+
+    def report(self, request, response, stats):
+        config = _config()
+        match = request.resolver_match
+        budget = get_budget(match.func) if match else None
+        request.query_stats = stats
+        request.query_budget = budget
+        duplicates = stats.duplicates(config['DUPLICATE_THRESHOLD'])
+        db_ms = stats.db_time * 1000
+
+        logger.debug('%s %s: %d truy vấn, %.1fms DB', request.method, request.path, stats.count, db_ms)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s %s vượt ngân sách truy vấn: %d > %d',
+                           request.method, request.path, stats.count, budget)
+        for sql, n in duplicates.items():
+            logger.warning('%s %s lặp %d lần: %s', request.method, request.path, n, sql[:300])
+
+        user = _loaded_user(request)
+        if config['STAFF_HEADERS'] and user is not None and user.is_staff:
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time-Ms'] = f'{db_ms:.1f}'
+            response['X-Query-Duplicates'] = str(sum(duplicates.values()))
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+            timing = f'queries;dur={db_ms:.1f};desc="{stats.count} queries"'
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
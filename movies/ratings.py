@@ -0,0 +1,68 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Movie, Review
+
+# Thống kê đánh giá tính sẵn trên Movie: số đánh giá, tổng điểm và số đánh giá theo từng mức sao.
+#
+# Mỗi lần tạo/sửa/xóa Review chỉ cộng/trừ chênh lệch bằng một câu UPDATE (F expression)
+# trong cùng transaction với thay đổi Review, nên trang phim không phải aggregate lại bảng Review.
+# Các thay đổi đi vòng qua signal (bulk_create, update()) thì chạy lệnh repair_review_stats.
+
+STARS = range(1, 6)
+
+
+def star_field(rating):
+    return f'review_star_{rating}'
+
+
+def apply_change(old=None, new=None):
+    # old/new: (movie_id, rating) trước và sau thay đổi, None nếu chưa có/đã bị xóa
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        movie_id, rating = state
+        movie_deltas = deltas.setdefault(movie_id, Counter())
+        movie_deltas['review_count'] += sign
+        movie_deltas['review_rating_sum'] += sign * rating
+        movie_deltas[star_field(rating)] += sign
+
+    for movie_id, changes in deltas.items():
+        changes = {field: F(field) + delta for field, delta in changes.items() if delta}
+        if changes:
+            Movie.objects.filter(pk=movie_id).update(**changes)
+
+
+def repair(movie_ids=None):
+    # Tính lại từ bảng Review, trả về số phim bị lệch đã được sửa
+    aggregates = {
+        'count': Count('id'),
+        'rating_sum': Sum('rating'),
+        **{f'star_{star}': Count('id', filter=Q(rating=star)) for star in STARS},
+    }
+    reviews = Review.objects.order_by().values('movie_id').annotate(**aggregates)
+    movies = Movie.objects.order_by('id')
+    if movie_ids is not None:
+        reviews = reviews.filter(movie_id__in=movie_ids)
+        movies = movies.filter(id__in=movie_ids)
+    actual = {row['movie_id']: row for row in reviews}
+
+    fields = ['review_count', 'review_rating_sum', *(star_field(star) for star in STARS)]
+    fixed = []
+    for movie in movies.only('id', *fields):
+        row = actual.get(movie.id, {})
+        expected = {
+            'review_count': row.get('count', 0),
+            'review_rating_sum': row.get('rating_sum') or 0,
+            **{star_field(star): row.get(f'star_{star}', 0) for star in STARS},
+        }
+        if any(getattr(movie, field) != value for field, value in expected.items()):
+            for field, value in expected.items():
+                setattr(movie, field, value)
+            fixed.append(movie)
+    with transaction.atomic():
+        Movie.objects.bulk_update(fixed, fields, batch_size=500)
+    return len(fixed)
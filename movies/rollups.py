@@ -0,0 +1,89 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Booking, RevenueRollup
+
+# Doanh thu tổng hợp sẵn cho trang thống kê.
+#
+# Mỗi đơn PAID được cộng vào 3 dòng (giờ, ngày, tháng theo giờ địa phương của created_at)
+# ứng với phim + rạp của suất chiếu. Hủy một đơn đã thanh toán thì trừ lại.
+# Lệnh rebuild_revenue_rollups dựng lại toàn bộ từ bảng Booking.
+
+GRANULARITIES = ['HOUR', 'DAY', 'MONTH']
+
+
+def bucket_starts(dt):
+    local = timezone.localtime(dt)
+    hour = local.replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    month = day.replace(day=1)
+    return {'HOUR': hour, 'DAY': day, 'MONTH': month}
+
+
+def period_range(year, month=None, day=None):
+    # [start, end) theo giờ địa phương
+    tz = timezone.get_current_timezone()
+    if day:
+        start = datetime(year, month, day, tzinfo=tz)
+        end = start + timedelta(days=1)
+    elif month:
+        start = datetime(year, month, 1, tzinfo=tz)
+        end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=tz)
+    else:
+        start = datetime(year, 1, 1, tzinfo=tz)
+        end = datetime(year + 1, 1, 1, tzinfo=tz)
+    return start, end
+
+
+def record_booking(booking, sign=1, tickets=None):
+    # Cộng (sign=1) hoặc trừ (sign=-1) một đơn đã thanh toán vào các bảng tổng hợp
+    showtime = booking.showtime
+    if tickets is None:
+        tickets = booking.tickets.count()
+    revenue = booking.total_amount * sign
+    tickets = tickets * sign
+
+    for granularity, period in bucket_starts(booking.created_at).items():
+        key = dict(granularity=granularity, period=period,
+                   movie_id=showtime.movie_id, cinema_id=showtime.screen.cinema_id)
+        updated = RevenueRollup.objects.filter(**key).update(
+            revenue=F('revenue') + revenue, tickets=F('tickets') + tickets, bookings=F('bookings') + sign
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                RevenueRollup.objects.create(revenue=revenue, tickets=tickets, bookings=sign, **key)
+        except IntegrityError:
+            # Có người vừa tạo dòng này, cộng dồn vào
+            RevenueRollup.objects.filter(**key).update(
+                revenue=F('revenue') + revenue, tickets=F('tickets') + tickets, bookings=F('bookings') + sign
+            )
+
+
+def rebuild(batch_size=2000):
+    # Dựng lại toàn bộ bảng tổng hợp từ các đơn PAID
+    totals = defaultdict(lambda: [Decimal(0), 0, 0])
+    paid = Booking.objects.filter(status='PAID').annotate(ticket_count=Count('tickets')).values_list(
+        'created_at', 'total_amount', 'ticket_count', 'showtime__movie_id', 'showtime__screen__cinema_id'
+    ).order_by()
+    for created_at, amount, ticket_count, movie_id, cinema_id in paid.iterator(chunk_size=batch_size):
+        for granularity, period in bucket_starts(created_at).items():
+            row = totals[(granularity, period, movie_id, cinema_id)]
+            row[0] += amount
+            row[1] += ticket_count
+            row[2] += 1
+
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        RevenueRollup.objects.bulk_create([
+            RevenueRollup(granularity=granularity, period=period, movie_id=movie_id, cinema_id=cinema_id,
+                          revenue=revenue, tickets=tickets, bookings=bookings)
+            for (granularity, period, movie_id, cinema_id), (revenue, tickets, bookings) in totals.items()
+        ], batch_size=batch_size)
+    return len(totals)
@@ -0,0 +1,236 @@
+import time
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from .models import Movie, Screen, Seat, Showtime, TicketPrice
+from . import catalog, pricing
+from .transactions import write_atomic
+
+# Xếp lịch chiếu hàng loạt theo kế hoạch tuần.
+#
+# - Kế hoạch (JSON): ngày đầu tuần, thời gian dọn phòng, giá vé mặc định và danh sách mục
+#   {phim (id hoặc slug), phòng, giờ chiếu}. Giờ kết thúc = giờ chiếu + Movie.duration; phòng
+#   chỉ nhận suất tiếp theo sau khi dọn xong (giờ kết thúc + thời gian dọn phòng).
+# - Trùng lịch được tìm riêng cho từng phòng: sắp xếp các suất (kế hoạch + suất đang hoạt động
+#   đã có trong DB) theo giờ chiếu rồi quét một lượt, giữ suất dọn xong muộn nhất -> O(n log n).
+# - Có trùng lịch thì chỉ báo cáo, không ghi gì. Không trùng thì tạo mọi suất chiếu và bảng giá
+#   bằng bulk_create trong một transaction, số truy vấn không phụ thuộc số suất.
+# - Chạy lại cùng kế hoạch không tạo trùng: suất đã có (cùng phim, phòng, giờ chiếu) được bỏ qua.
+
+CLEANING_MINUTES = 15
+
+# entry: vị trí mục trong kế hoạch (None với suất đã có trong DB, khi đó showtime_id là id của nó)
+Slot = namedtuple('Slot', 'entry showtime_id movie_id screen_id start end ready base_price prices')
+
+
+class PlanError(ValueError):
+    pass
+
+
+def _aware(value):
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def _price(value, where):
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        raise PlanError(f'{where}: giá vé "{value}" không hợp lệ')
+    if price < 0:
+        raise PlanError(f'{where}: giá vé không được âm')
+    return price
+
+
+def _prices(raw, where):
+    if not isinstance(raw, dict):
+        raise PlanError(f'{where}: prices phải là object {{loại ghế: giá}}')
+    seat_types = {code for code, _ in Seat.SEAT_TYPE_CHOICES}
+    unknown = set(raw) - seat_types
+    if unknown:
+        raise PlanError(f'{where}: loại ghế không hợp lệ: {", ".join(sorted(unknown))}')
+    return {seat_type: _price(price, where) for seat_type, price in raw.items()}
+
+
+def _starts(entry, week_start, where):
+    # 'starts': [thời điểm ISO] hoặc 'times': ["HH:MM"] chiếu vào các ngày 'days' (0 = week_start)
+    starts = []
+    for raw in entry.get('starts') or []:
+        value = parse_datetime(str(raw))
+        if value is None:
+            raise PlanError(f'{where}: giờ chiếu "{raw}" không hợp lệ')
+        starts.append(_aware(value))
+    times = entry.get('times') or []
+    if times:
+        if week_start is None:
+            raise PlanError(f'{where}: dùng times cần week_start trong kế hoạch')
+        days = entry.get('days', range(7))
+        if not all(isinstance(day, int) and 0 <= day < 7 for day in days):
+            raise PlanError(f'{where}: days phải là các số 0-6')
+        for raw in times:
+            value = parse_time(str(raw))
+            if value is None:
+                raise PlanError(f'{where}: giờ chiếu "{raw}" không hợp lệ')
+            starts += [_aware(datetime.combine(week_start + timedelta(days=day), value)) for day in days]
+    if not starts:
+        raise PlanError(f'{where}: thiếu starts hoặc times')
+    return starts
+
+
+def load_plan(plan):
+    # Kế hoạch -> danh sách Slot, mỗi suất chiếu một Slot. Một truy vấn cho phim, một cho phòng
+    if not isinstance(plan, dict) or not isinstance(plan.get('entries'), list):
+        raise PlanError('Kế hoạch phải là object có danh sách entries')
+    week_start = plan.get('week_start')
+    if week_start is not None:
+        try:
+            week_start = date.fromisoformat(str(week_start))
+        except ValueError:
+            raise PlanError(f'week_start "{week_start}" không hợp lệ')
+    entries = plan['entries']
+    if not all(isinstance(entry, dict) for entry in entries):
+        raise PlanError('Mỗi mục trong entries phải là một object')
+
+    refs = [entry.get('movie') for entry in entries]
+    ids = {ref for ref in refs if isinstance(ref, int)}
+    slugs = {ref for ref in refs if isinstance(ref, str)}
+    movies = {}
+    for movie_id, slug, duration in Movie.objects.filter(Q(pk__in=ids) | Q(slug__in=slugs)) \
+            .values_list('id', 'slug', 'duration'):
+        movies[movie_id] = movies[slug] = (movie_id, duration)
+    screens = dict(Screen.objects.filter(pk__in={entry.get('screen') for entry in entries})
+                   .values_list('id', 'is_active'))
+
+    now = timezone.now()
+    slots = []
+    for i, entry in enumerate(entries):
+        where = f'Mục {i + 1}'
+        if entry.get('movie') not in movies:
+            raise PlanError(f'{where}: không tìm thấy phim "{entry.get("movie")}"')
+        movie_id, duration = movies[entry['movie']]
+        if not duration or duration <= 0:
+            raise PlanError(f'{where}: phim chưa có thời lượng')
+        screen_id = entry.get('screen')
+        if screen_id not in screens:
+            raise PlanError(f'{where}: không tìm thấy phòng {screen_id}')
+        if not screens[screen_id]:
+            raise PlanError(f'{where}: phòng {screen_id} đang ngừng hoạt động')
+        base_price = entry.get('base_price', plan.get('base_price'))
+        if base_price is None:
+            raise PlanError(f'{where}: thiếu base_price')
+        base_price = _price(base_price, where)
+        prices = {**_prices(plan.get('prices', {}), 'Kế hoạch'), **_prices(entry.get('prices', {}), where)}
+        cleaning = entry.get('cleaning_minutes', plan.get('cleaning_minutes', CLEANING_MINUTES))
+        if not isinstance(cleaning, int) or cleaning < 0:
+            raise PlanError(f'{where}: cleaning_minutes phải là số phút không âm')
+        for start in _starts(entry, week_start, where):
+            if start <= now:
+                raise PlanError(f'{where}: giờ chiếu {timezone.localtime(start):%d/%m/%Y %H:%M} đã qua')
+            end = start + timedelta(minutes=duration)
+            slots.append(Slot(i, None, movie_id, screen_id, start, end, end + timedelta(minutes=cleaning),
+                              base_price, prices))
+    return slots
+
+
+def existing_showtimes(slots, cleaning=CLEANING_MINUTES):
+    # Suất đang hoạt động trong DB có thể chạm vào các suất kế hoạch (một truy vấn)
+    if not slots:
+        return []
+    buffer = timedelta(minutes=cleaning)
+    rows = Showtime.objects.filter(
+        screen_id__in={slot.screen_id for slot in slots}, is_active=True,
+        start_time__lt=max(slot.ready for slot in slots),
+        end_time__gt=min(slot.start for slot in slots) - buffer,
+    ).order_by().values_list('id', 'movie_id', 'screen_id', 'start_time', 'end_time')
+    return [Slot(None, showtime_id, movie_id, screen_id, start, end, end + buffer, None, None)
+            for showtime_id, movie_id, screen_id, start, end in rows]
+
+
+def find_conflicts(slots, existing=()):
+    # [(suất, suất bị chồng lấn)]; chỉ báo các cặp có ít nhất một suất trong kế hoạch
+    by_screen = defaultdict(list)
+    for slot in list(slots) + list(existing):
+        by_screen[slot.screen_id].append(slot)
+    conflicts = []
+    for screen_slots in by_screen.values():
+        # Cùng giờ chiếu: suất có sẵn đứng trước để suất kế hoạch bị báo trùng với nó
+        screen_slots.sort(key=lambda slot: (slot.start, slot.entry is not None))
+        latest = None  # Suất dọn xong muộn nhất trong các suất đã duyệt
+        for slot in screen_slots:
+            if latest is not None and slot.start < latest.ready \
+                    and (slot.entry is not None or latest.entry is not None):
+                conflicts.append((slot, latest))
+            if latest is None or slot.ready > latest.ready:
+                latest = slot
+    return conflicts
+
+
+def _drop_scheduled(slots, existing):
+    # Suất đã có đúng phim + phòng + giờ chiếu (chạy lại kế hoạch): bỏ khỏi danh sách cần tạo
+    scheduled = {(slot.movie_id, slot.screen_id, slot.start) for slot in existing}
+    return [slot for slot in slots if (slot.movie_id, slot.screen_id, slot.start) not in scheduled]
+
+
+def create_showtimes(slots):
+    # Tạo suất chiếu + bảng giá cho mọi loại ghế có trong phòng (giá kế hoạch, không có thì theo quy tắc
+    # của pricing.py); số ghế và loại phòng đọc một lần cho mọi phòng
+    seat_counts = defaultdict(dict)
+    screen_types = {}
+    for screen_id, screen_type, seat_type, n in Seat.objects.filter(screen_id__in={slot.screen_id for slot in slots}) \
+            .order_by().values('screen_id', 'screen__screen_type', 'seat_type').annotate(n=Count('id')) \
+            .values_list('screen_id', 'screen__screen_type', 'seat_type', 'n'):
+        seat_counts[screen_id][seat_type] = n
+        screen_types[screen_id] = screen_type
+    showtimes = Showtime.objects.bulk_create([
+        Showtime(movie_id=slot.movie_id, screen_id=slot.screen_id, start_time=slot.start, end_time=slot.end,
+                 base_price=slot.base_price, capacity=sum(seat_counts[slot.screen_id].values()))
+        for slot in slots
+    ])
+    TicketPrice.objects.bulk_create([
+        TicketPrice(showtime=showtime, seat_type=seat_type,
+                    price=slot.prices[seat_type] if seat_type in slot.prices else pricing.rule_price(
+                        slot.base_price, seat_type, screen_types[slot.screen_id], slot.start))
+        for slot, showtime in zip(slots, showtimes)
+        for seat_type in sorted(seat_counts[slot.screen_id])
+    ])
+    # bulk_create không phát post_save: tự làm mới cache trang chủ
+    transaction.on_commit(catalog.invalidate)
+    return showtimes
+
+
+def schedule(plan, dry_run=False):
+    # Trả về {'planned', 'created', 'skipped', 'conflicts', 'seconds'}; có trùng lịch thì không ghi gì
+    started = time.perf_counter()
+    with write_atomic():
+        slots = load_plan(plan)
+        # Khóa các phòng trong kế hoạch: hai lần xếp lịch cùng lúc không chen suất vào nhau
+        list(Screen.objects.select_for_update().filter(pk__in={slot.screen_id for slot in slots})
+             .values_list('id', flat=True))
+        existing = existing_showtimes(slots, plan.get('cleaning_minutes', CLEANING_MINUTES))
+        todo = _drop_scheduled(slots, existing)
+        conflicts = find_conflicts(todo, existing)
+        created = []
+        if todo and not conflicts and not dry_run:
+            created = create_showtimes(todo)
+    return {
+        'planned': len(slots),
+        'created': len(created),
+        'skipped': len(slots) - len(todo),
+        'conflicts': conflicts,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def overlapping(screen_id, start, end, exclude=None, cleaning=CLEANING_MINUTES):
+    # Suất đang hoạt động của phòng chồng lấn khoảng [start, end) (tính cả thời gian dọn phòng)
+    buffer = timedelta(minutes=cleaning)
+    showtimes = Showtime.objects.filter(screen_id=screen_id, is_active=True,
+                                        start_time__lt=end + buffer, end_time__gt=start - buffer)
+    if exclude is not None:
+        showtimes = showtimes.exclude(pk=exclude)
+    return showtimes
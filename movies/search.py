@@ -0,0 +1,153 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Movie
+
+# Chỉ mục tìm kiếm phim (tên, đạo diễn, diễn viên, thể loại).
+#
+# Văn bản được "gập dấu" trước khi đưa vào chỉ mục và trước khi tìm,
+# nên "nha ba nu" khớp với "Nhà Bà Nữ". Trên SQLite dùng bảng ảo FTS5
+# (xếp hạng bằng bm25), các CSDL khác tạm dùng icontains.
+
+INDEX_TABLE = 'movies_movie_search'
+
+# Trọng số bm25 cho các cột: title, director, actors (diễn viên), genres
+RANK_WEIGHTS = (10.0, 3.0, 2.0, 1.0)
+
+DEFAULT_LIMIT = 100
+
+# Chỉ xếp hạng bm25 khi số kết quả khớp không vượt quá ngưỡng này
+RANK_CANDIDATES = 2000
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text):
+    # Bỏ dấu tiếng Việt: "Nhà Bà Nữ" -> "nha ba nu", "Đà Lạt" -> "da lat"
+    text = (text or '').lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+        "title, director, actors, genres, is_active UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+
+
+def drop_index(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+def build_row(movie_id, title, director, cast, genre_names, is_active):
+    return (movie_id, fold(title), fold(director), fold(cast), fold(' '.join(genre_names)), int(is_active))
+
+
+def write_rows(cursor, rows):
+    cursor.executemany(
+        f"INSERT INTO {INDEX_TABLE} (rowid, title, director, actors, genres, is_active) VALUES (%s, %s, %s, %s, %s, %s)",
+        rows,
+    )
+
+
+def index_movies(movie_ids):
+    # Cập nhật lại chỉ mục cho các phim (xóa dòng cũ rồi ghi dòng mới)
+    if not is_enabled():
+        return
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+    movies = Movie.objects.filter(id__in=movie_ids).prefetch_related('genres')
+    rows = [build_row(m.id, m.title, m.director, m.cast, [g.name for g in m.genres.all()], m.is_active)
+            for m in movies]
+    with connection.cursor() as cursor:
+        remove_movies(movie_ids, cursor)
+        write_rows(cursor, rows)
+
+
+def remove_movies(movie_ids, cursor=None):
+    if not is_enabled():
+        return
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(movie_ids))
+    sql = f"DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})"
+    if cursor is not None:
+        cursor.execute(sql, movie_ids)
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, movie_ids)
+
+
+def rebuild(batch_size=2000):
+    if not is_enabled():
+        return 0
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            batch = Movie.objects.filter(id__in=ids[start:start + batch_size]).prefetch_related('genres')
+            rows = [build_row(m.id, m.title, m.director, m.cast, [g.name for g in m.genres.all()], m.is_active)
+                    for m in batch]
+            write_rows(cursor, rows)
+            total += len(rows)
+    return total
+
+
+def match_expression(query):
+    # Mỗi từ là một tiền tố, tất cả các từ phải xuất hiện: "nha" "ba" "nu" -> "nha"* "ba"* "nu"*
+    return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+
+def search_movie_ids(query, active_only=True, limit=DEFAULT_LIMIT):
+    # Trả về danh sách id phim đã xếp hạng (phù hợp nhất trước)
+    if not is_enabled():
+        movies = Movie.objects.filter(Q(title__icontains=query) | Q(director__icontains=query))
+        if active_only:
+            movies = movies.filter(is_active=True)
+        return list(movies.values_list('id', flat=True)[:limit])
+
+    expression = match_expression(query)
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        # Xếp hạng bm25 phải tính cho mọi dòng khớp; với từ khóa quá chung (vd "ph" trên 100k phim)
+        # thì bỏ xếp hạng, lấy phim mới thêm gần nhất trước để giữ độ trễ vài ms.
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT 1 FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s LIMIT %s)",
+            [expression, RANK_CANDIDATES + 1],
+        )
+        if cursor.fetchone()[0] > RANK_CANDIDATES:
+            order_by = 'rowid DESC'
+        else:
+            order_by = f"bm25({INDEX_TABLE}, {', '.join(str(w) for w in RANK_WEIGHTS)})"
+
+        sql = f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s"
+        if active_only:
+            sql += " AND is_active = 1"
+        cursor.execute(f"{sql} ORDER BY {order_by} LIMIT %s", [expression, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_movies(queryset, query, limit=DEFAULT_LIMIT):
+    # Lọc queryset theo kết quả tìm kiếm và giữ thứ tự xếp hạng
+    ids = search_movie_ids(query, limit=limit)
+    rank = {movie_id: position for position, movie_id in enumerate(ids)}
+    movies = list(queryset.filter(id__in=ids))
+    movies.sort(key=lambda movie: rank[movie.id])
+    return movies
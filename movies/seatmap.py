@@ -0,0 +1,92 @@
+import base64
+import zlib
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Seat, Showtime
+from . import occupancy
+
+# API sơ đồ ghế gọn cho app/trình duyệt hỏi lại liên tục (GET /api/showtimes/<id>/seats/).
+#
+# - layout: danh sách ghế [id, hàng, số, loại] theo đúng thứ tự bit của bitmap, cache theo phòng.
+# - occupied: bitmap ghế đã có người giữ/mua (base64, bit i = ghế thứ i của layout, bit thấp trước).
+# - ETag = occupancy_version + CRC của bitmap. Mỗi lần trả bản đầy đủ (đã đối chiếu version
+#   với DB) thì ETag được ghi lại VERIFY_SECONDS giây; trong thời gian đó nếu bitmap trong cache
+#   vẫn cho ra đúng ETag ấy thì trả 304 mà không chạm DB. Đặt/hủy/hết hạn đều vá hoặc xóa bitmap
+#   trong cache nên ETag đổi ngay; VERIFY_SECONDS chỉ giới hạn độ trễ trong trường hợp hiếm
+#   (hai tiến trình ghi cache chồng nhau).
+
+LAYOUT_PAYLOAD_KEY = 'seatmap_layout:%s'
+VERIFIED_KEY = 'seatmap_etag:%s'
+VERIFY_SECONDS = 10
+
+
+def layout_payload(screen_id):
+    key = LAYOUT_PAYLOAD_KEY % screen_id
+    layout = cache.get(key)
+    if layout is None:
+        seats = Seat.objects.filter(screen_id=screen_id).order_by('row', 'number').values_list(
+            'id', 'row', 'number', 'seat_type')
+        layout = [list(seat) for seat in seats]
+        cache.set(key, layout, occupancy.CACHE_TIMEOUT)
+    return layout
+
+
+def invalidate_layout(screen_id):
+    cache.delete(LAYOUT_PAYLOAD_KEY % screen_id)
+
+
+def make_etag(version, bits):
+    return f'"{version}-{zlib.crc32(bits):08x}"'
+
+
+def _keys(showtime_id):
+    return [VERIFIED_KEY % showtime_id, occupancy.OCCUPANCY_KEY % showtime_id]
+
+
+def cached_etag(showtime_id):
+    # ETag chỉ từ cache (không truy vấn DB), None nếu không chắc bitmap còn đúng
+    return _verified_etag(showtime_id, cache.get_many(_keys(showtime_id)))
+
+
+async def acached_etag(showtime_id):
+    return _verified_etag(showtime_id, await cache.aget_many(_keys(showtime_id)))
+
+
+def _verified_etag(showtime_id, values):
+    etag = values.get(VERIFIED_KEY % showtime_id)
+    cached = values.get(occupancy.OCCUPANCY_KEY % showtime_id)
+    if etag is None or cached is None:
+        return None
+    valid_until = cached.get('valid_until')
+    if valid_until is not None and timezone.now() >= valid_until:
+        return None  # Có lượt giữ ghế vừa hết hạn, bitmap phải dựng lại
+    if make_etag(cached['version'], cached['bits']) != etag:
+        return None
+    return etag
+
+
+def seat_map(showtime_id):
+    # Trả về (payload, etag); Showtime.DoesNotExist nếu không có suất chiếu
+    showtime = Showtime.objects.only('id', 'screen_id', 'occupancy_version').get(pk=showtime_id)
+    seats = occupancy.get_occupancy(showtime)
+    layout = layout_payload(showtime.screen_id)
+    if len(layout) != len(seats.layout):
+        # Sơ đồ phòng vừa đổi giữa 2 lần đọc cache: dựng lại cả hai
+        occupancy.invalidate_layout(showtime.screen_id)
+        invalidate_layout(showtime.screen_id)
+        seats = occupancy.build_occupancy(showtime.id, showtime.screen_id, showtime.occupancy_version)
+        layout = layout_payload(showtime.screen_id)
+
+    etag = make_etag(seats.version, bytes(seats.bits))
+    cache.set(VERIFIED_KEY % showtime_id, etag, VERIFY_SECONDS)
+    payload = {
+        'showtime': showtime.id,
+        'screen': showtime.screen_id,
+        'version': seats.version,
+        'layout': layout,
+        'occupied': base64.b64encode(bytes(seats.bits)).decode(),
+        'available': len(layout) - seats.count(),
+    }
+    return payload, etag
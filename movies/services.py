@@ -1,81 +1,168 @@
 from django.db import transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from datetime import timedelta
-from .models import Booking, Ticket, Seat, Showtime, TicketPrice, Concession, BookingConcession
+from .models import (
+    Booking, Ticket, Seat, Showtime, Concession, BookingConcession
+)
+from . import counters, holds, live, occupancy, outbox, pricing, rollups
+from .transactions import write_atomic
 import uuid
 
 
 def get_occupied_seats(showtime_id):
-    sold_seats = Ticket.objects.filter(
-        booking__showtime_id=showtime_id,
-        booking__status__in=['PAID', 'PENDING']
-    ).values_list('seat_id', flat=True)
-    return set(sold_seats)
+    showtime = Showtime.objects.only('id', 'screen_id', 'occupancy_version').get(pk=showtime_id)
+    return occupancy.get_occupancy(showtime).occupied_seat_ids()
 
 
-@transaction.atomic
+class SeatTakenError(ValidationError):
+    # Ghế đã có người khác giữ chỗ
+    def __init__(self, seats):
+        self.seats = list(seats)
+        names = ", ".join(f"{seat.row}{seat.number}" for seat in self.seats)
+        super().__init__(f"Ghế {names} vừa có người khác đặt!")
+
+
+def _bump_occupancy(showtime_id, screen_id, seat_ids, old_status, new_status, expires_at=None):
+    # Tăng version ngay trong transaction đổi ghế (cùng commit, như holds._expire_locked): tiến trình
+    # chết sau commit thì bitmap cũ trong cache cũng không còn khớp version. Chỉ việc vá bitmap trong
+    # cache và báo cho người đang xem sơ đồ ghế là chạy sau khi commit.
+    #
+    # Bộ đếm ghế và version đi chung một UPDATE dòng Showtime, gọi ở cuối transaction: dòng suất
+    # chiếu (mọi đơn của suất đều ghi vào) chỉ bị khóa từ câu lệnh này tới lúc commit.
+    seat_ids = list(seat_ids)
+    occupied = new_status in occupancy.ACTIVE_BOOKING_STATUSES
+    if not occupied:
+        state = live.RELEASED
+    else:
+        state = live.HELD if expires_at is not None else live.SOLD
+
+    counters.move(showtime_id, len(seat_ids), old_status, new_status,
+                  occupancy_version=F('occupancy_version') + 1)
+    # Dòng đang bị khóa bởi UPDATE trên: đọc đúng version của chính thay đổi này
+    new_version = Showtime.objects.filter(pk=showtime_id).values_list('occupancy_version', flat=True).first()
+
+    def apply():
+        occupancy.apply_change(showtime_id, screen_id, seat_ids, occupied, new_version, expires_at)
+        live.publish(showtime_id, new_version, state, seat_ids, expires_at)
+
+    transaction.on_commit(apply)
+
+
+@write_atomic()
 def create_booking(user, showtime_id, seat_ids, concession_data=None):
-    # 1. Lấy suất chiếu và khóa dòng (nếu DB hỗ trợ)
+    # 1. Lấy suất chiếu (không khóa dòng, xung đột được phát hiện theo từng ghế)
     try:
-        showtime = Showtime.objects.select_for_update().get(id=showtime_id)
+        showtime = Showtime.objects.select_related('screen').get(id=showtime_id)
     except Showtime.DoesNotExist:
         raise ValidationError("Suất chiếu không tồn tại!")
 
-    # 2. Kiểm tra ghế đã bị đặt chưa
-    occupied_seats = get_occupied_seats(showtime_id)
-    seats_to_book = Seat.objects.filter(id__in=seat_ids, screen=showtime.screen)
+    # 2. Kiểm tra nhanh trên bitmap để báo lỗi sớm, không cần ghi gì vào DB
+    seat_map = occupancy.get_occupancy(showtime)
+    seats_to_book = list(Seat.objects.filter(id__in=seat_ids, screen_id=showtime.screen_id))
 
     if len(seats_to_book) != len(seat_ids):
         raise ValidationError("Danh sách ghế không hợp lệ!")
 
-    for seat in seats_to_book:
-        if seat.id in occupied_seats:
-            raise ValidationError(f"Ghế {seat.row}{seat.number} vừa có người khác đặt!")
+    taken = [seat for seat in seats_to_book if seat_map.is_occupied(seat.id)]
+    if taken:
+        raise SeatTakenError(taken)
 
-    ticket_prices = TicketPrice.objects.filter(showtime=showtime)
-    price_map = {tp.seat_type: tp.price for tp in ticket_prices}
+    # 3. Tính tiền trước khi ghi gì vào DB (bảng giá của suất chiếu nằm trong cache, xem pricing.py)
+    prices = pricing.price_table(showtime)
+    seat_prices = [(seat, prices[seat.seat_type]) for seat in seats_to_book]
 
-    # 3. Tạo Booking
+    concession_items = []
+    if concession_data:
+        # Lấy tất cả combo có trong danh sách đặt để lấy giá
+        concessions = Concession.objects.filter(id__in=concession_data.keys())
+        for item in concessions:
+            quantity = concession_data.get(item.id)
+            if quantity > 0:
+                concession_items.append((item, quantity))
+
+    total_amount = sum(price for _, price in seat_prices)
+    total_amount += sum(item.price * quantity for item, quantity in concession_items)
+
+    # 4. Tạo Booking (một lần, đã có tổng tiền)
     booking = Booking.objects.create(
         user=user,
         showtime=showtime,
         booking_code=str(uuid.uuid4())[:8].upper(),
         status='PENDING',
-        expires_at=timezone.now() + timedelta(minutes=15),
-        total_amount=0
+        expires_at=timezone.now() + holds.hold_ttl(),
+        total_amount=total_amount
     )
 
-    total_amount = 0
-    for seat in seats_to_book:
+    # 5. Giữ chỗ từng ghế có thời hạn (chỗ kiểm tra trùng ghế thực sự)
+    try:
+        holds.place_holds(booking, seats_to_book)
+    except holds.SeatsUnavailable as e:
+        raise SeatTakenError([seat for seat in seats_to_book if seat.id in e.seat_ids] or seats_to_book)
 
-        price = price_map.get(seat.seat_type)
+    # 6. Ghi vé và combo hàng loạt
+    Ticket.objects.bulk_create([
+        Ticket(booking=booking, seat=seat, price=price) for seat, price in seat_prices
+    ])
+    if concession_items:
+        BookingConcession.objects.bulk_create([
+            BookingConcession(booking=booking, concession=item, quantity=quantity)
+            for item, quantity in concession_items
+        ])
 
-        if price is None:
-            # Logic dự phòng (Fallback) nếu Admin quên nhập bảng giá
-            price = showtime.base_price
-            if seat.seat_type == 'VIP':
-                price += 10000
-            elif seat.seat_type == 'COUPLE':
-                price += 20000
+    # 7. Bộ đếm ghế + version sơ đồ ghế (cuối cùng, xem _bump_occupancy), bitmap vá sau khi commit
+    _bump_occupancy(showtime.id, showtime.screen_id, [seat.id for seat in seats_to_book], None, 'PENDING',
+                    expires_at=booking.expires_at)
 
-        total_amount += price
-        Ticket.objects.create(booking=booking, seat=seat, price=price)
-    if concession_data:
-        # Lấy tất cả combo có trong danh sách đặt để lấy giá
-        concessions = Concession.objects.filter(id__in=concession_data.keys())
-        for item in concessions:
-            quantity = concession_data.get(item.id)
-            if quantity > 0:
-                # Cộng tiền
-                total_amount += item.price * quantity
-                # Tạo chi tiết combo
-                BookingConcession.objects.create(
-                    booking=booking,
-                    concession=item,
-                    quantity=quantity
-                )
-    booking.total_amount = total_amount
-    booking.save()
-
-    return booking
\ No newline at end of file
+    return booking
+
+
+@write_atomic()
+def release_booking(booking, status):
+    # Hủy (CANCELLED) hoặc hết hạn (EXPIRED) một đơn hàng và trả ghế lại
+    booking = Booking.objects.select_for_update(of=('self',)).select_related('showtime__screen').get(pk=booking.pk)
+    if booking.status not in occupancy.ACTIVE_BOOKING_STATUSES:
+        return booking
+
+    seat_ids = list(booking.tickets.values_list('seat_id', flat=True))
+    if booking.status == 'PAID':
+        rollups.record_booking(booking, sign=-1, tickets=len(seat_ids))
+    old_status = booking.status
+    booking.status = status
+    booking.save(update_fields=['status'])
+
+    holds.release_holds(booking)
+    _bump_occupancy(booking.showtime_id, booking.showtime.screen_id, seat_ids, old_status, status)
+    return booking
+
+
+def cancel_booking(booking):
+    return release_booking(booking, 'CANCELLED')
+
+
+def expire_booking(booking):
+    return release_booking(booking, 'EXPIRED')
+
+
+def pay_booking(booking, payment_method=''):
+    with write_atomic():
+        booking = Booking.objects.select_for_update(of=('self',)).select_related('showtime__screen').get(pk=booking.pk)
+        if booking.status != 'PENDING':
+            return booking
+        if booking.expires_at > timezone.now():
+            booking.status = 'PAID'
+            booking.paid_at = timezone.now()
+            booking.payment_method = payment_method
+            booking.save(update_fields=['status', 'paid_at', 'payment_method'])
+            holds.confirm_holds(booking)
+            seat_ids = list(booking.tickets.values_list('seat_id', flat=True))
+            rollups.record_booking(booking, tickets=len(seat_ids))
+            # Email xác nhận do worker send_emails gửi, không chờ SMTP trong request
+            outbox.enqueue('BOOKING_PAID', [booking.pk])
+            # Ghế vẫn bị chiếm (bitmap không đổi) nhưng chuyển từ "đang giữ" sang "đã bán"
+            _bump_occupancy(booking.showtime_id, booking.showtime.screen_id, seat_ids, 'PENDING', 'PAID')
+            return booking
+
+    # Quá hạn giữ ghế: trả ghế thay vì nhận thanh toán
+    holds.expire_bookings([booking.pk])
+    raise ValidationError("Đơn hàng đã hết thời gian giữ ghế, vui lòng đặt lại!")
@@ -0,0 +1,161 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from .models import Concession, Genre, Movie, Review, Screen, Seat, Showtime, TicketPrice
+from . import catalog, images, occupancy, pricing, querybudget, ratings, search, seatmap, suggest
+
+
+# Mọi kết nối DB (kể cả kết nối ở luồng chạy ORM cho view async) đều được đếm truy vấn
+@receiver(connection_created)
+def track_queries(sender, connection, **kwargs):
+    querybudget.install(connection)
+
+
+# Sơ đồ ghế của phòng thay đổi => vị trí bit trong bitmap thay đổi,
+# phải bỏ layout cũ và làm cũ bitmap của mọi suất chiếu trong phòng.
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def seat_layout_changed(sender, instance, **kwargs):
+    occupancy.invalidate_layout(instance.screen_id)
+    seatmap.invalidate_layout(instance.screen_id)
+    showtimes = Showtime.objects.filter(screen_id=instance.screen_id)
+    showtime_ids = list(showtimes.values_list('id', flat=True))
+    showtimes.update(
+        occupancy_version=F('occupancy_version') + 1,
+        capacity=Seat.objects.filter(screen_id=instance.screen_id).count(),
+    )
+    # Bitmap trong cache phải theo kịp version mới (API sơ đồ ghế tin cache khi trả 304)
+    occupancy.invalidate_many(showtime_ids)
+
+
+# Suất chiếu sửa trong Admin (có thể đổi phòng) => bỏ bitmap cũ, đếm lại số ghế theo phòng
+# (Showtime.save không ghi capacity của bản trong bộ nhớ)
+@receiver(post_save, sender=Showtime)
+def showtime_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not created and not raw:
+        if update_fields is None or 'screen' in update_fields:
+            Showtime.objects.filter(pk=instance.pk).update(
+                capacity=Seat.objects.filter(screen_id=instance.screen_id).count()
+            )
+        transaction.on_commit(lambda: occupancy.invalidate(instance.id))
+
+
+# --- Bảng giá vé đã dựng sẵn (movies/pricing.py) ---
+
+@receiver(post_save, sender=Showtime)
+def showtime_price_changed(sender, instance, created, raw=False, **kwargs):
+    # Giá cơ bản, giờ chiếu (cuối tuần) hoặc phòng có thể đã đổi
+    if not created and not raw:
+        pricing.bump(Showtime.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=TicketPrice)
+@receiver(post_delete, sender=TicketPrice)
+def ticket_price_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pricing.bump(Showtime.objects.filter(pk=instance.showtime_id))
+
+
+@receiver(post_save, sender=Screen)
+def screen_type_changed(sender, instance, created, raw=False, **kwargs):
+    # Phụ thu theo loại phòng: đổi khóa bảng giá của mọi suất trong phòng (một câu UPDATE)
+    if not created and not raw:
+        pricing.bump(Showtime.objects.filter(screen_id=instance.pk))
+
+
+# --- Chỉ mục tìm kiếm phim ---
+
+def _reindex(movie_ids):
+    movie_ids = list(movie_ids)
+    transaction.on_commit(lambda: search.index_movies(movie_ids))
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reindex([instance.pk])
+        transaction.on_commit(suggest.invalidate)
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    search.remove_movies([instance.pk])
+    transaction.on_commit(suggest.invalidate)
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            _reindex([instance.pk])
+    elif action == 'pre_clear':
+        # Gỡ hết phim khỏi một thể loại: lấy danh sách phim trước khi xóa
+        _reindex(instance.movies.values_list('pk', flat=True))
+    elif action != 'post_clear':
+        _reindex(pk_set)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, raw=False, **kwargs):
+    # Đổi tên thể loại => cập nhật các phim thuộc thể loại đó
+    if not created and not raw:
+        _reindex(instance.movies.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleted(sender, instance, **kwargs):
+    _reindex(instance.movies.values_list('pk', flat=True))
+
+
+# --- Cache danh sách phim trang chủ ---
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Showtime)
+@receiver(post_delete, sender=Showtime)
+@receiver(m2m_changed, sender=Movie.genres.through)
+def catalog_changed(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(catalog.invalidate)
+
+
+# --- Ảnh thu nhỏ: xếp việc cho worker process_images, không resize trong request ---
+
+@receiver(post_save, sender=Movie)
+def movie_poster_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.enqueue_if_stale(instance, 'poster')
+
+
+@receiver(post_save, sender=Concession)
+def concession_image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.enqueue_if_stale(instance, 'image')
+
+
+# --- Thống kê đánh giá trên Movie ---
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, raw=False, **kwargs):
+    # Nhớ phim + điểm cũ để chỉ cộng/trừ phần chênh lệch sau khi lưu
+    instance._previous_rating = None
+    if not raw and not instance._state.adding:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('movie_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ratings.apply_change(getattr(instance, '_previous_rating', None), (instance.movie_id, instance.rating))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.apply_change((instance.movie_id, instance.rating), None)
@@ -0,0 +1,58 @@
+import re
+from collections import defaultdict
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+# Sinh slug không trùng cho nhiều tiêu đề cùng lúc.
+#
+# Slug trùng được đánh số như trước: "nha-ba-nu", "nha-ba-nu-1", "nha-ba-nu-2"...
+# Mọi slug đã dùng của cả lô được lấy bằng MỘT truy vấn cho mỗi RANGES_PER_QUERY slug gốc:
+# với mỗi slug gốc, khoảng [gốc, gốc + ".") trên chỉ mục unique của cột slug chứa đúng gốc và
+# các "gốc-..." ("-" đứng ngay trước "." trong bảng mã, chữ/số đều lớn hơn "."), phần dư lọc
+# lại bằng Python. Chia nhóm vì SQLite giới hạn độ sâu biểu thức (chuỗi OR) ở 1000.
+
+# Chừa chỗ cho hậu tố "-<số>" trong giới hạn độ dài của cột slug
+SUFFIX_ROOM = 8
+RANGES_PER_QUERY = 250
+_SUFFIX_RE = re.compile(r'^(.+)-(\d+)$')
+
+
+def base_slug(title, max_length=200):
+    slug = slugify(title) or 'phim'
+    if len(slug) > max_length - SUFFIX_ROOM:
+        slug = slug[:max_length - SUFFIX_ROOM].rstrip('-')
+    return slug
+
+
+def taken_suffixes(queryset, bases):
+    # {slug gốc: tập hậu tố đã dùng} (0 = chính slug gốc)
+    bases = set(bases)
+    ordered = sorted(bases)
+    taken = defaultdict(set)
+    for start in range(0, len(ordered), RANGES_PER_QUERY):
+        condition = Q()
+        for base in ordered[start:start + RANGES_PER_QUERY]:
+            condition |= Q(slug__gte=base, slug__lt=base + '.')
+        for slug in queryset.filter(condition).order_by().values_list('slug', flat=True):
+            if slug in bases:
+                taken[slug].add(0)
+            match = _SUFFIX_RE.match(slug)
+            if match and match.group(1) in bases:
+                taken[match.group(1)].add(int(match.group(2)))
+    return taken
+
+
+def assign(base, used, assigned=None):
+    # Slug còn trống đầu tiên của `base`; cập nhật `used` (và `assigned`: các slug đã cấp
+    # trong cùng lô, phòng khi "gốc-2" của phim này trùng slug gốc của phim khác)
+    n = 0
+    while True:
+        slug = base if n == 0 else f'{base}-{n}'
+        if n not in used and (assigned is None or slug not in assigned):
+            break
+        n += 1
+    used.add(n)
+    if assigned is not None:
+        assigned.add(slug)
+    return slug
@@ -0,0 +1,131 @@
+import threading
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .models import Movie
+from .search import tokenize
+from . import images
+
+# Chỉ mục gợi ý tìm kiếm (autocomplete) nằm trong bộ nhớ của tiến trình.
+#
+# Mỗi phim đang chiếu sinh ra các khóa là phần đuôi của tên phim (đã bỏ dấu) bắt đầu
+# từ mỗi từ: "nha ba nu", "ba nu", "nu". Các khóa được sắp xếp trong một mảng, tìm
+# theo tiền tố bằng bisect nên không cần truy vấn DB khi người dùng gõ phím.
+#
+# Chỉ mục là đối tượng bất biến, chỉ được dựng lại khi thế hệ trong cache đổi (signal khi Movie
+# thay đổi, nhập danh mục, worker ảnh), rồi thay thế nguyên khối. Chỉ một request dựng lại (có
+# khóa), các request khác trong lúc đó vẫn trả lời bằng chỉ mục cũ thay vì chờ.
+
+GENERATION_KEY = 'suggest_generation'
+DEFAULT_LIMIT = 5
+
+# Số khóa tối đa được xét cho một tiền tố (tiền tố 1-2 ký tự có thể khớp hàng chục nghìn khóa)
+SCAN_LIMIT = 500
+
+
+class SuggestionIndex:
+    def __init__(self, movies, generation):
+        self.generation = generation
+        # movies: danh sách dict {'title', 'release_ordinal', 'result'}
+        self.movies = movies
+        entries = []
+        for position, movie in enumerate(movies):
+            words = tokenize(movie['title'])
+            for start in range(len(words)):
+                # 0 = khớp từ đầu tên phim, ưu tiên hơn khớp giữa tên
+                entries.append((' '.join(words[start:]), start > 0, position))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.refs = [(entry[1], entry[2]) for entry in entries]
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+        start = bisect_left(self.keys, prefix)
+        candidates = {}
+        for i in range(start, min(start + SCAN_LIMIT, len(self.keys))):
+            if not self.keys[i].startswith(prefix):
+                break
+            mid_title, position = self.refs[i]
+            if position not in candidates or mid_title < candidates[position]:
+                candidates[position] = mid_title
+        # Khớp từ đầu tên trước, sau đó phim mới khởi chiếu trước
+        ranked = sorted(candidates, key=lambda p: (candidates[p], -self.movies[p]['release_ordinal']))
+        return [self.movies[p]['result'] for p in ranked[:limit]]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def build_index(generation):
+    movies = []
+    rows = Movie.objects.filter(is_active=True).values_list('id', 'title', 'poster', 'poster_variants', 'release_date')
+    for movie_id, title, poster, variants, release_date in rows:
+        movies.append({
+            'title': title,
+            'release_ordinal': release_date.toordinal(),
+            # Kết quả trả về cho API, đã tính sẵn URL poster (bản thu nhỏ nếu có)
+            'result': {'id': movie_id, 'title': title,
+                       'poster': images.url_from_values(Movie, 'poster', 'thumb', poster, variants)},
+        })
+    return SuggestionIndex(movies, generation)
+
+
+def _is_current(index, generation):
+    return index is not None and index.generation == generation
+
+
+def _rebuild(generation):
+    global _index
+    stale = _index
+    # Đã có chỉ mục cũ: luồng khác đang dựng thì dùng tạm bản cũ, không đứng chờ
+    if not _lock.acquire(blocking=stale is None):
+        return stale
+    try:
+        # Luồng khác có thể vừa dựng xong
+        index = _index
+        if not _is_current(index, generation):
+            index = build_index(generation)
+            _index = index
+        return index
+    finally:
+        _lock.release()
+
+
+def get_index():
+    generation = cache.get(GENERATION_KEY, 0)
+    index = _index
+    if _is_current(index, generation):
+        return index
+    return _rebuild(generation)
+
+
+async def aget_index():
+    # Bản async: chỉ chuyển sang luồng đồng bộ khi phải dựng lại chỉ mục từ DB
+    generation = await cache.aget(GENERATION_KEY, 0)
+    index = _index
+    if _is_current(index, generation):
+        return index
+    if index is not None and _lock.locked():
+        return index
+    return await sync_to_async(_rebuild)(generation)
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_index().lookup(query, limit)
+
+
+async def asuggest(query, limit=DEFAULT_LIMIT):
+    return (await aget_index()).lookup(query, limit)
+
+
+def invalidate():
+    # Đổi thế hệ trong cache để mọi tiến trình dựng lại chỉ mục ở lần gọi sau
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -0,0 +1,33 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from movies import images
+
+register = template.Library()
+
+
+# {% picture movie.poster 'card' class='movie-poster' alt=movie.title %}
+# <picture> với AVIF/WebP cho trình duyệt hỗ trợ và JPEG dự phòng; chưa có bản thu nhỏ thì dùng ảnh gốc
+@register.simple_tag
+def picture(fieldfile, name, loading='lazy', **attrs):
+    if not fieldfile:
+        return ''
+    attrs = format_html_join('', ' {}="{}"', [(key.replace('_', '-'), value) for key, value in attrs.items()])
+    variant = images.variants_of(fieldfile).get(name)
+    if variant is None:
+        return format_html('<img src="{}"{} loading="{}" decoding="async">', fieldfile.url, attrs, loading)
+    storage = fieldfile.storage
+    files = variant['files']
+    sources = format_html_join('', '<source type="{}" srcset="{}">', [
+        (images.MIME_TYPES[ext], storage.url(path)) for ext, path in files.items() if ext != images.FALLBACK_FORMAT
+    ])
+    return format_html(
+        '<picture>{}<img src="{}"{} loading="{}" decoding="async"></picture>',
+        sources, storage.url(files[images.FALLBACK_FORMAT]), attrs, loading,
+    )
+
+
+# {{ movie.poster|variant_url:'hero' }}: URL JPEG của một cỡ ảnh (vd. làm ảnh nền CSS)
+@register.filter
+def variant_url(fieldfile, name):
+    return images.variant_url(fieldfile, name)
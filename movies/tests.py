@@ -1,3 +1,1723 @@
-from django.test import TestCase
+import asyncio
+import base64
+import cProfile
+import importlib
+import json
+import os
+import pstats
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .admin import BookingAdmin
+from .models import (Booking, Cinema, Genre, ImageJob, OutboxEmail, RevenueForecast, RevenueRollup, Screen, Seat,
+                     SeatReservation, Movie, Review, Showtime, Ticket, TicketPrice, Concession)
+from . import (catalog, catalog_import, checkin, checks, forecast, holds, images, live, occupancy, outbox,
+               pricing, profiler, ratings, rollups, scheduling, search, services, suggest)
+from .management.commands import check_startup
+from .querybudget import get_budget
+from .services import SeatTakenError, create_booking, get_occupied_seats, pay_booking
+from .transactions import write_atomic
+
+
+def create_showtime(rows='ABCD', seats_per_row=10):
+    cinema = Cinema.objects.create(name='Cinema Pro', address='1 Lê Lợi', city='Hồ Chí Minh',
+                                   district='Quận 1', phone='0123456789', email='rap@cinemapro.vn')
+    screen = Screen.objects.create(cinema=cinema, name='P1', total_seats=len(rows) * seats_per_row,
+                                   rows=len(rows), seats_per_row=seats_per_row)
+    Seat.objects.bulk_create([
+        Seat(screen=screen, row=row, number=number, seat_type='VIP' if row == rows[-1] else 'STANDARD')
+        for row in rows for number in range(1, seats_per_row + 1)
+    ])
+    movie = Movie.objects.create(title='Nhà Bà Nữ', description='Phim gia đình', director='Trấn Thành',
+                                 cast='Lê Giang, Uyển Ân', duration=102, release_date=timezone.now().date(),
+                                 country='Việt Nam', language='Tiếng Việt', rating='T16', poster='movies/posters/nbn.jpg')
+    start = timezone.now() + timedelta(days=1)
+    return Showtime.objects.create(movie=movie, screen=screen, start_time=start,
+                                   end_time=start + timedelta(minutes=movie.duration), base_price=60000)
+
+
+class CreateBookingQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.user = User.objects.create_user('khach', password='matkhau123')
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen).values_list('id', flat=True))
+        self.combos = [Concession.objects.create(name=f'Combo {i}', description='Bắp + nước', price=50000)
+                       for i in range(3)]
+
+    # Savepoint, suất chiếu, ghế, combo, Booking, dọn lượt giữ quá hạn, savepoint + giữ chỗ, vé,
+    # combo đã đặt, bộ đếm ghế + tăng version sơ đồ ghế, đọc version, release savepoint
+    BOOKING_QUERIES = 14
+
+    def book(self, seat_ids, concessions=None):
+        # Chạy cả phần sau commit (vá bitmap trong cache) như ngoài thực tế
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_booking(self.user, self.showtime.id, seat_ids, concessions)
+
+    def test_query_count_does_not_grow_with_seats_or_combos(self):
+        # Lần đầu còn phải dựng layout/bitmap ghế và bảng giá vào cache
+        self.book(self.seat_ids[-1:])
+
+        with self.assertNumQueries(self.BOOKING_QUERIES):
+            self.book(self.seat_ids[:1], {self.combos[0].id: 1})
+        with self.assertNumQueries(self.BOOKING_QUERIES):
+            self.book(self.seat_ids[10:18], {combo.id: 2 for combo in self.combos})
+
+    def test_totals_are_computed_up_front(self):
+        booking = create_booking(self.user, self.showtime.id, [self.seat_ids[0], self.seat_ids[-1]],
+                                 {self.combos[0].id: 2})
+        # Ghế thường 60.000 + ghế VIP (dự phòng +10.000) + 2 combo
+        self.assertEqual(booking.total_amount, 60000 + 70000 + 2 * 50000)
+        self.assertEqual(booking.tickets.count(), 2)
+        self.assertEqual(booking.concessions.get().quantity, 2)
+
+
+class OccupancyBitmapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seats = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number'))
+        self.user = User.objects.create_user('khach')
+        self.key = occupancy.OCCUPANCY_KEY % self.showtime.pk
+
+    def test_booking_patches_cached_bitmap(self):
+        occupancy.get_occupancy(self.showtime)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.showtime.pk, [self.seats[0].pk, self.seats[5].pk])
+        self.showtime.refresh_from_db()
+        self.assertEqual(self.showtime.occupancy_version, 1)
+        # Bitmap được vá đúng version mới: đọc lại không cần dựng từ DB
+        with self.assertNumQueries(0):
+            seat_map = occupancy.get_occupancy(self.showtime)
+        self.assertEqual(seat_map.occupied_seat_ids(), {self.seats[0].pk, self.seats[5].pk})
+
+    def test_version_is_bumped_in_the_booking_transaction(self):
+        occupancy.get_occupancy(self.showtime)
+        # Phần sau commit không chạy (tiến trình chết ngay sau commit): bitmap cũ vẫn nằm trong cache
+        create_booking(self.user, self.showtime.pk, [self.seats[3].pk])
+        self.showtime.refresh_from_db()
+        self.assertEqual(self.showtime.occupancy_version, 1)
+        self.assertEqual(cache.get(self.key)['version'], 0)
+        # ... nhưng không còn khớp version nên không được dùng
+        self.assertEqual(get_occupied_seats(self.showtime.pk), {self.seats[3].pk})
+
+    def test_stale_version_is_dropped_not_patched(self):
+        screen_id = self.showtime.screen_id
+        occupancy.get_occupancy(self.showtime)
+        occupancy.apply_change(self.showtime.pk, screen_id, [self.seats[0].pk], True, 1)
+        self.assertEqual(cache.get(self.key)['version'], 1)
+        # Bỏ lỡ thay đổi version 2 (tiến trình khác): không vá lên bản cũ mà xóa để dựng lại từ DB
+        occupancy.apply_change(self.showtime.pk, screen_id, [self.seats[1].pk], True, 3)
+        self.assertIsNone(cache.get(self.key))
+        # Không có bản cache thì không tự tạo bitmap chỉ từ phần thay đổi
+        occupancy.apply_change(self.showtime.pk, screen_id, [self.seats[1].pk], True, 4)
+        self.assertIsNone(cache.get(self.key))
+
+        Showtime.objects.filter(pk=self.showtime.pk).update(occupancy_version=4)
+        self.showtime.refresh_from_db()
+        self.assertEqual(occupancy.get_occupancy(self.showtime).occupied_seat_ids(), set())
+
+
+class SeatHoldExpiryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seats = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number'))
+        self.users = [User.objects.create_user(f'khach{i}') for i in range(6)]
+        self.later = timezone.now() + holds.hold_ttl() + timedelta(minutes=1)
+
+    def book(self, user, seats):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_booking(user, self.showtime.pk, [seat.pk for seat in seats])
+
+    def counters(self):
+        self.showtime.refresh_from_db()
+        return self.showtime.seats_held, self.showtime.seats_sold
+
+    def test_expired_hold_frees_seat_lazily(self):
+        first = self.book(self.users[0], self.seats[:2])
+        self.assertEqual(get_occupied_seats(self.showtime.pk), {self.seats[0].pk, self.seats[1].pk})
+        with mock.patch('django.utils.timezone.now', return_value=self.later):
+            # Chưa có gì quét: đơn vẫn PENDING nhưng ghế đã coi là trống
+            self.assertEqual(get_occupied_seats(self.showtime.pk), set())
+            second = self.book(self.users[1], self.seats[1:2])
+        # Giữ lại đúng ghế của lượt quá hạn => đơn cũ hết hạn ngay và trả cả hai ghế
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'EXPIRED')
+        self.assertEqual(list(SeatReservation.objects.filter(is_active=True).values_list('booking_id', flat=True)),
+                         [second.pk])
+        self.assertEqual(self.counters(), (1, 0))
+
+    def test_payment_after_expiry_is_refused_and_releases_seat(self):
+        booking = self.book(self.users[0], self.seats[:1])
+        with mock.patch('django.utils.timezone.now', return_value=self.later):
+            with self.assertRaisesMessage(ValidationError, 'hết thời gian giữ ghế'):
+                pay_booking(booking)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'EXPIRED')
+        self.assertFalse(SeatReservation.objects.filter(is_active=True).exists())
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_sweeper_expires_in_batches(self):
+        bookings = [self.book(user, self.seats[i * 2:i * 2 + 2]) for i, user in enumerate(self.users[:5])]
+        paid = self.book(self.users[5], self.seats[10:11])
+        with self.captureOnCommitCallbacks(execute=True):
+            pay_booking(paid)
+        self.assertEqual(self.counters(), (10, 1))
+
+        sweep = holds.expire_stale_holds
+
+        def committed_batch(*args, **kwargs):
+            # Mỗi lô là một transaction riêng: chạy on_commit của lô đó trước lô kế tiếp
+            with self.captureOnCommitCallbacks(execute=True):
+                return sweep(*args, **kwargs)
+
+        out = StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=self.later), \
+                mock.patch('movies.management.commands.expire_holds.expire_stale_holds',
+                           side_effect=committed_batch) as batches:
+            call_command('expire_holds', batch_size=2, stdout=out)
+            # 2 + 2 + 1 đơn: lô cuối thiếu thì dừng
+            self.assertEqual(batches.call_count, 3)
+            self.assertIn('5 đơn', out.getvalue())
+            self.assertEqual(set(Booking.objects.filter(pk__in=[b.pk for b in bookings])
+                                 .values_list('status', flat=True)), {'EXPIRED'})
+            self.assertEqual(self.counters(), (0, 1))
+            # Bitmap trong cache được vá qua từng lô tới version mới, chỉ còn ghế đã bán
+            self.assertEqual(cache.get(occupancy.OCCUPANCY_KEY % self.showtime.pk)['version'],
+                             self.showtime.occupancy_version)
+            self.assertEqual(get_occupied_seats(self.showtime.pk), {self.seats[10].pk})
+        self.assertEqual(Booking.objects.get(pk=paid.pk).status, 'PAID')
+
+
+class SeatConflictTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seats = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number'))
+        self.first = User.objects.create_user('khach1')
+        self.second = User.objects.create_user('khach2')
+
+    def test_unique_hold_blocks_double_booking_when_bitmap_is_stale(self):
+        occupancy.get_occupancy(self.showtime)
+        # on_commit không chạy: bitmap trong cache vẫn cho là ghế còn trống (như tiến trình khác chưa kịp vá)
+        create_booking(self.first, self.showtime.pk, [self.seats[0].pk])
+        self.assertFalse(occupancy.get_occupancy(self.showtime).is_occupied(self.seats[0].pk))
+
+        with self.assertRaises(SeatTakenError) as raised:
+            create_booking(self.second, self.showtime.pk, [self.seats[1].pk, self.seats[0].pk])
+        self.assertEqual([seat.pk for seat in raised.exception.seats], [self.seats[0].pk])
+        # Cả đơn thứ hai bị rollback, kể cả ghế không trùng
+        self.assertFalse(Booking.objects.filter(user=self.second).exists())
+        self.assertEqual(list(SeatReservation.objects.filter(is_active=True).values_list('seat_id', flat=True)),
+                         [self.seats[0].pk])
+        self.showtime.refresh_from_db()
+        self.assertEqual(self.showtime.seats_held, 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'BEGIN IMMEDIATE chỉ có trên SQLite')
+class WriteTransactionTest(TransactionTestCase):
+    def begins(self, block):
+        with CaptureQueriesContext(connection) as queries:
+            with block():
+                Genre.objects.exists()
+        return [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+
+    def test_only_read_then_write_blocks_take_the_write_lock_up_front(self):
+        self.assertEqual(self.begins(write_atomic), ['BEGIN IMMEDIATE'])
+        self.assertEqual(self.begins(transaction.atomic), ['BEGIN'])
+        with transaction.atomic():
+            # Lồng trong transaction đã mở: chỉ là savepoint
+            self.assertEqual(self.begins(write_atomic), [])
+
+
+class BookingAdminStatusTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seat = Seat.objects.filter(screen=self.showtime.screen).first()
+        self.user = User.objects.create_user('khach')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking = create_booking(self.user, self.showtime.pk, [self.seat.pk])
+        self.model_admin = BookingAdmin(Booking, admin.site)
+
+    def change_status(self, status):
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser(f'admin-{status}')
+        booking = Booking.objects.get(pk=self.booking.pk)
+        form = self.model_admin.get_form(request, booking, change=True)(
+            {'user': booking.user_id, 'booking_code': booking.booking_code, 'total_amount': booking.total_amount,
+             'status': status, 'payment_method': ''}, instance=booking)
+        if form.is_valid():
+            with mock.patch.object(self.model_admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+                self.model_admin.save_model(request, form.save(commit=False), form, change=True)
+        return form
+
+    def test_paid_in_admin_keeps_seat_after_hold_ttl(self):
+        self.assertTrue(self.change_status('PAID').is_valid())
+        self.assertIsNone(SeatReservation.objects.get(booking=self.booking).expires_at)
+        self.showtime.refresh_from_db()
+        self.assertEqual((self.showtime.seats_held, self.showtime.seats_sold), (0, 1))
+
+        later = timezone.now() + holds.hold_ttl() + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(holds.expire_stale_holds(), 0)
+            self.assertEqual(get_occupied_seats(self.showtime.pk), {self.seat.pk})
+
+        self.assertTrue(self.change_status('CANCELLED').is_valid())
+        self.assertEqual(get_occupied_seats(self.showtime.pk), set())
+        self.showtime.refresh_from_db()
+        self.assertEqual(self.showtime.seats_sold, 0)
+
+    def test_released_booking_cannot_be_reopened(self):
+        self.assertTrue(self.change_status('CANCELLED').is_valid())
+        form = self.change_status('PAID')
+        self.assertIn('status', form.errors)
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).status, 'CANCELLED')
+        self.assertFalse(SeatReservation.objects.filter(is_active=True).exists())
+
+
+class RevenueRollupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number')
+                             .values_list('id', flat=True))
+        self.user = User.objects.create_user('khach')
+
+    def rollup_rows(self):
+        # Bỏ các dòng đã về 0 (còn lại sau khi hủy hết các đơn trong kỳ)
+        return {(row.granularity, row.period, row.movie_id, row.cinema_id): (row.revenue, row.tickets, row.bookings)
+                for row in RevenueRollup.objects.all() if row.bookings}
+
+    def recount(self):
+        rows = {}
+        for booking in Booking.objects.filter(status='PAID').select_related('showtime__screen'):
+            for granularity, period in rollups.bucket_starts(booking.created_at).items():
+                key = (granularity, period, booking.showtime.movie_id, booking.showtime.screen.cinema_id)
+                revenue, tickets, bookings = rows.get(key, (0, 0, 0))
+                rows[key] = (revenue + booking.total_amount, tickets + booking.tickets.count(), bookings + 1)
+        return rows
+
+    def test_pay_and_cancel_keep_rollups_in_step_with_bookings(self):
+        first = pay_booking(create_booking(self.user, self.showtime.pk, self.seat_ids[:2]))
+        pay_booking(create_booking(self.user, self.showtime.pk, self.seat_ids[-1:]))
+        create_booking(self.user, self.showtime.pk, self.seat_ids[5:6])  # Chưa thanh toán: không tính
+        self.assertEqual(self.rollup_rows(), self.recount())
+        month = RevenueRollup.objects.get(granularity='MONTH')
+        self.assertEqual((month.revenue, month.tickets, month.bookings), (60000 * 2 + 70000, 3, 2))
+
+        services.cancel_booking(first)
+        self.assertEqual(self.rollup_rows(), self.recount())
+        month.refresh_from_db()
+        self.assertEqual((month.revenue, month.tickets, month.bookings), (70000, 1, 1))
+
+    def test_rebuild_matches_recount(self):
+        for seat_ids in (self.seat_ids[:3], self.seat_ids[3:4], self.seat_ids[-2:]):
+            pay_booking(create_booking(self.user, self.showtime.pk, seat_ids))
+        services.cancel_booking(Booking.objects.order_by('pk').first())
+        # Bảng tổng hợp bị lệch (vd sửa tay trong DB) thì rebuild đưa về đúng số liệu
+        RevenueRollup.objects.filter(granularity='DAY').update(revenue=0, tickets=0)
+        RevenueRollup.objects.filter(granularity='HOUR').delete()
+        out = StringIO()
+        call_command('rebuild_revenue_rollups', stdout=out)
+        self.assertEqual(self.rollup_rows(), self.recount())
+        self.assertEqual(RevenueRollup.objects.count(), 3)
+        self.assertIn('3 dòng', out.getvalue())
+
+
+    def test_dashboard_ignores_invalid_periods(self):
+        pay_booking(create_booking(self.user, self.showtime.pk, self.seat_ids[:1]))
+        self.client.force_login(User.objects.create_user('quanly', is_staff=True))
+        today = timezone.localdate()
+        response = self.client.get(reverse('admin_stats'), {'month': today.month, 'day': today.day})
+        self.assertEqual(response.context['chart_data'], [60000.0])
+        self.assertEqual(response.context['selected_day'], today.day)
+
+        for params in ({'month': 2, 'day': 31}, {'month': 13}, {'month': 'hai'}, {'quarter': 5}, {'year': 'x'},
+                       {'year': 10000}, {'day': 40}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('admin_stats'), params)
+                self.assertEqual(response.status_code, 200)
+        # Ngày không có trong tháng: bỏ ngày, xem cả tháng
+        response = self.client.get(reverse('admin_stats'), {'month': 2, 'day': 31, 'year': 2026})
+        self.assertEqual(response.context['chart_title'], 'Biểu đồ doanh thu Tháng 2/2026')
+        response = self.client.get(reverse('admin_stats'), {'year': 'x', 'quarter': 5})
+        self.assertEqual(response.context['chart_title'], f'Biểu đồ doanh thu năm {timezone.now().year}')
+
+
+class RevenueForecastTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        showtime = create_showtime()
+        self.key = dict(granularity='MONTH', movie=showtime.movie, cinema=showtime.screen.cinema)
+        self.period = forecast.current_period()
+        month = self.period
+        # Ba tháng đã kết thúc: 100k, 200k, 300k
+        for revenue in (300000, 200000, 100000):
+            month = rollups.bucket_starts(month - timedelta(days=1))['MONTH']
+            RevenueRollup.objects.create(period=month, revenue=revenue, tickets=1, bookings=1, **self.key)
+        self.current = RevenueRollup.objects.create(period=self.period, revenue=50000, tickets=1, bookings=1,
+                                                    **self.key)
+
+    def test_fit_ignores_the_month_in_progress(self):
+        result = forecast.compute_forecast()
+        self.assertEqual(result.points, 3)
+        self.assertAlmostEqual(result.slope, 100000)
+        # Tháng tới cách tháng đầu 4 tháng
+        self.assertEqual(result.predicted_revenue, 500000)
+        self.assertEqual(result.current_revenue, 50000)
+        self.assertEqual(result.growth_percent, 900)
+
+    def test_one_row_per_period(self):
+        first = forecast.compute_forecast()
+        RevenueRollup.objects.filter(period__lt=self.period).update(revenue=F('revenue') * 2)
+        # Request khác vừa tính xong cùng kỳ (sang tháng mới): tính lại thì ghi đè, không thêm dòng
+        forecast.get_forecast(refresh=True)
+        self.assertEqual(RevenueForecast.objects.get().pk, first.pk)
+        self.assertEqual(RevenueForecast.objects.get().predicted_revenue, 1000000)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RevenueForecast.objects.create(period=self.period)
+
+    def test_current_revenue_is_read_live(self):
+        computed = forecast.get_forecast()
+        RevenueRollup.objects.filter(pk=self.current.pk).update(revenue=250000)
+        result = forecast.get_forecast()
+        # Không tính lại mô hình trong tháng, chỉ đọc lại doanh thu tháng hiện tại
+        self.assertEqual(RevenueForecast.objects.count(), 1)
+        self.assertEqual(result.predicted_revenue, computed.predicted_revenue)
+        self.assertEqual(result.current_revenue, 250000)
+        self.assertEqual(result.growth_percent, 100)
+
+
+class ShowtimeCountersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number')
+                             .values_list('id', flat=True))
+        self.user = User.objects.create_user('khach')
+
+    def book(self, seat_ids):
+        return create_booking(self.user, self.showtime.pk, seat_ids)
+
+    def assert_matches_recount(self):
+        self.showtime.refresh_from_db()
+        expected = (
+            Seat.objects.filter(screen_id=self.showtime.screen_id).count(),
+            SeatReservation.objects.filter(showtime=self.showtime, is_active=True, booking__status='PENDING').count(),
+            Ticket.objects.filter(booking__showtime=self.showtime, booking__status='PAID').count(),
+        )
+        self.assertEqual((self.showtime.capacity, self.showtime.seats_held, self.showtime.seats_sold), expected)
+        return expected
+
+    def test_hold_pay_cancel_and_expire_keep_counters(self):
+        paid = self.book(self.seat_ids[:3])
+        cancelled = self.book(self.seat_ids[3:5])
+        stale = self.book(self.seat_ids[5:9])
+        self.assertEqual(self.assert_matches_recount(), (40, 9, 0))
+        pay_booking(paid)
+        self.assertEqual(self.assert_matches_recount(), (40, 6, 3))
+        services.cancel_booking(cancelled)
+        self.assertEqual(self.assert_matches_recount(), (40, 4, 3))
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + holds.hold_ttl() * 2):
+            call_command('expire_holds', stdout=StringIO())
+        self.assertEqual(Booking.objects.get(pk=stale.pk).status, 'EXPIRED')
+        self.assertEqual(self.assert_matches_recount(), (40, 0, 3))
+        services.cancel_booking(paid)
+        self.assertEqual(self.assert_matches_recount(), (40, 0, 0))
+        self.assertEqual(self.showtime.seats_available, 40)
+
+    def test_stale_showtime_save_keeps_counters(self):
+        stale = Showtime.objects.get(pk=self.showtime.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            pay_booking(self.book(self.seat_ids[:2]))
+            self.book(self.seat_ids[2:3])
+        # Sửa giá trong Admin từ bản nạp trước khi có người đặt vé
+        stale.base_price = 75000
+        stale.save()
+        self.assertEqual(self.assert_matches_recount(), (40, 1, 2))
+        self.assertEqual(self.showtime.base_price, 75000)
+        self.assertEqual(self.showtime.occupancy_version, 3)
+
+        # Đổi sang phòng khác: số ghế theo phòng mới
+        screen = Screen.objects.create(cinema=self.showtime.screen.cinema, name='P2', total_seats=2, rows=1,
+                                       seats_per_row=2)
+        Seat.objects.bulk_create([Seat(screen=screen, row='A', number=n) for n in (1, 2)])
+        stale.screen = screen
+        stale.save()
+        self.assertEqual(self.assert_matches_recount()[0], 2)
+
+    def test_reconcile_command_fixes_drift(self):
+        pay_booking(self.book(self.seat_ids[:2]))
+        self.book(self.seat_ids[2:5])
+        Showtime.objects.filter(pk=self.showtime.pk).update(capacity=0, seats_held=99, seats_sold=0)
+        out = StringIO()
+        call_command('reconcile_showtime_counters', '--batch-size', '1', stdout=out)
+        self.assertIn('của 1 suất', out.getvalue())
+        self.assertEqual(self.assert_matches_recount(), (40, 3, 2))
+        out = StringIO()
+        call_command('reconcile_showtime_counters', stdout=out)
+        self.assertIn('của 0 suất', out.getvalue())
+
+
+class MyTicketsFeedTest(TestCase):
+    def setUp(self):
+        self.showtime = create_showtime()
+        self.seats = list(Seat.objects.filter(screen=self.showtime.screen))
+        self.user = User.objects.create_user('khach', password='matkhau123')
+        self.client.force_login(self.user)
+
+    def add_bookings(self, count, upcoming):
+        # `upcoming` đơn cho suất sắp chiếu, còn lại là suất đã chiếu; mỗi đơn 2 vé
+        movie, screen = self.showtime.movie, self.showtime.screen
+        now = timezone.now()
+        for i in range(count):
+            start = now + timedelta(days=upcoming - i, hours=-1)
+            showtime = Showtime.objects.create(movie=movie, screen=screen, start_time=start,
+                                               end_time=start + timedelta(hours=2), base_price=60000)
+            booking = Booking.objects.create(user=self.user, showtime=showtime, booking_code=f'BK{count}-{i}',
+                                             total_amount=120000, status='PAID', expires_at=now)
+            Ticket.objects.bulk_create([Ticket(booking=booking, seat=seat, price=60000) for seat in self.seats[:2]])
+
+    # Phiên, người dùng, đơn sắp chiếu, đơn đã chiếu, vé + ghế
+    FEED_QUERIES = 5
+
+    def feed_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_tickets_api'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.add_bookings(4, upcoming=2)
+        few, _ = self.feed_queries()
+        self.add_bookings(300, upcoming=2)
+        many, page = self.feed_queries()
+        self.assertEqual(few, self.FEED_QUERIES)
+        self.assertEqual(many, self.FEED_QUERIES)
+        self.assertEqual(len(page['results']), 20)
+        self.assertEqual(len(page['results'][0]['seats']), 2)
+
+    def test_pages_cover_every_booking_once_upcoming_first(self):
+        self.add_bookings(45, upcoming=15)
+        now = timezone.now()
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 10, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get(reverse('my_tickets_api'), params).json()
+            seen += page['results']
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len({item['id'] for item in seen}), 45)
+        starts = [datetime.fromisoformat(item['start_time']) for item in seen]
+        upcoming = [start for start in starts if start >= now]
+        self.assertEqual(starts[:len(upcoming)], sorted(upcoming))
+        self.assertEqual(starts[len(upcoming):], sorted(starts[len(upcoming):], reverse=True))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN chỉ có trên SQLite')
+class QueryPlanTest(TestCase):
+    # Bảng danh mục nhỏ, được phép đọc toàn bộ
+    SMALL_TABLES = {'movies_concession'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime = create_showtime()
+        screen = cls.showtime.screen
+        for i in range(1, 6):
+            other = Movie.objects.create(title=f'Phim {i}', description='d', director='Đạo diễn', cast='Diễn viên',
+                                         duration=90, release_date=timezone.now().date() + timedelta(days=i * 10 - 25),
+                                         country='Việt Nam', language='Tiếng Việt', rating='P', poster='p.jpg')
+            start = timezone.now() + timedelta(days=i)
+            Showtime.objects.create(movie=other, screen=screen, start_time=start,
+                                    end_time=start + timedelta(minutes=90), base_price=60000)
+        cls.user = User.objects.create_user('khach', password='matkhau123')
+        cls.staff = User.objects.create_user('quanly', password='matkhau123', is_staff=True)
+        seat_ids = list(Seat.objects.filter(screen=screen).values_list('id', flat=True))
+        for i in range(5):
+            booking = create_booking(cls.user, cls.showtime.id, seat_ids[i * 2:i * 2 + 2])
+            if i % 2:
+                pay_booking(booking)
+
+    def assert_no_table_scans(self, request):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            request()
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for *_, detail in cursor.fetchall():
+                    # "SCAN bảng" = đọc toàn bộ bảng; bảng ảo FTS5 và subquery không tính
+                    match = re.match(r'SCAN (\w+)', detail)
+                    if match and 'VIRTUAL TABLE' not in detail and match.group(1) not in self.SMALL_TABLES:
+                        scans.append(f"{detail}\n    {query['sql'][:200]}")
+        self.assertFalse(scans, 'Truy vấn quét toàn bảng:\n' + '\n'.join(scans))
+
+    def test_showtime_detail(self):
+        self.assert_no_table_scans(lambda: self.client.get(reverse('showtime_detail', args=[self.showtime.id])))
+
+    def test_get_occupied_seats(self):
+        self.assert_no_table_scans(lambda: get_occupied_seats(self.showtime.id))
+
+    def test_my_tickets(self):
+        self.client.force_login(self.user)
+        self.assert_no_table_scans(lambda: self.client.get(reverse('my_tickets')))
+        self.assert_no_table_scans(lambda: self.client.get(reverse('my_tickets_api')))
+
+    def test_movie_list(self):
+        self.assert_no_table_scans(lambda: self.client.get(reverse('movie_list')))
+        self.assert_no_table_scans(lambda: self.client.get(reverse('movie_list'), {'q': 'nha ba'}))
+
+    def test_movie_detail(self):
+        self.assert_no_table_scans(lambda: self.client.get(reverse('movie_detail', args=[self.showtime.movie_id])))
+
+    def test_admin_statistics(self):
+        self.client.force_login(self.staff)
+        self.assert_no_table_scans(lambda: self.client.get(reverse('admin_stats')))
+        self.assert_no_table_scans(lambda: self.client.get(reverse('admin_stats'), {'year': timezone.now().year}))
+
+
+SCANNER_TOKEN = 'may-quet-cong-1'
+
+
+@override_settings(CHECKIN={'SCANNERS': {'cong-1': SCANNER_TOKEN}})
+class QueryBudgetTest(TestCase):
+    # Mỗi view trong movies.urls phải khai báo @query_budget và được gọi ở đây với dữ liệu
+    # đủ nhiều dòng (nhiều ghế, combo, đánh giá, đơn) để lỗi N+1 vượt ngân sách.
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime = create_showtime()
+        cls.user = User.objects.create_user('khach', password='matkhau123')
+        cls.staff = User.objects.create_user('quanly', password='matkhau123', is_staff=True)
+        seat_ids = list(Seat.objects.filter(screen=cls.showtime.screen).values_list('id', flat=True))
+        combos = [Concession.objects.create(name=f'Combo {i}', description='Bắp + nước', price=50000)
+                  for i in range(3)]
+        cls.bookings = [create_booking(cls.user, cls.showtime.id, seat_ids[i * 4:i * 4 + 4],
+                                       {combo.id: 1 for combo in combos}) for i in range(6)]
+        pay_booking(cls.bookings[0])
+        reviewers = User.objects.bulk_create([User(username=f'nguoi_xem_{i}') for i in range(12)])
+        Review.objects.bulk_create([Review(movie=cls.showtime.movie, user=u, rating=4, comment='Hay')
+                                    for u in reviewers])
+        cls.seat_id = seat_ids[-1]
+        # Suất sắp chiếu để soát vé
+        soon = timezone.now() + timedelta(minutes=10)
+        door_showtime = Showtime.objects.create(movie=cls.showtime.movie, screen=cls.showtime.screen, start_time=soon,
+                                                end_time=soon + timedelta(hours=2), base_price=60000)
+        cls.door_booking = pay_booking(create_booking(cls.user, door_showtime.id, seat_ids[:4]))
+
+    def requests(self):
+        # name -> (method, args, data, người dùng[, tham số thêm cho client])
+        showtime, booking = self.showtime, self.bookings[1]
+        scanner = {'content_type': 'application/json', 'headers': {'Authorization': f'Bearer {SCANNER_TOKEN}'}}
+        code = self.door_booking.booking_code
+        return {
+            'movie_list': ('get', [], {}, None),
+            'movie_detail': ('get', [showtime.movie_id], {}, self.user),
+            'showtime_detail': ('get', [showtime.id], {}, self.user),
+            'seat_stream': ('get', [showtime.id], {}, None),
+            'book_tickets': ('post', [showtime.id], {'selected_seats': [self.seat_id]}, self.user),
+            'booking_success': ('get', [booking.id], {}, self.user),
+            'pay_booking': ('get', [booking.id], {}, self.user),
+            'register': ('get', [], {}, None),
+            'login': ('get', [], {}, None),
+            'logout': ('get', [], {}, self.user),
+            'profile': ('get', [], {}, self.user),
+            'my_tickets': ('get', [], {}, self.user),
+            'my_tickets_api': ('get', [], {}, self.user),
+            'showtime_seats_api': ('get', [showtime.id], {}, None),
+            'search_suggestions': ('get', [], {'term': 'nha'}, None),
+            'admin_stats': ('get', [], {}, self.staff),
+            'profile_list': ('get', [], {}, self.staff),
+            'profile_download': ('get', [self.profile_id, 'folded'], {}, self.staff),
+            'checkin_api': ('post', [], {'code': code, 'seats': [self.door_booking.tickets.first().seat_id]}, None,
+                            scanner),
+            'checkin_batch_api': ('post', [], {'scans': [{'code': code}, {'code': code}, {'code': 'KHONGCO'}]}, None,
+                                  scanner),
+        }
+
+    def setUp(self):
+        # Một bản đo để có dữ liệu cho các trang tải profile
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        settings_override = self.settings(PROFILER={'DIR': self.profile_dir.name, 'KEEP': 5})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.staff)
+        self.profile_id = self.client.get(reverse('movie_list'), {'_profile': 1})['X-Profile-Id']
+
+    def test_every_view_declares_a_budget(self):
+        from . import urls
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(self.requests()))
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(get_budget(pattern.callback), pattern.name)
+
+    def test_views_stay_within_budget(self):
+        for name, (method, args, data, user, *extra) in self.requests().items():
+            with self.subTest(name):
+                cache.clear()
+                if user:
+                    self.client.force_login(user)
+                else:
+                    self.client.logout()
+                response = getattr(self.client, method)(reverse(name, args=args), data, **(extra[0] if extra else {}))
+                self.assertLess(response.status_code, 400)
+                stats = response.wsgi_request.query_stats
+                budget = response.wsgi_request.query_budget
+                self.assertLessEqual(stats.count, budget, f'{name}: {stats.count} truy vấn > ngân sách {budget}')
+                self.assertFalse(stats.duplicates(3), f'{name}: truy vấn lặp lại')
+
+    def test_staff_get_query_headers(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('movie_list'))
+        self.assertEqual(response['X-Query-Count'], str(response.wsgi_request.query_stats.count))
+        self.assertIn('queries;dur=', response['Server-Timing'])
+        self.client.force_login(self.user)
+        self.assertNotIn('X-Query-Count', self.client.get(reverse('movie_list')))
+
+    def test_views_that_skip_the_user_need_no_queries_when_logged_in(self):
+        # Middleware không tự nạp session + auth_user chỉ để xét header staff
+        suggestions = reverse('search_suggestions')
+        seats = reverse('showtime_seats_api', args=[self.showtime.id])
+        self.client.force_login(self.staff)
+        self.client.get(suggestions, {'term': 'nha'})
+        etag = self.client.get(seats)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(suggestions, {'term': 'nha'}).status_code, 200)
+            self.assertEqual(self.client.get(seats, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        client = AsyncClient()
+        async_to_sync(client.aforce_login)(self.staff)
+
+        async def scenario():
+            self.assertEqual((await client.get(suggestions, {'term': 'nha'})).status_code, 200)
+            self.assertEqual((await client.get(seats, headers={'If-None-Match': etag})).status_code, 304)
+
+        with self.assertNumQueries(0):
+            async_to_sync(scenario)()
+
+
+class RequestProfilerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('quanly', password='matkhau123', is_staff=True)
+        cls.user = User.objects.create_user('khach', password='matkhau123')
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        settings_override = self.settings(PROFILER={'DIR': self.profile_dir.name, 'KEEP': 3})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save(self, samples=()):
+        profile = cProfile.Profile()
+        profile.runcall(sorted, range(1000), key=str)
+        sampler = profiler.StackSampler(None, set(), 1)
+        sampler.samples.update(samples)
+        request = RequestFactory().get('/phim/?_profile=1')
+        return profiler.save_profile(profile, sampler, request, {'total_ms': 1.0})
+
+    def test_trigger_is_the_exact_parameter(self):
+        factory = RequestFactory()
+        self.assertTrue(profiler.is_requested(factory.get('/', {'_profile': 1})))
+        self.assertTrue(profiler.is_requested(factory.get('/', {'q': 'x', '_profile': ''})))
+        self.assertTrue(profiler.is_requested(factory.get('/', HTTP_X_PROFILE='1')))
+        self.assertFalse(profiler.is_requested(factory.get('/', {'q': '_profile'})))
+        self.assertFalse(profiler.is_requested(factory.get('/', {'my_profile': 1})))
+        self.assertFalse(profiler.is_requested(factory.get('/')))
+
+    def test_only_staff_requests_are_profiled(self):
+        self.client.force_login(self.user)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('movie_list'), {'_profile': 1}))
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('movie_list'), {'q': '_profile'}))
+        response = self.client.get(reverse('movie_list'), {'_profile': 1})
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertEqual([p['id'] for p in profiler.list_profiles()], [response['X-Profile-Id']])
+
+    def test_saved_files_are_readable(self):
+        profile_id = self.save({'view (views.py:10);render (base.py:5)': 3, 'view (views.py:10)': 1})
+        stats = pstats.Stats(profiler.profile_file(profile_id, 'prof'))
+        self.assertTrue(any('sorted' in name for _, _, name in stats.stats))
+        with open(profiler.profile_file(profile_id, 'folded')) as folded:
+            self.assertEqual(folded.read(), 'view (views.py:10);render (base.py:5) 3\nview (views.py:10) 1\n')
+        with open(profiler.profile_file(profile_id, 'json')) as meta:
+            self.assertEqual(json.load(meta), {'id': profile_id, 'method': 'GET', 'path': '/phim/?_profile=1',
+                                               'total_ms': 1.0})
+
+    def test_only_the_latest_profiles_are_kept(self):
+        ids = []
+        for _ in range(5):
+            ids.append(self.save())
+            time.sleep(0.002)  # id bắt đầu bằng mốc mili giây
+        self.assertEqual([p['id'] for p in profiler.list_profiles()], ids[:1:-1])
+        self.assertEqual(len(os.listdir(self.profile_dir.name)), 3 * len(profiler.EXTENSIONS))
+        self.assertIsNone(profiler.profile_file(ids[0], 'prof'))
+
+    def test_profile_file_rejects_bad_ids_and_formats(self):
+        profile_id = self.save()
+        self.assertIsNotNone(profiler.profile_file(profile_id, 'folded'))
+        for bad_id, extension in ((profile_id, 'exe'), ('../../etc/passwd', 'prof'), (f'{profile_id}/..', 'json'),
+                                  (profile_id.upper() + 'Z', 'prof'), ('1-abcdef', 'prof')):
+            with self.subTest(bad_id=bad_id, extension=extension):
+                self.assertIsNone(profiler.profile_file(bad_id, extension))
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('profile_download', args=[profile_id, 'folded'])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile_download', args=['1-abcdef', 'folded'])).status_code, 404)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('profile_download', args=[profile_id, 'folded'])).status_code, 302)
+
+
+class SeatMapApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.user = User.objects.create_user('khach', password='matkhau123')
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen)
+                             .order_by('row', 'number').values_list('id', flat=True))
+        self.url = reverse('showtime_seats_api', args=[self.showtime.id])
+
+    def occupied(self, payload):
+        bits = base64.b64decode(payload['occupied'])
+        return {seat[0] for pos, seat in enumerate(payload['layout']) if bits[pos >> 3] & (1 << (pos & 7))}
+
+    def test_payload_and_conditional_get(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.showtime.id, self.seat_ids[:2])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([seat[0] for seat in payload['layout']], self.seat_ids)
+        self.assertEqual(self.occupied(payload), set(self.seat_ids[:2]))
+        self.assertEqual(payload['available'], len(self.seat_ids) - 2)
+
+        # Sơ đồ chưa đổi: 304 mà không truy vấn DB
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Có người đặt thêm => ETag đổi, trả bản mới
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.showtime.id, self.seat_ids[5:6])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.occupied(response.json()), set(self.seat_ids[:2] + self.seat_ids[5:6]))
+
+    def test_seat_change_refreshes_layout(self):
+        etag = self.client.get(self.url)['ETag']
+        Seat.objects.create(screen=self.showtime.screen, row='E', number=1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['layout']), len(self.seat_ids) + 1)
+
+    def test_unknown_showtime(self):
+        response = self.client.get(reverse('showtime_seats_api', args=[self.showtime.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncReadViewsTest(TestCase):
+    # Các trang chỉ đọc là view async: chạy qua ASGI (AsyncClient) với middleware ở chế độ async,
+    # truy vấn ở luồng ORM vẫn được đếm vào ngân sách của request
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime = create_showtime()
+        cls.user = User.objects.create_user('khach', password='matkhau123')
+        cls.staff = User.objects.create_user('quanly', password='matkhau123', is_staff=True)
+        seat_ids = list(Seat.objects.filter(screen=cls.showtime.screen).values_list('id', flat=True))
+        create_booking(cls.user, cls.showtime.id, seat_ids[:3])
+        Review.objects.create(movie=cls.showtime.movie, user=cls.user, rating=5, comment='Hay')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_run_async_within_budget(self):
+        showtime = self.showtime
+        pages = {
+            'movie_list': [],
+            'search_suggestions': [],
+            'movie_detail': [showtime.movie_id],
+            'showtime_detail': [showtime.id],
+            'showtime_seats_api': [showtime.id],
+        }
+
+        async def scenario():
+            client = AsyncClient()
+            await client.aforce_login(self.staff)
+            for name, args in pages.items():
+                response = await client.get(reverse(name, args=args), {'term': 'nha'})
+                self.assertEqual(response.status_code, 200, name)
+                stats = response.asgi_request.query_stats
+                self.assertGreater(stats.count, 0, name)
+                self.assertLessEqual(stats.count, response.asgi_request.query_budget, name)
+                # Header staff chỉ có ở trang đã nạp người dùng (trang HTML), API JSON thì không
+                if name in ('search_suggestions', 'showtime_seats_api'):
+                    self.assertNotIn('X-Query-Count', response, name)
+                else:
+                    self.assertEqual(response['X-Query-Count'], str(stats.count), name)
+
+            response = await client.get(reverse('movie_detail', args=[showtime.movie_id]))
+            self.assertContains(response, 'quanly')
+            self.assertContains(response, 'Hay')
+
+            response = await client.post(reverse('movie_detail', args=[showtime.movie_id]),
+                                         {'rating': 4, 'comment': 'Xem lại lần nữa'})
+            self.assertEqual(response.status_code, 302)
+
+        async_to_sync(scenario)()
+        self.assertEqual(Review.objects.filter(movie=self.showtime.movie).count(), 2)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Chỉ mục FTS5 chỉ có trên SQLite')
+class MovieSearchTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie = create_showtime().movie
+
+    def test_folded_query_matches_accented_title(self):
+        self.assertEqual(search.fold('Nhà Bà Nữ'), 'nha ba nu')
+        self.assertEqual(search.fold('Đất Rừng Phương Nam'), 'dat rung phuong nam')
+        self.assertEqual(search.search_movie_ids('nha ba nu'), [self.movie.pk])
+        self.assertEqual(search.search_movie_ids('NHÀ bà'), [self.movie.pk])
+        # Migration giữ bản chép riêng của hàm gập dấu, phải cho cùng kết quả
+        migration = importlib.import_module('movies.migrations.0009_movie_search_index')
+        self.assertEqual(migration.fold('Nhà Bà Nữ, Đà Lạt'), search.fold('Nhà Bà Nữ, Đà Lạt'))
+
+    def test_genre_rename_and_delete_reindex_movies(self):
+        genre = Genre.objects.create(name='Hài hước')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.genres.add(genre)
+        self.assertEqual(search.search_movie_ids('hai huoc'), [self.movie.pk])
+
+        genre.name = 'Gia đình'
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.save()
+        self.assertEqual(search.search_movie_ids('hai huoc'), [])
+        self.assertEqual(search.search_movie_ids('gia dinh'), [self.movie.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.delete()
+        self.assertEqual(search.search_movie_ids('gia dinh'), [])
+        self.assertEqual(search.search_movie_ids('nha ba nu'), [self.movie.pk])
+
+
+class SearchSuggestionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggest._index = None
+        self.addCleanup(setattr, suggest, '_index', None)
+        self.movie = create_showtime().movie
+
+    def titles(self, query):
+        return [result['title'] for result in suggest.suggest(query)]
+
+    def test_lookups_after_warm_up_need_no_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.titles('nha'), ['Nhà Bà Nữ'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('ba nu'), ['Nhà Bà Nữ'])
+            self.assertEqual(self.titles('NỮ'), ['Nhà Bà Nữ'])
+            self.assertEqual(self.titles('mai'), [])
+        response = async_to_sync(AsyncClient().get)(reverse('search_suggestions'), {'term': 'nha'})
+        self.assertEqual([result['title'] for result in response.json()], ['Nhà Bà Nữ'])
+
+    def test_movie_change_rebuilds_index(self):
+        self.titles('nha')
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.create(title='Nhà Tù', description='-', director='-', cast='-', duration=90,
+                                 release_date=timezone.now().date(), country='-', language='-', rating='P')
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(self.titles('nha')), ['Nhà Bà Nữ', 'Nhà Tù'])
+        with self.assertNumQueries(0):
+            self.titles('nha')
+
+    def test_requests_during_rebuild_use_the_old_index(self):
+        self.titles('nha')
+        suggest.invalidate()
+        # Một request khác đang dựng lại chỉ mục: không chờ khóa, không truy vấn
+        with suggest._lock, self.assertNumQueries(0):
+            self.assertEqual(self.titles('nha'), ['Nhà Bà Nữ'])
+            self.assertEqual(async_to_sync(suggest.asuggest)('nha')[0]['title'], 'Nhà Bà Nữ')
+        with self.assertNumQueries(1):
+            self.titles('nha')
+        with self.assertNumQueries(0):
+            self.titles('nha')
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie = create_showtime().movie
+
+    def test_second_render_is_a_cache_hit_without_queries(self):
+        html = catalog.render_catalog('')
+        self.assertIn('Nhà Bà Nữ', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.render_catalog(''), html)
+        # Từ khóa khác dấu/hoa thường dùng chung một bản
+        catalog.render_catalog('nha ba nu')
+        with self.assertNumQueries(0):
+            catalog.render_catalog('NHÀ  Bà nữ')
+        self.assertEqual(catalog.stats()['hits'], 2)
+        self.assertEqual(catalog.stats()['misses'], 2)
+        self.assertEqual(catalog.stats()['hit_rate'], 0.5)
+
+    def test_invalidate_and_midnight_start_a_new_entry(self):
+        generation = catalog.stats()['generation']
+        catalog.render_catalog('')
+        catalog.invalidate()
+        self.assertEqual(catalog.stats()['generation'], generation + 1)
+        catalog.render_catalog('')
+        self.assertEqual((catalog.stats()['hits'], catalog.stats()['misses']), (0, 2))
+
+        # Sửa phim (signal) cũng đổi thế hệ
+        self.movie.title = 'Bố Già'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.save()
+        self.assertIn('Bố Già', catalog.render_catalog(''))
+        self.assertEqual(catalog.stats()['misses'], 3)
+
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            catalog.render_catalog('')
+        self.assertEqual((catalog.stats()['hits'], catalog.stats()['misses']), (0, 4))
+        catalog.render_catalog('')
+        self.assertEqual(catalog.stats()['hits'], 1)
+
+    def test_deploy_check_requires_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['movies.E001'])
+        on_disk = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                               'LOCATION': tempfile.gettempdir()}}
+        with override_settings(CACHES=on_disk):
+            self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['movies.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                              'LOCATION': 'redis://127.0.0.1:6379'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class ReviewStatsTest(TestCase):
+    def setUp(self):
+        self.movie = create_showtime().movie
+        self.other = Movie.objects.create(title='Mai', description='-', director='-', cast='-', duration=90,
+                                          release_date=timezone.now().date(), country='-', language='-', rating='P')
+        self.users = User.objects.bulk_create([User(username=f'nguoi_xem_{i}') for i in range(4)])
+
+    def assert_matches_recount(self):
+        for movie in Movie.objects.filter(pk__in=[self.movie.pk, self.other.pk]):
+            stars = list(Review.objects.filter(movie=movie).values_list('rating', flat=True))
+            expected = {'review_count': len(stars), 'review_rating_sum': sum(stars),
+                        **{ratings.star_field(star): stars.count(star) for star in ratings.STARS}}
+            self.assertEqual({field: getattr(movie, field) for field in expected}, expected, movie.title)
+
+    def test_create_edit_move_and_delete_keep_stats(self):
+        reviews = [Review.objects.create(movie=self.movie, user=user, rating=rating, comment='-')
+                   for user, rating in zip(self.users, (5, 4, 4, 1))]
+        self.assert_matches_recount()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.average_review_rating, 3.5)
+
+        reviews[3].rating = 3
+        reviews[3].save()
+        self.assert_matches_recount()
+
+        reviews[0].movie = self.other
+        reviews[0].save()
+        self.assert_matches_recount()
+
+        reviews[1].delete()
+        self.assert_matches_recount()
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.review_histogram[1]), (2, (4, 1, 50)))
+
+    def test_stale_movie_save_keeps_review_stats(self):
+        stale = Movie.objects.get(pk=self.movie.pk)
+        Review.objects.create(movie=self.movie, user=self.users[0], rating=5, comment='-')
+        # Admin sửa phim từ bản nạp trước khi có đánh giá: không được ghi đè thống kê về 0
+        stale.title = 'Nhà Bà Nữ (bản đặc biệt)'
+        stale.save()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.title, 'Nhà Bà Nữ (bản đặc biệt)')
+        self.assert_matches_recount()
+        self.assertEqual(self.movie.review_count, 1)
+
+    def test_repair_command_fixes_bulk_changes(self):
+        # bulk_create/update() đi vòng qua signal => lệch, lệnh repair_review_stats sửa lại
+        Review.objects.bulk_create([Review(movie=self.movie, user=user, rating=2, comment='-')
+                                    for user in self.users])
+        Review.objects.create(movie=self.other, user=self.users[0], rating=5, comment='-')
+        Review.objects.filter(movie=self.other).update(rating=3)
+        out = StringIO()
+        call_command('repair_review_stats', stdout=out)
+        self.assertIn('của 2 phim', out.getvalue())
+        self.assert_matches_recount()
+        out = StringIO()
+        call_command('repair_review_stats', self.movie.pk, stdout=out)
+        self.assertIn('của 0 phim', out.getvalue())
+
+
+class CatalogImportTest(TestCase):
+    CSV = (
+        'title,director,cast,duration,release_date,country,language,rating,genres\n'
+        'Mai,Trấn Thành,"Phương Anh Đào, Tuấn Trần",131,2024-02-10,Việt Nam,Tiếng Việt,T18,Tâm lý|Tình cảm\n'
+        'Mai,Lê Hoàng,Diễm My,95,2010-05-01,Việt Nam,Tiếng Việt,T13,Hài\n'
+        'Lật Mặt 7,Lý Hải,Thanh Hiền,138,2024-04-26,Việt Nam,Tiếng Việt,K,Gia đình|Tâm lý\n'
+        ',Không tên,-,90,2024-01-01,-,-,P,\n'
+    )
+
+    def run_import(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as feed:
+            feed.write(content)
+        self.addCleanup(os.remove, feed.name)
+        out = StringIO()
+        call_command('import_catalog', feed.name, stdout=out)
+        return out.getvalue()
+
+    def test_slug_needs_one_query(self):
+        Movie.objects.create(title='Mai', description='-', director='-', cast='-', duration=90,
+                             release_date=timezone.now().date(), country='-', language='-', rating='P')
+        Movie.objects.create(title='Mai', description='-', director='-', cast='-', duration=90,
+                             release_date=timezone.now().date(), country='-', language='-', rating='P')
+        movie = Movie(title='Mai', description='-', director='-', cast='-', duration=90,
+                      release_date=timezone.now().date(), country='-', language='-', rating='P')
+        # Tìm slug (một truy vấn dù đã có 2 phim trùng tên) + INSERT
+        with self.assertNumQueries(2):
+            movie.save()
+        self.assertEqual(sorted(Movie.objects.values_list('slug', flat=True)), ['mai', 'mai-1', 'mai-2'])
+
+    def test_import_is_idempotent(self):
+        output = self.run_import(self.CSV)
+        self.assertIn('tạo 3, cập nhật 0, bỏ qua 1 dòng lỗi', output)
+        self.assertEqual(sorted(Movie.objects.values_list('slug', flat=True)), ['lat-mat-7', 'mai', 'mai-1'])
+        self.assertEqual(set(Genre.objects.values_list('name', flat=True)),
+                         {'Tâm lý', 'Tình cảm', 'Hài', 'Gia đình'})
+        mai = Movie.objects.get(title='Mai', release_date='2024-02-10')
+        self.assertEqual(set(mai.genres.values_list('name', flat=True)), {'Tâm lý', 'Tình cảm'})
+        self.assertEqual(mai.cast, 'Phương Anh Đào, Tuấn Trần')
+
+        output = self.run_import(self.CSV)
+        self.assertIn('tạo 0, cập nhật 0', output)
+        self.assertEqual(Movie.objects.count(), 3)
+
+        output = self.run_import(self.CSV.replace('Tâm lý|Tình cảm', 'Tình cảm').replace(',95,', ',97,'))
+        self.assertIn('tạo 0, cập nhật 2', output)
+        self.assertEqual(set(mai.genres.values_list('name', flat=True)), {'Tình cảm'})
+        self.assertEqual(Movie.objects.get(slug='mai-1').duration, 97)
+        self.assertEqual(search.search_movie_ids('lat mat'), [Movie.objects.get(slug='lat-mat-7').id])
+
+    def test_queries_do_not_grow_with_batch(self):
+        def batch(start, count):
+            return [catalog_import.clean_row({
+                'title': f'Phim {i}', 'duration': 100, 'release_date': '2024-01-01', 'genres': f'Loại {i % 3}',
+            }) for i in range(start, start + count)]
+
+        def statements(queries):
+            # INSERT hàng loạt bị SQLite tách theo giới hạn số tham số, nên chỉ đếm loại câu lệnh
+            return sorted({' '.join(re.sub(r'^\d+ times: ', '', query['sql']).split()[:3])
+                           for query in queries if 'SAVEPOINT' not in query['sql']})
+
+        catalog_import.import_batch(batch(0, 3))  # Tạo sẵn thể loại
+        with CaptureQueriesContext(connection) as small:
+            catalog_import.import_batch(batch(100, 5))
+        with CaptureQueriesContext(connection) as large:
+            catalog_import.import_batch(batch(200, 200))
+        self.assertEqual(statements(small), statements(large))
+        self.assertLess(len(large), 20)
+        self.assertEqual(Movie.objects.filter(title__startswith='Phim ').count(), 208)
+
+    def test_feed_slug_wins_over_slug_generated_in_an_earlier_batch(self):
+        records = [
+            {'title': 'Mai', 'duration': 131, 'release_date': '2024-02-10'},
+            {'title': 'Lật Mặt 7', 'duration': 138, 'release_date': '2024-04-26'},
+            {'title': 'Mai', 'slug': 'mai', 'duration': 95, 'release_date': '2010-05-01'},
+        ]
+        stats = catalog_import.import_catalog(records, batch_size=2)
+        self.assertEqual((stats['created'], stats['updated']), (3, 0))
+        self.assertEqual(Movie.objects.get(slug='mai').release_date, date(2010, 5, 1))
+        self.assertEqual(Movie.objects.get(slug='mai-1').release_date, date(2024, 2, 10))
+
+        stats = catalog_import.import_catalog(records, batch_size=2)
+        self.assertEqual((stats['created'], stats['updated']), (0, 0))
+        self.assertEqual(Movie.objects.count(), 3)
+
+    def test_streams_json_array(self):
+        feed = StringIO(json.dumps([{'title': f'Phim {i}', 'note': 'x' * 50} for i in range(20)]))
+        titles = [row['title'] for row in catalog_import.read_json_array(feed, chunk_size=7)]
+        self.assertEqual(titles, [f'Phim {i}' for i in range(20)])
+
+
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size=(900, 1200)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create_movie(self):
+        return Movie.objects.create(title='Mai', description='-', director='Trấn Thành', cast='-', duration=131,
+                                    release_date=timezone.now().date(), country='-', language='-', rating='T18',
+                                    poster=self.upload('mai.png'))
+
+    def render(self, movie, name):
+        template = Template("{% load image_tags %}{% picture movie.poster name class='movie-poster' alt=movie.title %}")
+        return template.render(Context({'movie': movie, 'name': name}))
+
+    def test_upload_is_resized_by_worker(self):
+        movie = self.create_movie()
+        # Lưu phim chỉ xếp việc, chưa resize; trang dùng ảnh gốc
+        self.assertEqual(ImageJob.objects.count(), 1)
+        self.assertEqual(self.render(movie, 'card'),
+                         f'<img src="{movie.poster.url}" class="movie-poster" alt="Mai" loading="lazy" decoding="async">')
+
+        self.assertEqual(images.process_jobs(), (1, 0))
+        self.assertFalse(ImageJob.objects.exists())
+        movie.refresh_from_db()
+        variants = movie.poster_variants['variants']
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (400, 600))
+        self.assertEqual(variants['hero']['width'], 900)  # Không phóng to ảnh nhỏ
+        with movie.poster.storage.open(variants['thumb']['files']['webp']) as thumb:
+            self.assertEqual(Image.open(thumb).size, (160, 240))
+
+        # Render chỉ đọc manifest trên bản ghi: không truy vấn, không hỏi storage
+        with self.assertNumQueries(0), mock.patch('django.core.files.storage.FileSystemStorage.exists') as exists:
+            html = self.render(movie, 'card')
+        exists.assert_not_called()
+        self.assertIn('<source type="image/webp" srcset="/media/movies/posters/variants/mai-card.webp">', html)
+        self.assertIn('<img src="/media/movies/posters/variants/mai-card.jpg" class="movie-poster"', html)
+
+        # Lưu lại không đổi ảnh: không có việc mới
+        movie.title = 'Mai (2024)'
+        movie.save()
+        self.assertFalse(ImageJob.objects.exists())
+
+        # Đổi ảnh: manifest cũ bị bỏ qua ngay, worker tạo lại và xóa file cũ
+        old_thumb = variants['thumb']['files']['jpg']
+        movie.poster = self.upload('mai-v2.png', size=(300, 450))
+        movie.save()
+        self.assertNotIn('<picture>', self.render(movie, 'card'))
+        self.assertEqual(images.process_jobs(), (1, 0))
+        movie.refresh_from_db()
+        self.assertEqual(images.variant_url(movie.poster, 'thumb'), '/media/movies/posters/variants/mai-v2-thumb.jpg')
+        self.assertFalse(movie.poster.storage.exists(old_thumb))
+
+    def test_broken_image_is_retried_later(self):
+        movie = self.create_movie()
+        with movie.poster.storage.open(movie.poster.name, 'wb') as poster:
+            poster.write(b'not an image')
+        self.assertEqual(images.process_jobs(), (0, 1))
+        job = ImageJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('UnidentifiedImageError', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(images.process_jobs(), (0, 0))
+
+    def test_claimed_jobs_are_skipped_until_the_lease_expires(self):
+        self.create_movie()
+        [job] = images.claim(10)
+        # Worker khác chạy cùng lúc không lấy lại việc đã bị khóa
+        self.assertEqual(images.claim(10), [])
+        self.assertEqual(images.process_jobs(), (0, 0))
+        # Worker đầu chết giữa chừng: hết hạn khóa thì việc được làm lại
+        later = job.run_after + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(images.process_jobs(), (1, 0))
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_forced_backfill_removes_old_variant_files(self):
+        movie = self.create_movie()
+        images.process_jobs()
+        movie.refresh_from_db()
+        # File của một cỡ ảnh không còn trong VARIANTS
+        storage = movie.poster.storage
+        retired = storage.save('movies/posters/variants/mai-poster.jpg', ContentFile(b'old'))
+        manifest = movie.poster_variants
+        manifest['variants']['poster'] = {'width': 200, 'height': 300, 'files': {'jpg': retired}}
+        Movie.objects.filter(pk=movie.pk).update(poster_variants=manifest)
+
+        call_command('backfill_images', '--force', '--model', 'movie', stdout=StringIO())
+        movie.refresh_from_db()
+        self.assertEqual(images.variants_of(movie.poster), {})  # Trang dùng ảnh gốc tới khi tạo xong
+        self.assertTrue(storage.exists(retired))
+
+        self.assertEqual(images.process_jobs(), (1, 0))
+        movie.refresh_from_db()
+        self.assertEqual(set(movie.poster_variants['variants']), {'thumb', 'card', 'hero'})
+        self.assertFalse(storage.exists(retired))
+        self.assertTrue(storage.exists(movie.poster_variants['variants']['card']['files']['jpg']))
+
+    def test_backfill_queues_existing_posters(self):
+        movie = self.create_movie()
+        images.process_jobs()
+        Movie.objects.filter(pk=movie.pk).update(poster_variants={})
+        Concession.objects.create(name='Combo', description='-', price=0)
+
+        call_command('backfill_images', stdout=StringIO())
+        self.assertEqual(list(ImageJob.objects.values_list('model', 'object_id')), [('movies.movie', movie.pk)])
+        call_command('backfill_images', '--now', stdout=StringIO())
+        self.assertFalse(ImageJob.objects.exists())
+        movie.refresh_from_db()
+        self.assertEqual(movie.poster_variants['source'], movie.poster.name)
+
+
+class EmailOutboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen)
+                             .order_by('row', 'number').values_list('id', flat=True))
+        self.next_seat = 0
+
+    def paid_booking(self, seats=1, email='khach@example.com'):
+        user = User.objects.create_user(f'khach{User.objects.count()}', email=email, first_name='An')
+        booking = create_booking(user, self.showtime.id, self.seat_ids[self.next_seat:self.next_seat + seats])
+        self.next_seat += seats
+        return pay_booking(booking)
+
+    def test_payment_only_queues_email(self):
+        booking = self.paid_booking(seats=2)
+        pay_booking(booking)  # Gọi lại không tạo email thứ hai
+        self.assertEqual(list(OutboxEmail.objects.values_list('booking_id', 'status')), [(booking.id, 'PENDING')])
+        self.assertEqual(mail.outbox, [])
+
+        out = StringIO()
+        call_command('send_emails', stdout=out)
+        self.assertIn('Đã gửi 1 email, lỗi 0 email', out.getvalue())
+        self.assertIn('email/s', out.getvalue())
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['khach@example.com'])
+        self.assertIn(booking.booking_code, message.subject)
+        self.assertIn('Ghế:\nA1\nA2', message.body)
+        self.assertIn('Nhà Bà Nữ', message.alternatives[0].content)
+        self.assertEqual(OutboxEmail.objects.get().status, 'SENT')
+        self.assertEqual(outbox.deliver(), (0, 0))
+
+    def test_batch_queries_do_not_grow(self):
+        self.paid_booking()
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(outbox.deliver(), (1, 0))
+        for seats in (1, 3, 2, 4):
+            self.paid_booking(seats=seats)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(outbox.deliver(), (4, 0))
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        first, second = self.paid_booking(), self.paid_booking()
+        no_email = self.paid_booking(email='')
+        real_send = mail.backends.locmem.EmailBackend.send_messages
+        calls = []
+
+        def flaky(backend, messages):
+            calls.append(messages[0].to)
+            if len(calls) == 1:
+                raise OSError('SMTP đang bận')
+            return real_send(backend, messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', flaky):
+            self.assertEqual(outbox.deliver(), (1, 2))
+        self.assertEqual([message.to for message in mail.outbox], [[second.user.email]])
+
+        retry = OutboxEmail.objects.get(booking=first)
+        self.assertEqual((retry.status, retry.attempts), ('PENDING', 1))
+        self.assertIn('OSError: SMTP đang bận', retry.last_error)
+        self.assertGreater(retry.run_after, timezone.now())
+        self.assertEqual(OutboxEmail.objects.get(booking=no_email).status, 'FAILED')
+
+        OutboxEmail.objects.filter(pk=retry.pk).update(run_after=timezone.now())
+        self.assertEqual(outbox.deliver(), (1, 0))
+        self.assertEqual(mail.outbox[-1].to, [first.user.email])
+
+
+@override_settings(CHECKIN={'SCANNERS': {'cong-1': SCANNER_TOKEN}})
+class CheckInApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        soon = timezone.now() + timedelta(minutes=10)
+        Showtime.objects.filter(pk=self.showtime.pk).update(start_time=soon, end_time=soon + timedelta(hours=2))
+        self.showtime.refresh_from_db()
+        self.user = User.objects.create_user('khach')
+        self.seats = list(Seat.objects.filter(screen=self.showtime.screen).order_by('row', 'number'))
+        self.booking = pay_booking(create_booking(self.user, self.showtime.id, [seat.id for seat in self.seats[:3]]))
+
+    def scan(self, body, url='checkin_api', token=SCANNER_TOKEN):
+        return self.client.post(reverse(url), body, content_type='application/json',
+                                headers={'Authorization': f'Bearer {token}'})
+
+    def test_code_admits_once(self):
+        # Đọc đơn + vé, rồi một UPDATE có điều kiện trong savepoint
+        with self.assertNumQueries(4):
+            response = self.scan({'code': self.booking.booking_code.lower()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['seats'], ['A1', 'A2', 'A3'])
+        self.assertEqual(self.booking.tickets.filter(is_used=True, used_at__isnull=False).count(), 3)
+
+        response = self.scan({'code': self.booking.booking_code})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'already_used')
+        self.assertIn('used_at', response.json())
+
+        self.assertEqual(self.scan({'code': 'KHONGCO'}).status_code, 404)
+        self.assertEqual(self.scan({'code': self.booking.booking_code}, token='sai').status_code, 401)
+        pending = create_booking(self.user, self.showtime.id, [self.seats[5].id])
+        self.assertEqual(self.scan({'code': pending.booking_code}).json()['status'], 'not_paid')
+
+    def test_selected_seats_then_rest_of_group(self):
+        first = self.scan({'code': self.booking.booking_code, 'seats': [self.seats[0].id]})
+        self.assertEqual(first.json()['seats'], ['A1'])
+        again = self.scan({'code': self.booking.booking_code, 'seats': [self.seats[0].id, self.seats[1].id]})
+        self.assertEqual((again.status_code, again.json()['seats']), (409, ['A1']))
+        self.assertFalse(self.booking.tickets.get(seat=self.seats[1]).is_used)
+        rest = self.scan({'code': self.booking.booking_code})
+        self.assertEqual(rest.json()['seats'], ['A2', 'A3'])
+        other = self.scan({'code': self.booking.booking_code, 'seats': [self.seats[9].id]})
+        self.assertEqual(other.json()['status'], 'invalid')
+
+    def test_offline_batch(self):
+        second = pay_booking(create_booking(self.user, self.showtime.id, [self.seats[4].id]))
+        scanned_at = timezone.now() - timedelta(minutes=2)
+        response = self.scan({'scans': [
+            {'code': self.booking.booking_code, 'scanned_at': scanned_at.isoformat()},
+            {'code': 'thiếu-seats', 'seats': 'A1'},
+            {'code': self.booking.booking_code},
+            {'code': second.booking_code, 'scanned_at': (self.showtime.start_time - timedelta(hours=3)).isoformat()},
+            {'code': second.booking_code},
+        ]}, url='checkin_batch_api')
+        self.assertEqual([result['status'] for result in response.json()['results']],
+                         ['ok', 'invalid', 'already_used', 'too_early', 'ok'])
+        self.assertEqual(self.booking.tickets.first().used_at, scanned_at)
+        self.assertEqual(self.scan({'scans': 'x'}, url='checkin_batch_api').status_code, 400)
+
+    def test_concurrent_scanner_wins(self):
+        second = pay_booking(create_booking(self.user, self.showtime.id, [self.seats[4].id]))
+        load = checkin._load
+
+        def load_then_other_gate(codes):
+            bookings = load(codes)
+            # Cổng khác cho vào một vé của đơn đầu ngay sau khi đọc
+            Ticket.objects.filter(booking=self.booking, seat=self.seats[1]).update(is_used=True)
+            return bookings
+
+        with mock.patch.object(checkin, '_load', load_then_other_gate):
+            results = checkin.check_in_batch([{'code': self.booking.booking_code}, {'code': second.booking_code}])
+        self.assertEqual([result['status'] for result in results], ['already_used', 'ok'])
+        self.assertEqual(self.booking.tickets.filter(is_used=True).count(), 1)
+        self.assertTrue(second.tickets.get().is_used)
+
+
+class ShowtimeSchedulingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.existing = create_showtime()
+        self.screen = self.existing.screen
+        self.movie = self.existing.movie  # 102 phút
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def plan(self, *entries, **options):
+        return {'week_start': self.day.isoformat(), 'cleaning_minutes': 15, 'base_price': 60000,
+                'entries': list(entries), **options}
+
+    def test_week_is_created_in_bulk_with_prices(self):
+        other = Screen.objects.create(cinema=self.screen.cinema, name='P2', total_seats=2, rows=1, seats_per_row=2)
+        Seat.objects.bulk_create([Seat(screen=other, row='A', number=n, seat_type='COUPLE') for n in (1, 2)])
+        plan = self.plan({'movie': self.movie.slug, 'screen': self.screen.pk, 'times': ['09:00', '11:00', '14:00']},
+                         {'movie': self.movie.pk, 'screen': other.pk, 'times': ['20:00'], 'days': [0, 1],
+                          'prices': {'COUPLE': 150000}},
+                         prices={'VIP': 95000})
+        # Phim, phòng, khóa phòng, suất đã có, số ghế, thêm suất chiếu, thêm bảng giá (+ savepoint)
+        with self.assertNumQueries(9):
+            report = scheduling.schedule(plan)
+        self.assertEqual((report['created'], report['conflicts']), (23, []))
+
+        created = Showtime.objects.exclude(pk=self.existing.pk)
+        first = created.filter(screen=self.screen).earliest('start_time')
+        self.assertEqual(f'{timezone.localtime(first.start_time):%Y-%m-%d %H:%M}', f'{self.day} 09:00')
+        self.assertEqual(first.end_time - first.start_time, timedelta(minutes=102))
+        self.assertEqual(first.capacity, 40)
+        self.assertEqual(dict(first.ticket_prices.values_list('seat_type', 'price')), {'STANDARD': 60000, 'VIP': 95000})
+        couple = created.filter(screen=other).first()
+        self.assertEqual(list(couple.ticket_prices.values_list('seat_type', 'price')), [('COUPLE', 150000)])
+
+        # Chạy lại cùng kế hoạch: bỏ qua các suất đã tạo
+        again = scheduling.schedule(plan)
+        self.assertEqual((again['created'], again['skipped'], again['conflicts']), (0, 23, []))
+
+    def test_conflicts_are_reported_without_writes(self):
+        # 09:00-10:42 + 15 phút dọn phòng => suất 10:50 trùng; suất 10:57 thì vừa kịp
+        plan = self.plan({'movie': self.movie.pk, 'screen': self.screen.pk, 'times': ['09:00', '10:57'], 'days': [0]},
+                         {'movie': self.movie.pk, 'screen': self.screen.pk, 'times': ['10:50', '18:00'], 'days': [1]},
+                         {'movie': self.movie.pk, 'screen': self.screen.pk, 'times': ['10:50'], 'days': [1]})
+        before = Showtime.objects.count()
+        report = scheduling.schedule(plan)
+        self.assertEqual(Showtime.objects.count(), before)
+        self.assertEqual(TicketPrice.objects.count(), 0)
+        self.assertEqual([(slot.entry, other.entry) for slot, other in report['conflicts']], [(2, 1)])
+
+        fits = scheduling.schedule(self.plan(plan['entries'][0]))
+        self.assertEqual((fits['created'], fits['conflicts']), (2, []))
+
+    def test_conflict_with_existing_showtime_and_admin_form(self):
+        start = timezone.localtime(self.existing.start_time) + timedelta(minutes=30)
+        entry = {'movie': self.movie.pk, 'screen': self.screen.pk, 'starts': [start.isoformat()]}
+        (slot, other), = scheduling.schedule(self.plan(entry))['conflicts']
+        self.assertEqual((slot.entry, other.showtime_id), (0, self.existing.pk))
+        self.assertEqual(Showtime.objects.count(), 1)
+
+        with self.assertRaisesMessage(scheduling.PlanError, 'đã qua'):
+            scheduling.schedule(self.plan(dict(entry, starts=['2020-01-01T10:00'])))
+
+        from .admin import ShowtimeForm
+        form = ShowtimeForm({'movie': self.movie.pk, 'screen': self.screen.pk, 'base_price': 60000,
+                             'start_time': start.strftime('%Y-%m-%d %H:%M'), 'is_active': True})
+        self.assertFalse(form.is_valid())
+        self.assertIn('Trùng lịch', str(form.errors))
+        later = start + timedelta(hours=3)
+        form = ShowtimeForm({'movie': self.movie.pk, 'screen': self.screen.pk, 'base_price': 60000,
+                             'start_time': later.strftime('%Y-%m-%d %H:%M'), 'is_active': True})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['end_time'] - form.cleaned_data['start_time'], timedelta(minutes=102))
+
+
+class PriceTableTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.showtime = create_showtime()
+        self.user = User.objects.create_user('khach')
+        self.seats = {seat.seat_type: seat for seat in Seat.objects.filter(screen=self.showtime.screen)}
+
+    def test_checkout_and_seat_map_share_cached_table(self):
+        TicketPrice.objects.create(showtime=self.showtime, seat_type='VIP', price=99000)
+        showtime = Showtime.objects.select_related('screen').get(pk=self.showtime.pk)
+        with self.assertNumQueries(1):
+            table = pricing.price_table(showtime)
+        self.assertEqual(table, {'STANDARD': 60000, 'VIP': 99000, 'COUPLE': 80000})
+        with self.assertNumQueries(0):
+            self.assertEqual(pricing.price_table(showtime), table)
+
+        response = self.client.get(reverse('showtime_detail', args=[self.showtime.pk]))
+        self.assertEqual(response.context['seat_prices'], {'STANDARD': 60000, 'VIP': 99000, 'COUPLE': 80000})
+        booking = create_booking(self.user, self.showtime.pk, [self.seats['STANDARD'].pk, self.seats['VIP'].pk])
+        self.assertEqual(booking.total_amount, 60000 + 99000)
+
+    def fresh(self):
+        return Showtime.objects.select_related('screen').get(pk=self.showtime.pk)
+
+    def test_price_changes_bump_version_in_same_transaction(self):
+        self.assertEqual(pricing.price_table(self.fresh())['VIP'], 70000)
+        # Không cần on_commit: version mới nằm trong DB ngay khi transaction đổi giá commit
+        price = TicketPrice.objects.create(showtime=self.showtime, seat_type='VIP', price=90000)
+        self.assertEqual(self.fresh().price_version, 1)
+        self.assertEqual(pricing.price_table(self.fresh())['VIP'], 90000)
+
+        # Admin sửa suất từ bản nạp trước lúc đổi giá: version không bị ghi đè về số cũ
+        stale = Showtime.objects.get(pk=self.showtime.pk)
+        price.delete()
+        stale.base_price = 65000
+        stale.save()
+        self.assertEqual(self.fresh().price_version, 3)
+        self.assertEqual(pricing.price_table(self.fresh()), {'STANDARD': 65000, 'VIP': 75000, 'COUPLE': 85000})
+
+        screen = Screen.objects.get(pk=self.showtime.screen_id)
+        screen.screen_type = 'IMAX'
+        screen.save()
+        self.assertEqual(self.fresh().price_version, 4)
+
+    def test_table_for_old_version_is_never_read_again(self):
+        old = self.fresh()
+        TicketPrice.objects.create(showtime=self.showtime, seat_type='VIP', price=90000)
+        # Request chạy chồng (đã đọc suất chiếu trước khi đổi giá) ghi bảng vào cache sau khi đổi giá
+        cache.set(pricing.PRICE_TABLE_KEY % (old.pk, old.price_version), {'STANDARD': 1, 'VIP': 1, 'COUPLE': 1})
+        showtime = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertEqual(pricing.price_table(showtime)['VIP'], 90000)
+        with self.assertNumQueries(0):
+            pricing.price_table(showtime)
+
+    @override_settings(PRICING={'SCREEN_SURCHARGES': {'IMAX': 30000}, 'WEEKEND_SURCHARGE': 5000})
+    def test_screen_type_and_weekend_surcharges(self):
+        Screen.objects.filter(pk=self.showtime.screen_id).update(screen_type='IMAX')
+        saturday = timezone.localtime(self.showtime.start_time)
+        saturday += timedelta(days=(5 - saturday.weekday()) % 7)
+        Showtime.objects.filter(pk=self.showtime.pk).update(start_time=saturday, end_time=saturday + timedelta(hours=2))
+        showtime = Showtime.objects.select_related('screen').get(pk=self.showtime.pk)
+        self.assertEqual(pricing.price_table(showtime)['STANDARD'], 60000 + 30000 + 5000)
+        self.assertEqual(pricing.rule_price(60000, 'COUPLE', '2D', saturday + timedelta(days=2)), 80000)
+
+
+class StartupImportTest(TestCase):
+    # Chỉ kiểm tra điều chắc chắn: không nạp thư viện nặng. Thời gian và RSS phụ thuộc máy,
+    # đo bằng lệnh check_startup
+    def test_wsgi_and_asgi_do_not_import_heavy_modules(self):
+        for module in ('cinema_project.wsgi', 'cinema_project.asgi'):
+            with self.subTest(module=module):
+                self.assertEqual(check_startup.probe(module, runs=1)['heavy'], [])
+
+
+class LiveSeatMapTest(TestCase):
+    # Sơ đồ ghế trực tiếp với broker trong bộ nhớ: một SeatFeed cho mỗi suất chiếu,
+    # mọi người xem nhận cùng các thay đổi mà không phải truy vấn DB.
+    def setUp(self):
+        cache.clear()
+        live._broker = None
+        self.addCleanup(setattr, live, '_broker', None)
+        self.showtime = create_showtime()
+        self.user = User.objects.create_user('khach', password='matkhau123')
+        self.seat_ids = list(Seat.objects.filter(screen=self.showtime.screen).values_list('id', flat=True))
+
+    def committed(self, func, *args):
+        # Chạy các callback on_commit (phát sự kiện) như khi transaction commit thật
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args)
+
+    @staticmethod
+    def read(stream):
+        return asyncio.wait_for(anext(stream), 1)
+
+    @staticmethod
+    def parse(chunk):
+        event, data = chunk.strip().split('\n')
+        return event.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def test_watchers_share_one_feed_and_receive_deltas(self):
+        self.committed(create_booking, self.user, self.showtime.id, self.seat_ids[:2])
+
+        async def scenario():
+            watchers = [live.event_stream(self.showtime.id) for _ in range(3)]
+            snapshots = [self.parse(await self.read(stream)) for stream in watchers]
+            self.assertEqual(len(live.get_broker()._subscribers[self.showtime.id]), 1)
+
+            # Người xem đến sau không truy vấn DB, dùng trạng thái của feed
+            with mock.patch.object(live, 'seat_states_from_db', side_effect=AssertionError):
+                late = live.event_stream(self.showtime.id)
+                snapshots.append(self.parse(await self.read(late)))
+            watchers.append(late)
+            for event, data in snapshots:
+                self.assertEqual(event, 'snapshot')
+                self.assertEqual(sorted(data['held']), self.seat_ids[:2])
+
+            booking = await sync_to_async(self.committed)(create_booking, self.user, self.showtime.id,
+                                                          self.seat_ids[5:7])
+            await sync_to_async(self.committed)(pay_booking, booking)
+            await sync_to_async(self.committed)(services.cancel_booking, booking)
+            for stream in watchers:
+                deltas = [self.parse(await self.read(stream)) for _ in range(3)]
+                self.assertEqual([(event, data['state'], sorted(data['seats'])) for event, data in deltas], [
+                    ('delta', 'held', self.seat_ids[5:7]),
+                    ('delta', 'sold', self.seat_ids[5:7]),
+                    ('delta', 'released', self.seat_ids[5:7]),
+                ])
+                await stream.aclose()
+            self.assertNotIn(self.showtime.id, live._feeds)
+            self.assertNotIn(self.showtime.id, live.get_broker()._subscribers)
+
+        async_to_sync(scenario)()
+
+    def test_resync_catches_changes_from_other_processes(self):
+        async def scenario():
+            stream = live.event_stream(self.showtime.id)
+            await self.read(stream)
+            # Đặt vé ở tiến trình khác: DB đổi nhưng broker trong tiến trình này không nhận được gì
+            with mock.patch.object(live, 'publish'):
+                await sync_to_async(self.committed)(create_booking, self.user, self.showtime.id,
+                                                    self.seat_ids[:3])
+            await live._feeds[self.showtime.id].resync()
+            event, data = self.parse(await self.read(stream))
+            self.assertEqual((event, data['state'], sorted(data['seats'])), ('delta', 'held', self.seat_ids[:3]))
+            await stream.aclose()
+
+        async_to_sync(scenario)()
+
+    def test_lapsed_holds_are_released_without_a_sweep(self):
+        first = self.committed(create_booking, self.user, self.showtime.id, self.seat_ids[:2])
+
+        async def scenario():
+            stream = live.event_stream(self.showtime.id)
+            await self.read(stream)
+            second = await sync_to_async(self.committed)(create_booking, self.user, self.showtime.id,
+                                                         self.seat_ids[5:7])
+            event, data = self.parse(await self.read(stream))
+            self.assertEqual(data['expires_at'], second.expires_at.timestamp())
+            feed = live._feeds[self.showtime.id]
+            self.assertEqual(set(feed.expiries), set(self.seat_ids[:2] + self.seat_ids[5:7]))
+            self.assertIsNotNone(feed._expiry_timer)
+
+            # Chưa chạy expire_holds: version trong DB không đổi, feed tự trả ghế khi hết hạn
+            later = max(first.expires_at, second.expires_at) + timedelta(seconds=1)
+            with mock.patch('django.utils.timezone.now', return_value=later):
+                feed.expire_lapsed_holds()
+            event, data = self.parse(await self.read(stream))
+            self.assertEqual((event, data['state'], sorted(data['seats'])),
+                             ('delta', 'released', sorted(self.seat_ids[:2] + self.seat_ids[5:7])))
+            self.assertEqual(feed.snapshot()['held'], [])
+            self.assertIsNone(feed._expiry_timer)
+            await stream.aclose()
+
+        async_to_sync(scenario)()
+
+    def test_slow_watcher_gets_a_fresh_snapshot(self):
+        async def scenario():
+            stream = live.event_stream(self.showtime.id)
+            await self.read(stream)
+            feed = live._feeds[self.showtime.id]
+            for version in range(1, live.WATCHER_QUEUE_SIZE + 2):
+                feed._apply({'version': version, 'state': live.HELD, 'seats': [self.seat_ids[0]]})
+            event, data = self.parse(await self.read(stream))
+            self.assertEqual((event, data['held']), ('snapshot', [self.seat_ids[0]]))
+            await stream.aclose()
+
+        async_to_sync(scenario)()
+
+    def test_stream_view(self):
+        url = reverse('seat_stream', args=[self.showtime.id])
+        # WSGI không giữ kết nối lâu: 204 để EventSource dừng kết nối lại
+        self.assertEqual(self.client.get(url).status_code, 204)
+
+        async def scenario():
+            response = await AsyncClient().get(url)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = aiter(response.streaming_content)
+            chunk = await asyncio.wait_for(anext(stream), 1)
+            self.assertTrue(chunk.startswith(b'event: snapshot'))
+            await stream.aclose()
+            missing = await AsyncClient().get(reverse('seat_stream', args=[self.showtime.id + 1]))
+            self.assertEqual(missing.status_code, 404)
+
+        async_to_sync(scenario)()
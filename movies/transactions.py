@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+# Transaction đọc rồi mới ghi (đặt vé, thanh toán, quét đơn hết hạn, lấy lô email...).
+#
+# SQLite chỉ cho một transaction ghi tại một thời điểm (khóa cả file). Transaction mặc định
+# (DEFERRED) chỉ xin khóa ghi ở câu ghi đầu tiên; nếu khi đó đang giữ khóa đọc mà transaction
+# khác đang ghi thì SQLite báo "database is locked" ngay, không chờ theo `timeout`. Các khối dưới
+# đây mở bằng BEGIN IMMEDIATE: xin khóa ghi ngay từ đầu và xếp hàng chờ. Transaction khác (trang
+# Admin, view chỉ đọc, khối bắt đầu bằng câu ghi) vẫn DEFERRED nên không phải chờ các lượt đặt vé.
+# Cái giá: trên SQLite các lượt đặt vé luôn chạy lần lượt, kể cả khi khác ghế; đặt vé song song
+# theo từng ghế chỉ có trên PostgreSQL/MySQL, nơi write_atomic giống hệt transaction.atomic.
+
+
+@contextmanager
+def write_atomic(using=None):
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Khối lồng trong transaction đã mở: chỉ là savepoint
+        with transaction.atomic(using=using):
+            yield
+        return
+    # Mở kết nối trước: lúc kết nối Django đặt lại transaction_mode theo settings
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # BEGIN đã chạy khi vào khối, trả lại chế độ cũ cho các transaction sau
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
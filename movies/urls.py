@@ -5,6 +5,7 @@ urlpatterns = [
     path('', views.movie_list, name='movie_list'),
     path('movie/<int:movie_id>/', views.movie_detail, name='movie_detail'),
     path('showtime/<int:showtime_id>/', views.showtime_detail, name='showtime_detail'),
+    path('showtime/<int:showtime_id>/seats/live/', views.seat_stream, name='seat_stream'),
     path('showtime/<int:showtime_id>/book/', views.book_tickets, name='book_tickets'),
     path('booking/success/<int:booking_id>/', views.booking_success, name='booking_success'),
     path('booking/pay/<int:booking_id>/', views.pay_booking, name='pay_booking'),
@@ -13,9 +14,19 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.profile_view, name='profile'),
     path('my-tickets/', views.my_tickets, name='my_tickets'),
+    path('api/showtimes/<int:showtime_id>/seats/', views.showtime_seats_api, name='showtime_seats_api'),
+    path('api/my-tickets/', views.my_tickets_api, name='my_tickets_api'),
 
     # Đường dẫn cho tìm kiếm gợi ý
     path('api/search-suggestions/', views.search_suggestions, name='search_suggestions'),
 
     path('admin-stats/', views.admin_statistics, name='admin_stats'),
+
+    # Máy quét soát vé ở cửa phòng chiếu
+    path('api/checkin/', views.checkin_api, name='checkin_api'),
+    path('api/checkin/batch/', views.checkin_batch_api, name='checkin_batch_api'),
+
+    # Bản đo hiệu năng cho staff (?_profile=1)
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/<str:fmt>/', views.profile_download, name='profile_download'),
 ]
\ No newline at end of file
@@ -1,26 +1,29 @@
-from sklearn.linear_model import LinearRegression
-
-import numpy as np
-import pandas as pd
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models.functions import ExtractQuarter, TruncMonth, TruncDay, ExtractHour
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Count, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Q, Count, Sum, Prefetch
 from django.core.exceptions import ValidationError
+from django.db import transaction
 import json
+import os
 
 
-from .models import Movie, Showtime, Booking, Ticket, Seat, TicketPrice, Concession
+from .models import Movie, Showtime, Booking, BookingConcession, Ticket, Seat, Concession
 from .form import SignUpForm, ReviewForm, UserUpdateForm
 # Đảm bảo bạn đã có file services.py và hàm create_booking
 from .services import create_booking
+from . import catalog, checkin, history, live, occupancy, pricing, profiler, seatmap, services, suggest
+from .querybudget import query_budget
 
 
 def movie_list(request):
@@ -35,64 +38,129 @@ def movie_list(request):
     return render(request, 'movies/movie_list.html', {'movies': movies})
 
 
-def search_suggestions(request):
+# --- Các trang chỉ đọc chạy async trên ASGI (không giữ luồng trong lúc chờ DB/cache) ---
+
+async def _aload_user(request):
+    # Template đọc request.user đồng bộ, trong view async phải nạp trước (kèm session)
+    request.user = await request.auser()
+
+
+@query_budget(2)
+async def search_suggestions(request):
     query = request.GET.get('term', '')
-    if query:
-        movies = Movie.objects.filter(title__icontains=query, is_active=True)[:5]
-        results = [{'id': m.id, 'title': m.title, 'poster': m.poster.url if m.poster else ''} for m in movies]
-    else:
-        results = []
+    # Tra trong chỉ mục tiền tố trong bộ nhớ, không truy vấn DB mỗi lần gõ phím
+    results = await suggest.asuggest(query) if query else []
     return JsonResponse(results, safe=False)
 
 
-def movie_detail(request, movie_id):
-    movie = get_object_or_404(Movie, pk=movie_id)
-    showtimes = movie.showtimes.filter(is_active=True).order_by('start_time')
-    reviews = movie.reviews.all()
-    form = ReviewForm(request.POST or None)
+REVIEWS_PER_PAGE = 10
 
-    if request.method == 'POST' and form.is_valid() and request.user.is_authenticated:
+
+def _save_review(request, movie, form):
+    # Phần ghi của movie_detail (đồng bộ, chạy qua sync_to_async)
+    if form.is_valid() and request.user.is_authenticated:
         rv = form.save(commit=False)
         rv.movie = movie
         rv.user = request.user
-        rv.save()
+        # Lưu đánh giá và cập nhật thống kê trên Movie trong cùng transaction
+        with transaction.atomic():
+            rv.save()
         messages.success(request, "Đã đăng đánh giá!")
-        return redirect('movie_detail', movie_id=movie_id)
+        return redirect('movie_detail', movie_id=movie.id)
+    return None
+
+
+@query_budget(7)
+async def movie_detail(request, movie_id):
+    await _aload_user(request)
+    movie = await aget_object_or_404(Movie, pk=movie_id)
+
+    form = ReviewForm(request.POST or None)
+    if request.method == 'POST':
+        response = await sync_to_async(_save_review)(request, movie, form)
+        if response is not None:
+            return response
+
+    # Chỉ các suất chưa chiếu
+    showtimes = [showtime async for showtime in movie.showtimes.filter(
+        is_active=True, start_time__gte=timezone.now()).select_related('screen').order_by('start_time')]
+
+    # Đánh giá mới nhất trước, mỗi trang REVIEWS_PER_PAGE dòng (?reviews_before=<id> để xem tiếp)
+    reviews = movie.reviews.select_related('user').order_by('-id')
+    before = request.GET.get('reviews_before')
+    if before and before.isdigit():
+        reviews = reviews.filter(id__lt=before)
+    reviews = [review async for review in reviews[:REVIEWS_PER_PAGE + 1]]
+    next_reviews_before = reviews[REVIEWS_PER_PAGE - 1].id if len(reviews) > REVIEWS_PER_PAGE else None
+    reviews = reviews[:REVIEWS_PER_PAGE]
 
     return render(request, 'movies/movie_detail.html', {
         'movie': movie,
         'showtimes': showtimes,
         'reviews': reviews,
+        'next_reviews_before': next_reviews_before,
         'form': form
     })
 
 
-def showtime_detail(request, showtime_id):
-    showtime = get_object_or_404(Showtime, pk=showtime_id)
-    all_seats = Seat.objects.filter(screen=showtime.screen).order_by('row', 'number')
-
-    occupied_seats = Ticket.objects.filter(
-        booking__showtime=showtime,
-        booking__status__in=['PAID', 'PENDING']
-    ).values_list('seat_id', flat=True)
+@query_budget(10)
+async def showtime_detail(request, showtime_id):
+    await _aload_user(request)
+    showtime = await aget_object_or_404(Showtime.objects.select_related('movie', 'screen'), pk=showtime_id)
+    all_seats = [seat async for seat in Seat.objects.filter(screen=showtime.screen).order_by('row', 'number')]
 
+    # Đọc từ bitmap cache, chỉ dựng lại từ DB khi version đã cũ
+    occupied_seats = (await sync_to_async(occupancy.get_occupancy)(showtime)).occupied_seat_ids()
 
-    ticket_prices = TicketPrice.objects.filter(showtime=showtime)
-    price_map = {tp.seat_type: tp.price for tp in ticket_prices}
+    # Bảng giá dùng chung với lúc đặt vé (pricing.py), có trong cache thì không truy vấn DB
+    seat_prices = {seat_type: int(price) for seat_type, price in (await pricing.aprice_table(showtime)).items()}
 
-    concessions = Concession.objects.all()
+    concessions = [item async for item in Concession.objects.all()]
 
     return render(request, 'movies/showtime_detail.html', {
         'showtime': showtime,
         'all_seats': all_seats,
-        'occupied_seats': list(occupied_seats),
-        'price_map': price_map,
+        'occupied_seats': occupied_seats,
+        'seat_prices': seat_prices,
         'concessions': concessions,
     })
 
 
+@query_budget(4)
+async def showtime_seats_api(request, showtime_id):
+    # Khách hỏi lại với If-None-Match: nếu sơ đồ chưa đổi thì trả 304 chỉ từ cache, không truy vấn DB
+    etag = await seatmap.acached_etag(showtime_id)
+    if etag and (not_modified := get_conditional_response(request, etag=etag)) is not None:
+        return not_modified
+    try:
+        payload, etag = await sync_to_async(seatmap.seat_map)(showtime_id)
+    except Showtime.DoesNotExist:
+        return JsonResponse({'error': 'Không tìm thấy suất chiếu'}, status=404)
+    response = get_conditional_response(request, etag=etag) or JsonResponse(payload)
+    response['ETag'] = etag
+    # Trình duyệt/proxy được giữ bản sao nhưng luôn phải hỏi lại (rẻ nhờ 304)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@query_budget(3)
+async def seat_stream(request, showtime_id):
+    # Sơ đồ ghế trực tiếp (Server-Sent Events): snapshot rồi các thay đổi held/sold/released.
+    # Kết nối giữ mở lâu nên chỉ phục vụ trên ASGI; dưới WSGI trả 204 để EventSource thôi kết nối lại
+    # (trang vẫn dùng được, chỉ không tự cập nhật).
+    if not await Showtime.objects.filter(pk=showtime_id).aexists():
+        raise Http404("Không tìm thấy suất chiếu")
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(live.event_stream(showtime_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Không để nginx gom sự kiện vào bộ đệm
+    return response
+
+
 @login_required(login_url='login')
 @require_POST
+@query_budget(18)
 def book_tickets(request, showtime_id):
     seat_ids = request.POST.getlist('selected_seats')
     if not seat_ids:
@@ -134,25 +202,31 @@ def book_tickets(request, showtime_id):
         return redirect('showtime_detail', showtime_id=showtime_id)
 
 
+@query_budget(5)
 def booking_success(request, booking_id):
-    booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
+    bookings = Booking.objects.select_related('showtime__movie', 'showtime__screen__cinema').prefetch_related(
+        Prefetch('tickets', queryset=Ticket.objects.select_related('seat')),
+        Prefetch('concessions', queryset=BookingConcession.objects.select_related('concession')),
+    )
+    booking = get_object_or_404(bookings, pk=booking_id, user=request.user)
     return render(request, 'movies/booking_success.html', {'booking': booking})
 
 
 @login_required
+@query_budget(24)
 def pay_booking(request, booking_id):
     booking = get_object_or_404(Booking, pk=booking_id, user=request.user)
     if booking.status == 'PENDING':
-        booking.status = 'PAID'
-        # Nếu model có trường paid_at thì bỏ comment dòng dưới
-        # from django.utils import timezone
-        # booking.paid_at = timezone.now()
-        booking.save()
-        messages.success(request, "Thanh toán thành công! Chúc bạn xem phim vui vẻ.")
+        try:
+            services.pay_booking(booking)
+            messages.success(request, "Thanh toán thành công! Chúc bạn xem phim vui vẻ.")
+        except ValidationError as e:
+            messages.error(request, ", ".join(e.messages))
     return redirect('booking_success', booking_id=booking.id)
 
 
 # --- Auth Views ---
+@query_budget(4)
 def register_view(request):
     form = SignUpForm(request.POST or None)
     if request.method == 'POST' and form.is_valid():
@@ -163,6 +237,7 @@ def register_view(request):
     return render(request, 'movies/register.html', {'form': form})
 
 
+@query_budget(6)
 def login_view(request):
     form = AuthenticationForm(data=request.POST or None)
     if request.method == 'POST' and form.is_valid():
@@ -172,12 +247,14 @@ def login_view(request):
     return render(request, 'movies/login.html', {'form': form})
 
 
+@query_budget(4)
 def logout_view(request):
     logout(request)
     return redirect('movie_list')
 
 
 @login_required
+@query_budget(4)
 def profile_view(request):
     form = UserUpdateForm(request.POST or None, instance=request.user)
     if request.method == 'POST' and form.is_valid():
@@ -187,165 +264,108 @@ def profile_view(request):
 
 
 @login_required
+@query_budget(5)
 def my_tickets(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'movies/my_tickets.html', {'bookings': bookings})
+    # Suất sắp chiếu trước, sau đó suất đã chiếu; phân trang theo con trỏ (?cursor=)
+    try:
+        bookings, next_cursor = history.ticket_page(request.user, request.GET.get('cursor'))
+    except history.InvalidCursor:
+        return redirect('my_tickets')
+    return render(request, 'movies/my_tickets.html', {'bookings': bookings, 'next_cursor': next_cursor})
+
+
+@login_required
+@query_budget(5)
+def my_tickets_api(request):
+    # Bản JSON cho cuộn vô hạn trên app
+    try:
+        limit = int(request.GET.get('limit', history.PAGE_SIZE))
+        bookings, next_cursor = history.ticket_page(request.user, request.GET.get('cursor'), limit)
+    except (ValueError, history.InvalidCursor):
+        return JsonResponse({'error': 'Tham số không hợp lệ'}, status=400)
+    return JsonResponse({
+        'results': [history.serialize(booking) for booking in bookings],
+        'next_cursor': next_cursor,
+    })
 
 
 @staff_member_required(login_url='login')
+@query_budget(10)
 def admin_statistics(request):
-    # 1. Lọc dữ liệu (Filter)
-    current_date = timezone.now()
+    # Phần thống kê (numpy, dự báo...) chỉ được nạp khi trang này được mở lần đầu,
+    # worker phục vụ khách không phải trả chi phí import đó
+    from . import analytics
+    return render(request, 'movies/admin_stats.html', analytics.dashboard_context(request.GET))
+
+@query_budget(5)
+async def movie_list(request):
+    query = request.GET.get('q')
+    await _aload_user(request)
+    # Phần danh sách phim lấy từ cache (chung cho mọi người dùng), header vẫn render theo request
+    return render(request, 'movies/movie_list.html', {
+        'catalog_html': await catalog.arender_catalog(query),
+        'query': query
+    })
+
+
+# --- Soát vé cho máy quét ở cửa phòng chiếu (movies/checkin.py) ---
+
+CHECKIN_HTTP_STATUS = {checkin.OK: 200, checkin.ALREADY_USED: 409, checkin.NOT_FOUND: 404}
+
+
+def _scanner_body(request):
+    # -> (body JSON, None) hoặc (None, response lỗi). Máy quét dùng token nên không cần CSRF
+    if checkin.scanner_for(request) is None:
+        return None, JsonResponse({'error': 'Máy quét chưa được cấp quyền'}, status=401)
     try:
-        year = int(request.GET.get('year', current_date.year))
+        return json.loads(request.body), None
     except ValueError:
-        year = current_date.year
-
-    month = request.GET.get('month')
-    quarter = request.GET.get('quarter')
-    day = request.GET.get('day')
-
-    # Queryset gốc: Đơn hàng ĐÃ THANH TOÁN
-    # Lưu ý: Lọc theo năm được chọn để hiển thị số liệu thống kê
-    bookings = Booking.objects.filter(status='PAID', created_at__year=year)
-
-    chart_title = f"Biểu đồ doanh thu năm {year}"
-    group_by_field = TruncMonth('created_at')  # Mặc định gom nhóm theo Tháng
-    time_format = "%m/%Y"
-
-    if quarter:
-        bookings = bookings.annotate(quarter=ExtractQuarter('created_at')).filter(quarter=quarter)
-        chart_title = f"Biểu đồ doanh thu Quý {quarter}/{year}"
-        # Quý thì vẫn xem theo tháng
-
-    if month:
-        bookings = bookings.filter(created_at__month=month)
-        chart_title = f"Biểu đồ doanh thu Tháng {month}/{year}"
-        group_by_field = TruncDay('created_at')  # Nếu chọn tháng -> Xem theo Ngày
-        time_format = "%d/%m"
-
-        if day:
-            bookings = bookings.filter(created_at__day=day)
-            chart_title = f"Biểu đồ doanh thu Ngày {day}/{month}/{year}"
-            group_by_field = ExtractHour('created_at')  # Nếu chọn ngày -> Xem theo Giờ
-            time_format = "%H:00"
-
-    # 2. Xử lý dữ liệu cho Biểu đồ Đường (Line Chart)
-    # Gom nhóm theo thời gian (Tháng/Ngày/Giờ) dựa trên bộ lọc
-    revenue_over_time = bookings.annotate(
-        period=group_by_field
-    ).values('period').annotate(
-        total=Sum('total_amount')
-    ).order_by('period')
-
-    chart_labels = []
-    chart_data = []
-
-    for item in revenue_over_time:
-        if isinstance(item['period'], int):  # Trường hợp group theo Giờ (trả về số int)
-            label = f"{item['period']}:00"
-        else:  # Trường hợp Ngày/Tháng (trả về datetime)
-            label = item['period'].strftime(time_format)
-
-        chart_labels.append(label)
-        chart_data.append(float(item['total']))
-
-    # 3. Thống kê tổng quan (Top Cards)
-    total_revenue = bookings.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_tickets = bookings.aggregate(Count('tickets'))['tickets__count'] or 0
-
-    # 4. Thống kê Top Phim (Để hiển thị bảng chi tiết bên dưới)
-    movie_stats = bookings.values('showtime__movie__title').annotate(
-        revenue=Sum('total_amount'),
-        ticket_count=Count('tickets')
-    ).order_by('-revenue')
-
-    # 5. DỰ ĐOÁN DOANH THU THÁNG TỚI & TĂNG TRƯỞNG (AI)
-    # Lưu ý: Dùng TOÀN BỘ dữ liệu lịch sử để train model cho chính xác (không lọc theo year)
-    all_history = Booking.objects.filter(status='PAID').annotate(
-        month=TruncMonth('created_at')
-    ).values('month').annotate(
-        revenue=Sum('total_amount')
-    ).order_by('month')
-
-    df = pd.DataFrame(list(all_history))
-
-    predicted_revenue = 0
-    growth_percent = 0
-    current_month_revenue = 0
-
-    if not df.empty:
-        # Doanh thu tháng hiện tại (Tháng gần nhất trong DB)
-        current_month_revenue = df['revenue'].iloc[-1]
-
-        # Train AI
-        df['month_num'] = np.arange(len(df))
-        X = df[['month_num']]
-        y = df['revenue']
-
-        model = LinearRegression()
-        model.fit(X, y)
-
-        # Dự đoán tháng tiếp theo
-        next_month_index = df['month_num'].iloc[-1] + 1
-        prediction = model.predict([[next_month_index]])
-        predicted_revenue = max(0, round(prediction[0]))  # Không lấy số âm
-
-        # Tính % Tăng trưởng: (Dự đoán - Hiện tại) / Hiện tại * 100
-        if current_month_revenue > 0:
-            growth_percent = ((predicted_revenue - current_month_revenue) / current_month_revenue) * 100
-        else:
-            growth_percent = 100 if predicted_revenue > 0 else 0
-
-    # Danh sách năm cho dropdown
-    available_years = Booking.objects.dates('created_at', 'year', order='DESC')
-    years_list = [y.year for y in available_years] if available_years else [current_date.year]
-
-    return render(request, 'movies/admin_stats.html', {
-        'chart_labels': chart_labels,  # Nhãn thời gian (Trục X)
-        'chart_data': chart_data,  # Doanh thu (Trục Y)
-        'chart_title': chart_title,
-
-        'predicted_revenue': predicted_revenue,
-        'growth_percent': round(growth_percent, 1),
-        'current_month_revenue': current_month_revenue,
-
-        'movie_stats': movie_stats,
-        'total_revenue': total_revenue,
-        'total_tickets': total_tickets,
-        'years_list': years_list,
-        'selected_year': year,
-        'selected_month': int(month) if month else '',
-        'selected_quarter': int(quarter) if quarter else '',
-        'selected_day': int(day) if day else '',
-    })
+        return None, JsonResponse({'error': 'Body phải là JSON'}, status=400)
 
-def movie_list(request):
-    query = request.GET.get('q')
-    today = timezone.now().date()  # Lấy ngày hôm nay
 
-    # Lọc cơ bản: Phải là phim đang Active (hiển thị trên web)
-    base_movies = Movie.objects.filter(is_active=True)
+@csrf_exempt
+@require_POST
+@query_budget(4)
+def checkin_api(request):
+    # {"code": "...", "seats": [id ghế]?} -> kết quả, mã HTTP theo trạng thái
+    body, error = _scanner_body(request)
+    if error:
+        return error
+    try:
+        scan = checkin.parse_scan(body, timezone.now())
+    except checkin.InvalidScan as exc:
+        return JsonResponse({'status': checkin.INVALID, 'error': str(exc)}, status=400)
+    result, = checkin.check_in([scan])
+    return JsonResponse(result, status=CHECKIN_HTTP_STATUS.get(result['status'], 422))
 
-    if query:
-        # Nếu đang tìm kiếm thì tìm chung cả 2 loại
-        movies_now = base_movies.filter(
-            Q(title__icontains=query) | Q(director__icontains=query),
-            release_date__lte=today
-        )
-        movies_upcoming = base_movies.filter(
-            Q(title__icontains=query) | Q(director__icontains=query),
-            release_date__gt=today
-        )
-    else:
-        # Phim đang chiếu: Ngày chiếu <= Hôm nay
-        movies_now = base_movies.filter(release_date__lte=today).order_by('-release_date')
 
-        # Phim sắp chiếu: Ngày chiếu > Hôm nay
-        movies_upcoming = base_movies.filter(release_date__gt=today).order_by('release_date')
+@csrf_exempt
+@require_POST
+@query_budget(4)
+def checkin_batch_api(request):
+    # Máy quét gửi bù các lượt quét lúc mất mạng: {"scans": [{"code", "seats"?, "scanned_at"?}]}
+    body, error = _scanner_body(request)
+    if error:
+        return error
+    try:
+        results = checkin.check_in_batch(body.get('scans') if isinstance(body, dict) else None)
+    except checkin.InvalidScan as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'results': results})
 
-    return render(request, 'movies/movie_list.html', {
-        'movies_now': movies_now,
-        'movies_upcoming': movies_upcoming,
-        'query': query
-    })
\ No newline at end of file
+
+# --- Bản đo hiệu năng request (movies/profiler.py) ---
+
+@query_budget(2)
+@staff_member_required(login_url='login')
+def profile_list(request):
+    return JsonResponse({'results': profiler.list_profiles()})
+
+
+@query_budget(2)
+@staff_member_required(login_url='login')
+def profile_download(request, profile_id, fmt):
+    path = profiler.profile_file(profile_id, fmt)
+    if path is None:
+        raise Http404("Không tìm thấy bản đo")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))